@@ -0,0 +1,117 @@
+"""Compare flatten_csp with the recursive cspsubdiv flattening SVG_READER
+used for paths before: every chord within the flatness of its curve,
+the number of points, and the time on a long path of glyph-like curves.
+
+Run from the repository root:  python -m benchmarks.bezier [n_curves]
+"""
+import copy
+import sys
+from time import time
+
+import numpy as np
+
+import k40_web.laser_controller.cspsubdiv as cspsubdiv
+import k40_web.laser_controller.cubicsuperpath as cubicsuperpath
+import k40_web.laser_controller.simpletransform as simpletransform
+from k40_web.laser_controller.svg_geometry import (curve_steps, flatten_csp, segment_distance,
+                                                   transform_points)
+
+MAT = [[0.35, 0.1, 5.0], [-0.1, -0.35, 120.0]]
+
+
+def legacy_flatten(p, flatness, mat):
+    # what process_shape did with the cubicsuperpath of a path
+    simpletransform.applyTransformToPath(mat, p)
+    f = flatness
+    is_flat = 0
+    while is_flat < 1:
+        try:
+            cspsubdiv.cspsubdiv(p, f)
+            is_flat = 1
+        except IndexError:
+            break
+        except:
+            f += 0.1
+            if f > 2:
+                break
+    return [np.array([node[1] for node in sub]) for sub in p]
+
+
+def glyph_path(n_curves, seed=0):
+    # subpaths of smooth cubic curves and a few straight lines, as converted text has
+    rng = np.random.default_rng(seed)
+    d = []
+    for k in range(0, n_curves, 12):
+        x, y = rng.uniform(0, 300, 2)
+        d.append("M %.3f,%.3f" % (x, y))
+        for i in range(12):
+            if i % 4 == 3:
+                x, y = x + rng.uniform(-8, 8), y + rng.uniform(-8, 8)
+                d.append("L %.3f,%.3f" % (x, y))
+            else:
+                c = rng.uniform(-10, 10, 6)
+                d.append("c %.3f,%.3f %.3f,%.3f %.3f,%.3f" % tuple(c))
+                x, y = x + c[4], y + c[5]
+        d.append("z")
+    return " ".join(d)
+
+
+def chord_error(csp, flatness, mat):
+    # the furthest any curve gets from the chord flatten_csp drew for it
+    nodes = transform_points(np.array([node for sub in csp for node in sub], dtype=np.float64), mat)
+    sizes = np.array([len(sub) for sub in csp])
+    ends = np.ones(len(nodes), dtype=bool)
+    ends[np.cumsum(sizes) - sizes] = False
+    ends = np.flatnonzero(ends)
+    P = [nodes[ends-1, 1], nodes[ends-1, 2], nodes[ends, 0], nodes[ends, 1]]
+    n = curve_steps(*P, flatness)
+
+    def bezier(t):
+        s = 1.0 - t
+        return s*s*s*P[0] + 3*s*s*t*P[1] + 3*s*t*t*P[2] + t*t*t*P[3]
+
+    error = 0.0
+    for k in range(n.max()):
+        a = bezier(np.minimum(k, n)[:, None] / n[:, None])
+        b = bezier(np.minimum(k+1, n)[:, None] / n[:, None])
+        for u in np.linspace(0, 1, 17):
+            t = np.minimum(k+u, n)[:, None] / n[:, None]
+            error = max(error, segment_distance(bezier(t), a, b).max())
+    return error
+
+
+def check():
+    for seed in range(3):
+        d = glyph_path(120, seed)
+        for flatness in (0.001, 0.01, 0.1):
+            csp = cubicsuperpath.parsePath(d)
+            polylines = flatten_csp(csp, flatness, MAT)
+            assert chord_error(csp, flatness, MAT) <= flatness*(1+1e-9)
+            # subpaths start and end at the same points as before
+            old = legacy_flatten(copy.deepcopy(csp), flatness, MAT)
+            assert len(polylines) == len(old)
+            for new_points, old_points in zip(polylines, old):
+                assert np.allclose(new_points[[0, -1]], old_points[[0, -1]])
+    # a line is one step
+    assert [len(p) for p in flatten_csp(cubicsuperpath.parsePath("M 0,0 L 10,5 20,0"), 0.01)] == [3]
+
+
+def main(n_curves=60000, flatness=0.01):
+    check()
+    d = glyph_path(n_curves)
+    csp = cubicsuperpath.parsePath(d)
+    print("%d curves, flatness %g" % (n_curves, flatness))
+
+    p = copy.deepcopy(csp)
+    start = time()
+    old = legacy_flatten(p, flatness, MAT)
+    t_old = time()-start
+    start = time()
+    new = flatten_csp(csp, flatness, MAT)
+    t_new = time()-start
+    print("cspsubdiv:   %7.2f s  %8d points" % (t_old, sum(len(p) for p in old)))
+    print("flatten_csp: %7.2f s  %8d points  (%.0fx)" % (t_new, sum(len(p) for p in new), t_old/t_new))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
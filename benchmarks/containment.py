@@ -0,0 +1,107 @@
+"""Compare the bounding box / sorted index containment test in
+optimize_paths with the old test of every pair of loops, and time the
+whole inside-first ordering on a dense nesting layout.
+
+Run from the repository root:  python -m benchmarks.containment [n_parts]
+"""
+import math
+import random
+import sys
+from time import time
+
+from k40_web.laser_controller.utils import (inside_first_order, loop_containment,
+                                            optimize_paths, point_inside_polygon)
+
+
+def legacy_containment(cuts):
+    # the pairwise loop optimize_paths used before loop_containment
+    Nloops = len(cuts)
+    LoopTree = []
+    for iloop in range(Nloops):
+        LoopTree.append([])
+        ipoly = cuts[iloop]
+        for jloop in range(Nloops):
+            if jloop != iloop:
+                if point_inside_polygon(cuts[jloop][0][0], cuts[jloop][0][1], ipoly) > 0:
+                    LoopTree[iloop].append(jloop)
+    return LoopTree
+
+
+def legacy_order(LoopTree):
+    # the recursive addlist ordering, for layouts without mutual containment
+    LoopTree = [list(t) for t in LoopTree]
+    order = []
+    loops = list(range(len(LoopTree)))
+
+    def addlist(items):
+        for i in items:
+            if LoopTree[i] != []:
+                addlist(LoopTree[i])
+                LoopTree[i] = []
+            if loops[i] != []:
+                order.append(loops[i])
+                loops[i] = []
+
+    for i in range(len(LoopTree)):
+        addlist([i])
+    return order
+
+
+def circle(cx, cy, r, n):
+    return [[cx+r*math.cos(2*math.pi*k/n), cy+r*math.sin(2*math.pi*k/n)] for k in range(n+1)]
+
+
+def nested_parts(n_parts, seed=0):
+    # parts on a sheet: an outline with a few holes, some holes with inlays
+    rng = random.Random(seed)
+    cuts = []
+    cols = int(math.ceil(math.sqrt(n_parts)))
+    for p in range(n_parts):
+        cx, cy = 12*(p % cols), 12*(p // cols)
+        cuts.append(circle(cx, cy, 5, 40))
+        for h in range(rng.randrange(1, 5)):
+            a = 2*math.pi*h/4 + 0.3
+            hx, hy = cx+2.8*math.cos(a), cy+2.8*math.sin(a)
+            cuts.append(circle(hx, hy, 1.5, 16))
+            if rng.random() < 0.5:
+                cuts.append(circle(hx, hy, 0.6, 8))
+    rng.shuffle(cuts)
+    return cuts
+
+
+def to_ecoords(cuts):
+    return [[x, y, loop] for loop, cut in enumerate(cuts) for x, y in cut]
+
+
+def check():
+    for seed in range(3):
+        cuts = nested_parts(40, seed)
+        tree = loop_containment(cuts)
+        assert tree == legacy_containment(cuts), seed
+        assert inside_first_order(tree) == legacy_order(tree), seed
+
+
+def main(n_parts=500):
+    check()
+    cuts = nested_parts(n_parts, 1)
+    print("%d parts, %d loops, %d points" % (n_parts, len(cuts), sum(map(len, cuts))))
+
+    start = time()
+    tree = loop_containment(cuts)
+    t_new = time()-start
+
+    start = time()
+    old_tree = legacy_containment(cuts)
+    t_old = time()-start
+    assert tree == old_tree
+
+    print("pairwise containment:     %8.2f s" % t_old)
+    print("bounding box + index:     %8.2f s  (%.0fx)" % (t_new, t_old/t_new))
+
+    start = time()
+    optimize_paths(to_ecoords(cuts), inside_check=True)
+    print("optimize_paths (total):   %8.2f s" % (time()-start))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
@@ -0,0 +1,134 @@
+"""Check the run length line rasterizer in egv.make_cut_line against the
+old per mil loop byte for byte and time both on line heavy vector jobs.
+
+Run from the repository root:  python -m benchmarks.cut_lines [n_lines]
+"""
+import math
+import random
+import sys
+from time import time
+
+from k40_web.laser_controller.egv import egv
+
+
+class legacy_egv(egv):
+    def make_cut_line(self, dxmils, dymils, Spindle):
+        # the loop make_cut_line used before the run length formulation
+        XCODE = self.RIGHT
+        if dxmils < 0.0:
+            XCODE = self.LEFT
+        YCODE = self.UP
+        if dymils < 0.0:
+            YCODE = self.DOWN
+
+        if abs(dxmils-round(dxmils, 0)) > 0.0 or abs(dymils-round(dymils, 0)) > 0.0:
+            raise Exception(
+                'Distance values should be integer value (inches*1000)')
+
+        adx = abs(dxmils/1000.0)
+        ady = abs(dymils/1000.0)
+
+        if dxmils == 0:
+            self.move(YCODE, abs(dymils), laser_on=Spindle)
+        elif dymils == 0:
+            self.move(XCODE, abs(dxmils), laser_on=Spindle)
+        elif dxmils == dymils:
+            self.move(self.ANGLE, abs(dxmils), laser_on=Spindle,
+                      angle_dirs=[XCODE, YCODE])
+        else:
+            h = []
+            if adx > ady:
+                slope = ady/adx
+                n = int(abs(dxmils))
+                CODE = XCODE
+            else:
+                slope = adx/ady
+                n = int(abs(dymils))
+                CODE = YCODE
+
+            for i in range(1, n+1):
+                h.append(round(i*slope, 0))
+
+            Lh = 0.0
+            d1 = 0.0
+            d2 = 0.0
+            for i in range(len(h)):
+                if h[i] == Lh:
+                    d1 = d1+1
+                    if d2 > 0.0:
+                        self.move(self.ANGLE, d2, laser_on=Spindle,
+                                  angle_dirs=[XCODE, YCODE])
+                        d2 = 0.0
+                else:
+                    d2 = d2+1
+                    if d1 > 0.0:
+                        self.move(CODE, d1, laser_on=Spindle)
+                        d1 = 0.0
+                Lh = h[i]
+
+            if d1 > 0.0:
+                self.move(CODE, d1, laser_on=Spindle)
+            if d2 > 0.0:
+                self.move(self.ANGLE, d2, laser_on=Spindle,
+                          angle_dirs=[XCODE, YCODE])
+
+
+def encode(cls, segments):
+    inst = cls()
+    for dx, dy in segments:
+        inst.make_cut_line(dx, dy, True)
+    inst.flush()
+    return inst.data
+
+
+def slanted_lines(n_lines, seed=0, max_mils=12000):
+    # mostly long slanted cuts, some short ones and some near 45 degrees
+    rng = random.Random(seed)
+    segments = []
+    for _ in range(n_lines):
+        length = rng.choice((rng.uniform(5, 200), rng.uniform(200, max_mils)))
+        a = rng.uniform(0, 2*math.pi)
+        if rng.random() < 0.1:
+            a = math.pi/4 + rng.choice((-1, 1))*rng.uniform(0, 0.01)
+        segments.append((round(length*math.cos(a)), round(length*math.sin(a))))
+    return segments
+
+
+def check():
+    rng = random.Random(1)
+    segments = [(dx, dy) for dx in range(-40, 41) for dy in range(-40, 41)]
+    segments += [(rng.randrange(-5000, 5000), rng.randrange(-5000, 5000)) for _ in range(3000)]
+    for dx, dy in segments:
+        assert encode(egv, [(dx, dy)]) == encode(legacy_egv, [(dx, dy)]), (dx, dy)
+    # moves merge across lines, also when writing through a target
+    rng.shuffle(segments)
+    assert encode(egv, segments) == encode(legacy_egv, segments)
+    out = bytearray()
+    inst = egv(target=out.append)
+    for dx, dy in segments:
+        inst.make_cut_line(dx, dy, True)
+    inst.flush()
+    assert out == encode(legacy_egv, segments)
+
+
+def main(n_lines=2000):
+    check()
+    segments = slanted_lines(n_lines)
+
+    start = time()
+    old = encode(legacy_egv, segments)
+    t_old = time()-start
+
+    start = time()
+    new = encode(egv, segments)
+    t_new = time()-start
+    assert new == old
+
+    print("%d lines, %d mils of major axis, %d bytes" %
+          (n_lines, sum(max(abs(dx), abs(dy)) for dx, dy in segments), len(new)))
+    print("per mil loop: %7.3f s" % t_old)
+    print("run lengths:  %7.3f s  (%.1fx)" % (t_new, t_old/t_new))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
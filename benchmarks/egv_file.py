@@ -0,0 +1,113 @@
+"""Compare reading EGV files with EGVFile against the old character by
+character reader in Open_EGV: same data sent, time and peak memory.
+
+Run from the repository root:  python -m benchmarks.egv_file [n_mbytes]
+"""
+import os
+import sys
+import tempfile
+import tracemalloc
+from time import time
+
+from benchmarks.usb import vector_job
+from k40_web.laser_controller.egv_job import EGVFile, EGVJob
+from k40_web.laser_controller.nano_library import make_packets
+
+
+def legacy_read(filename):
+    # the loops of Open_EGV before EGVFile, without the design_scale factor
+    values = ["", "", "", ""]
+    data = ""
+    EGV_data = []
+    with open(filename) as f:
+        c = f.read(1)
+        while c != "%" and c:
+            c = f.read(1)
+        for k in range(4):
+            c = f.read(1)
+            while c != "%" and c:
+                values[k] = values[k] + c
+                c = f.read(1)
+        while True:
+            c = f.read(1)
+            if not c:
+                break
+            if c == '\n' or c == ' ' or c == '\r':
+                pass
+            else:
+                data = data+"%c" % c
+                EGV_data.append(ord(c))
+    return [int(v) for v in values], data.encode()
+
+
+def write_file(filename, data, positions=(0, 0, 0, 0), line_length=0):
+    with open(filename, "wb") as f:
+        f.write(b"Document type : LHYMICRO-GL file\n")
+        f.write(b"Creator-Software: K40 Whisperer\n\n")
+        f.write(b"%" + b"".join(b"%d%%" % v for v in positions))
+        if line_length:
+            for i in range(0, len(data), line_length):
+                f.write(data[i:i+line_length] + b"\r\n")
+        else:
+            f.write(data)
+
+
+def file_job(filename, passes=1):
+    egv_file = EGVFile(filename)
+    job = EGVJob(egv_file.head)
+    job.add(egv_file, passes)
+    return egv_file, job
+
+
+def check(directory):
+    data = b"I" + vector_job(20)
+    filename = os.path.join(directory, "check.egv")
+    for positions in ((0, 0, 0, 0), (120, -35, 4000, 250)):
+        for line_length in (0, 1, 3, 77):
+            write_file(filename, data, positions, line_length)
+            old_positions, old_data = legacy_read(filename)
+            for chunk_size in (1, 5, 1 << 20):
+                EGVFile.chunk_size = chunk_size
+                for passes in (1, 2, 3):
+                    egv_file, job = file_job(filename, passes)
+                    assert egv_file.positions == old_positions
+                    assert job.tobytes() == EGVJob.from_data(old_data, passes).tobytes()
+                    assert len(job) == len(job.tobytes())
+            EGVFile.chunk_size = 1 << 20
+
+
+def main(n_mbytes=50):
+    with tempfile.TemporaryDirectory() as directory:
+        check(directory)
+        job_data = vector_job(1000)
+        data = b"I" + job_data[:-4]*(n_mbytes*(1 << 20)//len(job_data)) + b"FNSE"
+        filename = os.path.join(directory, "big.egv")
+        write_file(filename, data, line_length=1 << 16)
+        del data
+
+        start = time()
+        egv_file, job = file_job(filename)
+        n_packets = sum(1 for packet in make_packets(job.chunks()))
+        elapsed = time()-start
+        tracemalloc.start()
+        for chunk in job.chunks():
+            pass
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("%.1f MB file, %d packets" % (os.path.getsize(filename)/1e6, n_packets))
+        print("EGVFile:             %7.2f s  peak %8.1f MB" % (elapsed, peak/1e6))
+
+        small = os.path.join(directory, "small.egv")
+        write_file(small, b"I" + job_data)
+        tracemalloc.start()
+        start = time()
+        legacy_read(small)
+        elapsed = time()-start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print("old reader, %.1f MB: %7.2f s  peak %8.1f MB" %
+              (os.path.getsize(small)/1e6, elapsed, peak/1e6))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
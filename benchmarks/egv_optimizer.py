@@ -0,0 +1,123 @@
+"""Check that optimize_egv keeps the laser path and the speed changes of
+generated jobs and report the bytes and USB packets it saves.
+
+Run from the repository root:  python -m benchmarks.egv_optimizer
+"""
+import math
+import random
+from time import time
+
+from benchmarks.legacy_raster import scanline_ecoords
+from benchmarks.raster import test_image
+from k40_web.laser_controller.egv import egv
+from k40_web.laser_controller.egv_optimizer import TOKEN, decode_distance, optimize_egv
+from k40_web.laser_controller.nano_library import PACKET_PAYLOAD
+
+
+def laser_path(data):
+    """Follow the moves in data and return the cuts and the final position.
+
+    Cuts are (x, y, dx, dy) runs in one direction with the laser on,
+    consecutive runs in the same direction joined.
+    """
+    x = y = 0
+    ax, ay = 1, 1
+    laser = False
+    cuts = []
+    for m in TOKEN.finditer(bytes(data)):
+        raw = m.group()
+        if m.lastgroup == "laser":
+            laser = raw == b"D"
+        elif m.lastgroup == "move":
+            d = decode_distance(raw[1:])
+            code = raw[:1]
+            if code == b"B":
+                dx, dy, ax = d, 0, 1
+            elif code == b"T":
+                dx, dy, ax = -d, 0, -1
+            elif code == b"L":
+                dx, dy, ay = 0, d, 1
+            elif code == b"R":
+                dx, dy, ay = 0, -d, -1
+            else:
+                dx, dy = ax*d, ay*d
+            if laser and d:
+                last = cuts[-1] if cuts else None
+                if last and last[0]+last[2] == x and last[1]+last[3] == y and \
+                   (last[2] == 0) == (dx == 0) and (last[3] == 0) == (dy == 0) and \
+                   last[2]*dy == last[3]*dx:
+                    cuts[-1] = (last[0], last[1], last[2]+dx, last[3]+dy)
+                else:
+                    cuts.append((x, y, dx, dy))
+            x += dx
+            y += dy
+    return cuts, (x, y)
+
+
+def speed_codes(data):
+    """The speed codes in data, repeats of the same speed joined.
+
+    optimize_egv may drop speed blocks that set the speed already in
+    effect, never a change of speed.
+    """
+    codes = []
+    for m in TOKEN.finditer(bytes(data)):
+        if m.lastgroup == "speed" and m.group() not in codes[-1:]:
+            codes.append(m.group())
+    return codes
+
+
+def gcode_job(n_lines=3000, seed=0):
+    # g-code style data with a feed that wiggles between segments
+    rng = random.Random(seed)
+    ecoords = []
+    x, y = 1.0, 1.0
+    for loop in range(1, n_lines//10+1):
+        for k in range(10):
+            x = min(max(x + rng.uniform(-0.3, 0.3), 0), 12)
+            y = min(max(y + rng.uniform(-0.3, 0.3), 0), 8)
+            feed = rng.choice((600, 600, 610, 590, 1200))
+            ecoords.append([x, y, loop, feed, 1])
+    egv_inst = egv()
+    egv_inst.make_egv_data(ecoords, units='in', Feed=None)
+    return egv_inst.data
+
+
+def rotary_job(n_loops=300, seed=0):
+    # vector job with slow rapids, as used with a rotary attachment
+    rng = random.Random(seed)
+    ecoords = []
+    for loop in range(1, n_loops+1):
+        cx, cy = rng.uniform(0.5, 12), rng.uniform(0.5, 8)
+        for k in range(9):
+            a = 2*math.pi*k/8
+            ecoords.append([cx+0.1*math.cos(a), cy+0.1*math.sin(a), loop])
+    egv_inst = egv()
+    egv_inst.make_egv_data(ecoords, units='in', Feed=20, Rapid_Feed_Rate=40)
+    return egv_inst.data
+
+
+def raster_job(width=1000, height=500):
+    ecoords = scanline_ecoords(test_image(width, height), 2)[0]
+    egv_inst = egv()
+    egv_inst.make_egv_data(ecoords, units='in', Feed=100, Raster_step=2)
+    return egv_inst.data
+
+
+def main():
+    for name, data in (("g-code", gcode_job()), ("rotary vector", rotary_job()),
+                       ("raster", raster_job())):
+        start = time()
+        out, saved = optimize_egv(data)
+        elapsed = time()-start
+        assert laser_path(out) == laser_path(data), name
+        assert speed_codes(out) == speed_codes(data), name
+        assert optimize_egv(out)[1] == 0, name
+        packets = (len(data)+PACKET_PAYLOAD-1)//PACKET_PAYLOAD
+        new_packets = (len(out)+PACKET_PAYLOAD-1)//PACKET_PAYLOAD
+        print("%-14s %9d -> %9d bytes (%4.1f%% saved), %7d -> %7d packets, %.2f s" %
+              (name, len(data), len(out), 100.0*saved/len(data), packets, new_packets, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Encode the operations of a combined raster, vector engrave and vector
+cut job one after another and in an EGVPool: same data, wall time, and
+how quickly a stop reaches the workers.
+
+Run from the repository root:  python -m benchmarks.egv_pool [processes]
+"""
+import math
+import os
+import random
+import sys
+from threading import Timer
+from time import time
+
+from benchmarks.legacy_raster import scanline_ecoords
+from benchmarks.raster import test_image
+from k40_web.laser_controller.egv_pool import EGVPool, encode, use_pool
+from k40_web.laser_controller.reporter import Reporter
+from k40_web.laser_controller.util_classes import StoppedState
+
+
+def loops(n_loops, r, seed):
+    rng = random.Random(seed)
+    ecoords = []
+    for loop in range(1, n_loops+1):
+        cx, cy = rng.uniform(0.5, 12), rng.uniform(0.5, 8)
+        n = rng.randrange(8, 64)
+        for k in range(n+1):
+            a = 2*math.pi*k/n
+            ecoords.append([cx+r*math.cos(a), cy+r*math.sin(a), loop])
+    return ecoords
+
+
+def combined_job(scale=1):
+    settings = dict(startX=0, startY=0, units="in", board_name="LASER-M2",
+                    FlipXoffset=0, Rapid_Feed_Rate=0, use_laser=True)
+    raster = scanline_ecoords(test_image(1000*scale, 500), 2)[0]
+    return [
+        (raster, dict(settings, Feed=100, Raster_step=2), True),
+        (loops(400*scale, 0.1, 1), dict(settings, Feed=20, Raster_step=0), True),
+        (loops(200*scale, 0.8, 2), dict(settings, Feed=10, Raster_step=0), True),
+    ]
+
+
+def main(processes=4):
+    jobs = combined_job()
+    print("%d CPUs, %d processes" % (os.cpu_count(), processes))
+
+    start = time()
+    sequential = [encode(*job) for job in jobs]
+    t_seq = time()-start
+
+    pool = EGVPool(processes)
+    pool.map(jobs[:1], Reporter, StoppedState())  # start the workers
+    start = time()
+    parallel = pool.map(jobs, Reporter, StoppedState())
+    t_par = time()-start
+    assert parallel == sequential
+    print("one after another: %6.2f s" % t_seq)
+    print("EGVPool:           %6.2f s  (%.1fx)" % (t_par, t_seq/t_par))
+    print("use_pool:          %s, %s for 8x the size" %
+          (use_pool(jobs, processes), use_pool(combined_job(8), processes)))
+
+    big = combined_job(8)
+    stop = StoppedState()
+    Timer(0.5, stop.set).start()
+    start = time()
+    pool.map(big, Reporter, stop)
+    print("stopped after:     %6.2f s  (stop set at 0.50 s)" % (time()-start))
+    pool.shutdown()
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
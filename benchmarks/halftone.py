@@ -0,0 +1,93 @@
+"""Compare the darkness lookup table in convert_halftoning with the old
+per-pixel loop, and time every halftone method on a full bed photo at
+the default halftone resolution (500 dpi).
+
+Run from the repository root:  python -m benchmarks.halftone [width height]
+"""
+import sys
+from time import time
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.raster_strips import grey_photo
+from k40_web.laser_controller.halftone import (FLOYD_STEINBERG, HALFTONE_METHODS, STUCKI,
+                                               convert_halftoning, darkness_lut, error_diffusion,
+                                               generate_bezier)
+from k40_web.laser_controller.interpolate import interpolate
+from k40_web.laser_controller.util_classes import BezierSettings
+
+SETTINGS = BezierSettings(3.5, 2.5, 0.5)
+
+
+def legacy_darkness(image, bezier_settings):
+    # the loop convert_halftoning used before the lookup table
+    image = image.copy()
+    x_lim, y_lim = image.size
+    pixel = image.load()
+    x, y = generate_bezier(bezier_settings)
+    interp = interpolate(x, y)
+    val_map = []
+    for val in range(0, 256):
+        val_out = int(round(interp[val]))
+        val_map.append(val_out)
+    for y in range(1, y_lim):
+        for x in range(1, x_lim):
+            pixel[x, y] = val_map[pixel[x, y]]
+    return image
+
+
+def sequential_diffusion(pixels, kernel):
+    # error diffusion one pixel at a time, in the same float32 arithmetic
+    h, w = pixels.shape
+    total = float(sum(weight for dy, dx, weight in kernel))
+    err = np.zeros((h, w), dtype=np.float32)
+    out = np.empty((h, w), dtype=bool)
+    for y in range(h):
+        for x in range(w):
+            value = np.float32(pixels[y, x])
+            for dy, dx, weight in kernel:
+                if 0 <= y-dy and 0 <= x-dx < w:
+                    value += np.float32(weight/total)*err[y-dy, x-dx]
+            out[y, x] = value >= 128
+            err[y, x] = value-255*out[y, x]
+    return out
+
+
+def check():
+    image = grey_photo(300, 200, 1)
+    old = np.asarray(legacy_darkness(image, SETTINGS))
+    new = np.asarray(image.point(darkness_lut(SETTINGS)))
+    # the old loop left the first row and column alone
+    assert np.array_equal(old[1:, 1:], new[1:, 1:])
+    pixels = np.asarray(grey_photo(37, 23, 2))
+    for kernel in (FLOYD_STEINBERG, STUCKI):
+        assert np.array_equal(error_diffusion(pixels, kernel), sequential_diffusion(pixels, kernel))
+    for method in HALFTONE_METHODS:
+        result = convert_halftoning(image, SETTINGS, method)
+        assert result.mode == "1" and result.size == image.size
+        # about as dark as the adjusted image
+        assert abs(np.asarray(result).mean()*255 - new.mean()) < 4, method
+
+
+def main(width=12795, height=8661):
+    check()
+    # make_raster_coords halftones at ht_size dpi, half the 1000 dpi of the image
+    image = grey_photo(width//2, height//2)
+    print("%dx%d image" % image.size)
+
+    start = time()
+    legacy_darkness(image, SETTINGS)
+    print("darkness, pixel loop:  %7.2f s" % (time()-start))
+    start = time()
+    adjusted = image.point(darkness_lut(SETTINGS))
+    print("darkness, lookup:      %7.2f s" % (time()-start))
+
+    for method, dither in HALFTONE_METHODS.items():
+        start = time()
+        dither(adjusted)
+        print("%-22s %7.2f s" % (method+":", time()-start))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:3]])
@@ -0,0 +1,82 @@
+"""Compare convex_hull_ecoords with hull2D.convex_hull over Python tuples,
+as make_trace_path and the raster extents used it, on the scanline
+extents of a full bed 1000 dpi photo and on a large vector design.
+
+Run from the repository root:  python -m benchmarks.hull [points]
+"""
+import sys
+from time import time
+
+import numpy as np
+
+from benchmarks.raster_strips import grey_photo
+from k40_web.laser_controller.convex_hull import convex_hull_ecoords, hull2D
+from k40_web.laser_controller.packed_raster import band_scanlines, scanline_y
+
+
+def legacy_hull(x, y):
+    # what convexHullecoords did: a set and a sort of Python tuples of all points
+    hull_data = hull2D().convex_hull(list(zip(x.tolist(), y.tolist())))
+    ecoords = [[px, py, 1] for px, py in hull_data]
+    ecoords.append(ecoords[0])
+    return ecoords
+
+
+def raster_extents(width, height):
+    # the LEFT/RIGHT ends of every scanline, as PackedRaster.from_image hands them over
+    image = grey_photo(width, height)
+    dark = np.asarray(image) < 128
+    _, (ext_rows, LEFT, RIGHT) = band_scanlines(dark)
+    y = scanline_y(ext_rows, height, 1)
+    return np.concatenate((LEFT / 1000.0, RIGHT / 1000.0)), np.concatenate((y, y))
+
+
+def vector_points(n, seed=0):
+    # many small closed circles spread over the bed, rounded like SVG coordinates
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform((0.5, 0.5), (12.0, 8.0), (n//24, 2))
+    angle = np.linspace(0, 2*np.pi, 24, endpoint=False)
+    x = (centres[:, :1] + 0.2*np.cos(angle)).ravel().round(5)
+    y = (centres[:, 1:] + 0.2*np.sin(angle)).ravel().round(5)
+    return x, y
+
+
+def check():
+    rng = np.random.default_rng(1)
+    for n in (1, 2, 3, 8, 9, 50, 1000):
+        for grid in (None, 4):
+            x = rng.normal(size=n)
+            y = rng.normal(size=n)
+            if grid:
+                x = x.round(0)
+                y = y.round(0)
+            assert convex_hull_ecoords(x, y) == legacy_hull(x, y)
+    # collinear and repeated points
+    x = np.array([0.0, 1.0, 2.0, 3.0, 1.0, 2.0])
+    assert convex_hull_ecoords(x, 2*x) == legacy_hull(x, 2*x)
+    x, y = raster_extents(300, 200)
+    assert convex_hull_ecoords(x, y) == legacy_hull(x, y)
+    x, y = vector_points(2400)
+    assert convex_hull_ecoords(x, y) == legacy_hull(x, y)
+
+
+def compare(name, x, y):
+    start = time()
+    old = legacy_hull(x, y)
+    t_old = time()-start
+    start = time()
+    new = convex_hull_ecoords(x, y)
+    t_new = time()-start
+    assert new == old
+    print("%-28s %9d points  tuples %7.3f s  arrays %7.3f s  (%.0fx)" %
+          (name, len(x), t_old, t_new, t_old/t_new))
+
+
+def main(points=1000000):
+    check()
+    compare("raster extents 12795x8661:", *raster_extents(12795, 8661))
+    compare("vector circles:", *vector_points(points))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
@@ -0,0 +1,39 @@
+"""Raster ecoords as make_raster_coords made them before PackedRaster:
+two points for every laser-on run of the whole image. Kept as the
+reference the raster benchmarks compare with and as a source of raster
+ecoords for the encoder benchmarks.
+"""
+import numpy as np
+
+from k40_web.laser_controller.ecoords import EcoordArray
+from k40_web.laser_controller.packed_raster import band_scanlines, scanline_extents, scanline_y
+
+
+def raster_scanlines(image, raster_step):
+    """Find the laser-on runs of every raster_step'th row of a thresholded image.
+
+    Pixels with value 0 are engraved. Returns two tuples of arrays:
+    (row, start, end) for every laser-on run in scan order, with end exclusive
+    and row counted in scanlines, and (row, left, right) with the engraved
+    extent of every scanline that contains at least one run.
+    """
+    return band_scanlines(np.asarray(image)[::raster_step] == 0)
+
+
+def scanline_ecoords(image, Raster_step):
+    """Turn a thresholded image into raster ecoords.
+
+    Returns the ecoords (one two point loop per laser-on run), the engraved
+    length and number of scanlines in inches, and the convex hull of the
+    engraved area.
+    """
+    wim, him = image.size
+    (rows, starts, ends), (ext_rows, LEFT, RIGHT) = raster_scanlines(image, Raster_step)
+    LENGTH, n_scanlines, hcoords = scanline_extents(ext_rows, LEFT, RIGHT, him, Raster_step)
+
+    # every laser-on run becomes a two point loop, numbered from 2
+    ecoords = EcoordArray.from_columns(
+        np.column_stack((starts, ends)).ravel() / 1000.0,
+        np.repeat(scanline_y(rows, him, Raster_step), 2),
+        np.repeat(np.arange(2, len(rows)+2), 2))
+    return ecoords, LENGTH, n_scanlines, hcoords
@@ -0,0 +1,90 @@
+"""Check the table driven CRC and the packetizer in nano_library against the
+old bit by bit implementation and time both.
+
+Run from the repository root:  python -m benchmarks.packets [n_bytes]
+"""
+import random
+import sys
+from time import time
+
+from k40_web.laser_controller.egv_job import EGVJob
+from k40_web.laser_controller.nano_library import OneWireCRC, make_packets
+
+
+def legacy_crc(line):
+    crc = 0
+    for i in range(len(line)):
+        inbyte = line[i]
+        for j in range(8):
+            mix = (crc ^ inbyte) & 0x01
+            crc >>= 1
+            if (mix):
+                crc ^= 0x8C
+            inbyte >>= 1
+    return crc
+
+
+def legacy_packets(data, passes):
+    # the packet loop K40_CLASS.send_data used with preprocess_crc=True
+    data = list(data)
+    blank = [166, 0] + [70]*30 + [166, 0]
+    packets = []
+    packet = blank[:]
+    cnt = 2
+    len_data = len(data)
+    for j in range(passes):
+        istart = 0 if j == 0 else 1
+        if passes > 1:
+            if j == passes-1:
+                data[-4] = ord("F")
+            else:
+                data[-4] = ord("@")
+        for i in range(istart, len_data):
+            if cnt > 31:
+                packet[-1] = legacy_crc(packet[1:len(packet)-2])
+                packets.append(packet)
+                packet = blank[:]
+                cnt = 2
+            packet[cnt] = data[i]
+            cnt = cnt+1
+    packet[-1] = legacy_crc(packet[1:len(packet)-2])
+    packets.append(packet)
+    return packets
+
+
+def random_job(n, rng):
+    return bytes(rng.randrange(64, 123) for _ in range(n)) + b"FNSE"
+
+
+def check():
+    rng = random.Random(0)
+    for inbyte in range(256):
+        assert OneWireCRC([inbyte]) == legacy_crc([inbyte])
+    for n in (0, 1, 25, 26, 27, 29, 30, 31, 59, 60, 61, 1000):
+        for passes in (1, 2, 3, 5):
+            job = b"I" + random_job(n, rng)
+            new = list(make_packets(EGVJob.from_data(job, passes).chunks()))
+            old = legacy_packets(job, passes)
+            assert [list(p) for p in new] == old, (n, passes)
+
+
+def main(n_bytes=2000000):
+    check()
+    job = b"I" + random_job(n_bytes, random.Random(1))
+
+    start = time()
+    old = legacy_packets(job, 1)
+    t_old = time()-start
+
+    start = time()
+    new = list(make_packets(EGVJob.from_data(job).chunks()))
+    t_new = time()-start
+
+    assert len(old) == len(new)
+    print("%d bytes, %d packets" % (len(job), len(new)))
+    print("bitwise CRC, per byte packets: %7.3f s" % t_old)
+    print("table CRC, memoryview slices:  %7.3f s  (%.1fx)" % (t_new, t_old/t_new))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
@@ -0,0 +1,68 @@
+"""Compare EGVJob with the old multi-pass assembly in make_job_data that
+copied the data of every pass: same bytes, memory and assembly time.
+
+Run from the repository root:  python -m benchmarks.passes [n_passes]
+"""
+import sys
+import tracemalloc
+from time import time
+
+from benchmarks.usb import raster_job, vector_job
+from k40_web.laser_controller.egv_job import EGVJob
+from k40_web.laser_controller.nano_library import make_packets
+
+
+def legacy_join(segments):
+    # the join at the end of make_job_data before EGVJob
+    data = bytearray(b"I")
+    for segment, passes in segments:
+        for k in range(passes):
+            if len(data) > 4:
+                data[-4] = ord("@")
+            data.extend(segment)
+    return data
+
+
+def new_join(segments):
+    job = EGVJob()
+    for segment, passes in segments:
+        job.add(segment, passes)
+    return job
+
+
+def measure(join, segments):
+    tracemalloc.start()
+    start = time()
+    job = join(segments)
+    elapsed = time()-start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return job, elapsed, peak
+
+
+def check(vector, raster):
+    for segments in ([(vector, 1)], [(vector, 3)], [(raster, 2), (vector, 1), (vector, 4)],
+                     [(b"", 2), (vector, 2)], [(b"FNSE", 3)]):
+        job = new_join(segments)
+        old = legacy_join(segments)
+        assert job.tobytes() == old
+        assert len(job) == len(old)
+        assert EGVJob.loads(job.dumps()).tobytes() == old
+        assert b"".join(make_packets(job.chunks())) == \
+            b"".join(make_packets(EGVJob.from_data(old).chunks()))
+
+
+def main(n_passes=10):
+    vector, raster = vector_job(1000), raster_job()
+    check(vector, raster)
+    segments = [(raster, n_passes), (vector, n_passes)]
+    print("%d + %d bytes, %d passes each" % (len(raster), len(vector), n_passes))
+    old, t_old, m_old = measure(legacy_join, segments)
+    job, t_new, m_new = measure(new_join, segments)
+    assert len(job) == len(old)
+    print("copy every pass:  %8.4f s  %10.1f kB" % (t_old, m_old/1e3))
+    print("segment passes:   %8.4f s  %10.1f kB" % (t_new, m_new/1e3))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
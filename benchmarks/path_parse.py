@@ -0,0 +1,212 @@
+"""Compare simplepath.parsePath with the token by token lexer and parser
+it replaced: same segments and errors, and the time on a multi-megabyte
+path. Also times path_nodes on text converted to paths, where the same
+glyphs come back again and again.
+
+Run from the repository root:  python -m benchmarks.path_parse [n_segments]
+"""
+import re
+import sys
+from timeit import repeat
+
+import numpy as np
+
+import k40_web.laser_controller.cubicsuperpath as cubicsuperpath
+from k40_web.laser_controller.simplepath import parsePath, pathdefs
+from k40_web.laser_controller.svg_geometry import csp_nodes, path_nodes
+
+
+def legacy_lexPath(d):
+    # simplepath.lexPath before the compiled tokenizer
+    offset = 0
+    length = len(d)
+    delim = re.compile(r'[ \t\r\n,]+')
+    command = re.compile(r'[MLHVCSQTAZmlhvcsqtaz]')
+    parameter = re.compile(
+        r'(([-+]?[0-9]+(\.[0-9]*)?|[-+]?\.[0-9]+)([eE][-+]?[0-9]+)?)')
+    while 1:
+        m = delim.match(d, offset)
+        if m:
+            offset = m.end()
+        if offset >= length:
+            break
+        m = command.match(d, offset)
+        if m:
+            yield [d[offset:m.end()], True]
+            offset = m.end()
+            continue
+        m = parameter.match(d, offset)
+        if m:
+            yield [d[offset:m.end()], False]
+            offset = m.end()
+            continue
+        raise Exception('Invalid path data!')
+
+
+def legacy_parsePath(d):
+    # simplepath.parsePath before, one parameter at a time through pathdefs
+    retval = []
+    lexer = legacy_lexPath(d)
+    pen = (0.0, 0.0)
+    subPathStart = pen
+    lastControl = pen
+    lastCommand = ''
+    while 1:
+        try:
+            token, isCommand = next(lexer)
+        except StopIteration:
+            break
+        params = []
+        needParam = True
+        if isCommand:
+            if not lastCommand and token.upper() != 'M':
+                raise Exception('Invalid path, must begin with moveto.')
+            else:
+                command = token
+        else:
+            needParam = False
+            if lastCommand:
+                if lastCommand.isupper():
+                    command = pathdefs[lastCommand][0]
+                else:
+                    command = pathdefs[lastCommand.upper()][0].lower()
+            else:
+                raise Exception('Invalid path, no initial command.')
+        numParams = pathdefs[command.upper()][1]
+        while numParams > 0:
+            if needParam:
+                try:
+                    token, isCommand = next(lexer)
+                    if isCommand:
+                        raise Exception('Invalid number of parameters')
+                except StopIteration:
+                    raise Exception('Unexpected end of path')
+            cast = pathdefs[command.upper()][2][-numParams]
+            param = cast(token)
+            if command.islower():
+                if pathdefs[command.upper()][3][-numParams] == 'x':
+                    param += pen[0]
+                elif pathdefs[command.upper()][3][-numParams] == 'y':
+                    param += pen[1]
+            params.append(param)
+            needParam = True
+            numParams -= 1
+        outputCommand = command.upper()
+        if outputCommand in ('H', 'V'):
+            if outputCommand == 'H':
+                params.append(pen[1])
+            if outputCommand == 'V':
+                params.insert(0, pen[0])
+            outputCommand = 'L'
+        if outputCommand in ('S', 'T'):
+            params.insert(0, pen[1]+(pen[1]-lastControl[1]))
+            params.insert(0, pen[0]+(pen[0]-lastControl[0]))
+            if outputCommand == 'S':
+                outputCommand = 'C'
+            if outputCommand == 'T':
+                outputCommand = 'Q'
+        if outputCommand == 'M':
+            subPathStart = tuple(params[0:2])
+            pen = subPathStart
+        if outputCommand == 'Z':
+            pen = subPathStart
+        else:
+            pen = tuple(params[-2:])
+        if outputCommand in ('Q', 'C'):
+            lastControl = tuple(params[-4:-2])
+        else:
+            lastControl = pen
+        lastCommand = command
+        retval.append([outputCommand, params])
+    return retval
+
+
+VALID = ["M 10,20 L 30 40 h 5 v-5 H 0 V 1 z",
+         "m1.5.5-2e1,3E-2 c1,2,3,4,5,6 s 1 2 3 4 q 1 2 3 4 t 5 6 T 7 8 S 1 2 3 4 Z",
+         "M0,0a10,20 30 1 0 40,50 A 5 5 0 0 1 100 100",
+         "M 0 0 z 5 5 6 6 m 1 1 2 2 Z l 3 3",
+         "M\t1\r\n2,,3 4 C 1 2 3 4 5 6 7 8 9 10 11 12",
+         "M-.5-.5+1+1", ""]
+INVALID = ["L 1 2", "1 2", "M 1", "M 1 L 2", "M 1 2 x 3", "M 1 2 L 1e 2"]
+
+
+def glyph_path(n_segments, seed=0):
+    # relative curves and lines of font outlines and traced bitmaps
+    rng = np.random.default_rng(seed)
+    d = []
+    for k in range(n_segments):
+        if k % 50 == 0:
+            d.append("M%.4f,%.4f" % tuple(rng.uniform(0, 300, 2)))
+        elif k % 3 == 0:
+            d.append("l%.4f,%.4f" % tuple(rng.uniform(-5, 5, 2)))
+        else:
+            d.append("c%.4f,%.4f %.4f,%.4f %.4f,%.4f" % tuple(rng.uniform(-5, 5, 6)))
+        if k % 50 == 49:
+            d.append("z")
+    return " ".join(d)
+
+
+def error(function, d):
+    try:
+        function(d)
+    except Exception as e:
+        return str(e)
+
+
+def check():
+    for d in VALID + [glyph_path(500)]:
+        assert parsePath(d) == legacy_parsePath(d), d
+    for d in INVALID:
+        assert error(parsePath, d) == error(legacy_parsePath, d) is not None, d
+        try:
+            parsePath(d)
+        except ValueError:
+            pass
+    d = glyph_path(200)
+    nodes, sizes = path_nodes(d)
+    assert path_nodes(d)[0] is nodes and not nodes.flags.writeable
+    expected = csp_nodes(cubicsuperpath.CubicSuperPath(legacy_parsePath(d)))
+    assert np.array_equal(nodes, expected[0]) and np.array_equal(sizes, expected[1])
+
+
+def best_time(function, *args):
+    # the best of three runs, single runs vary a lot with the allocations of the lists
+    return min(repeat(lambda: function(*args), number=1, repeat=3))
+
+
+def parse_text(text, parse):
+    for d in text:
+        parse(d)
+
+
+def parse_text_cached(text):
+    # every run starts with an empty cache
+    path_nodes.cache_clear()
+    parse_text(text, path_nodes)
+
+
+def legacy_nodes(d):
+    return csp_nodes(cubicsuperpath.CubicSuperPath(legacy_parsePath(d)))
+
+
+def main(n_segments=100000):
+    check()
+    d = glyph_path(n_segments)
+    print("%d segments, %.1f MB of path data" % (n_segments, len(d)/1e6))
+    assert parsePath(d) == legacy_parsePath(d)
+    t_old = best_time(legacy_parsePath, d)
+    t_new = best_time(parsePath, d)
+    print("token by token: %7.2f s" % t_old)
+    print("compiled:       %7.2f s  (%.1fx)" % (t_new, t_old/t_new))
+
+    # a page of text: 5000 glyphs from an alphabet of 60
+    glyphs = [glyph_path(40, seed) for seed in range(60)]
+    text = [glyphs[i % 60] for i in range(5000)]
+    t_old = best_time(parse_text, text, legacy_nodes)
+    t_new = best_time(parse_text_cached, text)
+    print("5000 glyphs, parsed each time: %7.2f s" % t_old)
+    print("5000 glyphs, path_nodes:       %7.2f s  (%.0fx)" % (t_new, t_old/t_new))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
@@ -0,0 +1,134 @@
+"""Compare the grid hash nearest neighbour search in Sort_Paths with the
+old linear search: same order, rapid travel length and ordering time.
+
+Run from the repository root:  python -m benchmarks.paths [n_loops]
+"""
+import math
+import random
+import sys
+from time import time
+
+from k40_web.laser_controller.utils import Sort_Paths
+
+
+def legacy_sort_paths(ecoords, i_loop=2):
+    # the linear search Sort_Paths used before EndpointGrid
+    Lbeg = []
+    Lend = []
+    if len(ecoords) > 0:
+        Lbeg.append(0)
+        loop_old = ecoords[0][i_loop]
+        for i in range(1, len(ecoords)):
+            loop = ecoords[i][i_loop]
+            if loop != loop_old:
+                Lbeg.append(i)
+                Lend.append(i-1)
+            loop_old = loop
+        Lend.append(i)
+
+    order_out = []
+    use_beg = 0
+    if len(ecoords) > 0:
+        order_out.append([Lbeg[0], Lend[0]])
+    inext = 0
+    total = len(Lbeg)
+    for i in range(total-1):
+        if use_beg == 1:
+            ii = Lbeg.pop(inext)
+            Lend.pop(inext)
+        else:
+            ii = Lend.pop(inext)
+            Lbeg.pop(inext)
+
+        Xcur = ecoords[ii][0]
+        Ycur = ecoords[ii][1]
+
+        dx = Xcur - ecoords[Lbeg[0]][0]
+        dy = Ycur - ecoords[Lbeg[0]][1]
+        min_dist = dx*dx + dy*dy
+
+        dxe = Xcur - ecoords[Lend[0]][0]
+        dye = Ycur - ecoords[Lend[0]][1]
+        min_diste = dxe*dxe + dye*dye
+
+        inext = 0
+        inexte = 0
+        for j in range(1, len(Lbeg)):
+            dx = Xcur - ecoords[Lbeg[j]][0]
+            dy = Ycur - ecoords[Lbeg[j]][1]
+            dist = dx*dx + dy*dy
+            if dist < min_dist:
+                min_dist = dist
+                inext = j
+            dxe = Xcur - ecoords[Lend[j]][0]
+            dye = Ycur - ecoords[Lend[j]][1]
+            diste = dxe*dxe + dye*dye
+            if diste < min_diste:
+                min_diste = diste
+                inexte = j
+        if min_diste < min_dist:
+            inext = inexte
+            order_out.append([Lend[inexte], Lbeg[inexte]])
+            use_beg = 1
+        else:
+            order_out.append([Lbeg[inext], Lend[inext]])
+            use_beg = 0
+    return order_out
+
+
+def dxf_like_loops(n_loops, seed=0):
+    # small closed loops and open polylines on a grid of parts, in mm
+    rng = random.Random(seed)
+    ecoords = []
+    for loop in range(n_loops):
+        cx = rng.randrange(0, 300) + rng.choice((0, 0.5))
+        cy = rng.randrange(0, 200) + rng.choice((0, 0.5))
+        r = rng.uniform(0.2, 2.0)
+        n = rng.randrange(3, 9)
+        closed = rng.random() < 0.7
+        for k in range(n+1 if closed else n):
+            a = 2*math.pi*k/n
+            ecoords.append([cx+r*math.cos(a), cy+r*math.sin(a), loop])
+    return ecoords
+
+
+def rapid_travel(ecoords, order):
+    length = 0.0
+    last = None
+    for first, final in order:
+        if last is not None:
+            length += math.hypot(ecoords[first][0]-last[0], ecoords[first][1]-last[1])
+        last = ecoords[final]
+    return length
+
+
+def check():
+    for seed in range(5):
+        for n_loops in (1, 2, 3, 10, 200, 1000):
+            ecoords = dxf_like_loops(n_loops, seed)
+            assert Sort_Paths(ecoords) == legacy_sort_paths(ecoords), (seed, n_loops)
+
+
+def main(n_loops=20000):
+    check()
+    ecoords = dxf_like_loops(n_loops, 1)
+
+    start = time()
+    new = Sort_Paths(ecoords)
+    t_new = time()-start
+    print("%d loops, %d points" % (n_loops, len(ecoords)))
+    starts = [i for i in range(len(ecoords)) if i == 0 or ecoords[i][2] != ecoords[i-1][2]]
+    unsorted = [[b, e-1] for b, e in zip(starts, starts[1:] + [len(ecoords)])]
+    print("file order:%16s%10.0f mm" % ("", rapid_travel(ecoords, unsorted)))
+
+    start = time()
+    old = legacy_sort_paths(ecoords)
+    t_old = time()-start
+    print("linear search:  %7.2f s  %10.0f mm" % (t_old, rapid_travel(ecoords, old)))
+    print("grid hash:      %7.2f s  %10.0f mm  (%.0fx)" %
+          (t_new, rapid_travel(ecoords, new), t_old/t_new))
+    assert new == old
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
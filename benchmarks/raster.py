@@ -0,0 +1,107 @@
+"""Compare the NumPy scanline engine (band_scanlines, through
+legacy_raster.scanline_ecoords) with the old per-pixel loop.
+
+Run from the repository root:  python -m benchmarks.raster [width height]
+"""
+import sys
+from time import time
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.legacy_raster import scanline_ecoords
+from k40_web.laser_controller.convex_hull import hull2D
+
+
+def legacy_scanlines(image, Raster_step):
+    # the scanline loop make_raster_coords used before the NumPy engine
+    Reng_np = image.load()
+    wim, him = image.size
+    ecoords = []
+    hcoords = []
+    loop = 1
+    LENGTH = 0
+    n_scanlines = 0
+    my_hull = hull2D()
+    bignumber = 9999999
+    for i in range(0, him, Raster_step):
+        line = []
+        cnt = 1
+        LEFT = bignumber
+        RIGHT = -bignumber
+        for j in range(1, wim):
+            if (Reng_np[j, i] == Reng_np[j-1, i]):
+                cnt = cnt+1
+            else:
+                if Reng_np[j-1, i]:
+                    laser = "U"
+                else:
+                    laser = "D"
+                    LEFT = min(j-cnt, LEFT)
+                    RIGHT = max(j, RIGHT)
+                line.append((cnt, laser))
+                cnt = 1
+        if Reng_np[j-1, i] > 128:
+            laser = "U"
+        else:
+            laser = "D"
+            LEFT = min(j-cnt, LEFT)
+            RIGHT = max(j, RIGHT)
+        line.append((cnt, laser))
+        if LEFT != bignumber and RIGHT != -bignumber:
+            LENGTH = LENGTH + (RIGHT - LEFT)/1000.0
+            n_scanlines = n_scanlines + 1
+        y = (him-i)/1000.0
+        x = 0
+        if LEFT != bignumber:
+            hcoords.append([LEFT/1000.0, y])
+        if RIGHT != -bignumber:
+            hcoords.append([RIGHT/1000.0, y])
+        if hcoords != []:
+            hcoords = my_hull.convexHullecoords(hcoords)
+        for seg in line:
+            delta = seg[0]/1000.0
+            if seg[1] == "D":
+                loop = loop+1
+                ecoords.append([x, y, loop])
+                ecoords.append([x+delta, y, loop])
+            x = x + delta
+    return ecoords, LENGTH, n_scanlines, hcoords
+
+
+def test_image(width, height, seed=0):
+    # smooth blobs with a little noise, thresholded like a photo engrave
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:height, 0:width]
+    field = np.sin(xx/97.0) * np.cos(yy/61.0) + rng.normal(0, 0.05, (height, width))
+    return Image.fromarray(np.where(field > 0.2, 255, 0).astype(np.uint8)).convert("1")
+
+
+def main(width=4000, height=3000):
+    image = test_image(width, height)
+    Raster_step = 2
+
+    start = time()
+    ecoords, LENGTH, n_scanlines, hcoords = legacy_scanlines(image, Raster_step)
+    t_old = time()-start
+
+    start = time()
+    result = scanline_ecoords(image, Raster_step)
+    t_new = time()-start
+
+    new_ecoords, new_LENGTH, new_n_scanlines, new_hcoords = result
+    assert len(ecoords) == len(new_ecoords)
+    # the old loop accumulated x, the new code divides the column directly
+    assert all(a[1:] == b[1:] and abs(a[0]-b[0]) < 1e-9
+               for a, b in zip(ecoords, new_ecoords))
+    assert abs(LENGTH - new_LENGTH) < 1e-9
+    assert n_scanlines == new_n_scanlines
+    assert hcoords == new_hcoords
+
+    print("%dx%d image, %d runs" % (width, height, len(ecoords)//2))
+    print("legacy loop: %8.3f s" % t_old)
+    print("numpy:       %8.3f s  (%.1fx)" % (t_new, t_old/t_new))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:3]])
@@ -0,0 +1,102 @@
+"""Compare raster engraving from a bit-packed PackedRaster with the
+ecoords of scanline_ecoords: same points and EGV data, and the peak
+memory traced while the scanlines are made and encoded.
+
+Only allocations made through Python and NumPy are traced, the images
+held by PIL are not.
+
+Run from the repository root:  python -m benchmarks.raster_strips [width height]
+"""
+import sys
+import tracemalloc
+from time import time
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.legacy_raster import scanline_ecoords
+from k40_web.laser_controller.egv_pool import encode
+from k40_web.laser_controller.packed_raster import PackedRaster
+
+SETTINGS = dict(startX=0, startY=0, units="in", board_name="LASER-M2",
+                Rapid_Feed_Rate=0, use_laser=True, Feed=100)
+
+
+def grey_photo(width, height, seed=0, band=512):
+    # a photo-like grey level image, built in bands to keep memory low
+    rng = np.random.default_rng(seed)
+    x = np.arange(width, dtype=np.float32)
+    out = np.empty((height, width), dtype=np.uint8)
+    for y0 in range(0, height, band):
+        y = np.arange(y0, min(y0+band, height), dtype=np.float32)[:, None]
+        field = np.sin(x/397.0)*np.cos(y/261.0) + 0.5*np.sin((x+y)/53.0)
+        field += rng.normal(0, 0.3, field.shape).astype(np.float32)
+        out[y0:y0+band] = np.clip(field*80+128, 0, 255)
+    return Image.fromarray(out)
+
+
+def threshold(image):
+    # what make_raster_coords did before PackedRaster
+    return image.point(lambda x: 0 if x < 128 else 255, '1')
+
+
+def check():
+    for width, height in ((400, 700), (9, 600), (1, 3), (300, 0)):
+        image = grey_photo(width, height, 1)
+        for step in (1, 2, 3):
+            ecoords, *ext = scanline_ecoords(threshold(image), step)
+            raster, *packed_ext = PackedRaster.from_image(image, step)
+            assert packed_ext == ext
+            assert len(raster) == len(ecoords)
+            assert list(raster) == ecoords.tolist()
+            assert list(reversed(raster)) == list(reversed(ecoords))
+            assert np.array_equal(np.asarray(raster), np.asarray(ecoords.tolist()).reshape(-1, 3))
+            if not raster:
+                continue
+            for Raster_step in (-step, step):
+                for FlipXoffset in (0, 1.5):
+                    settings = dict(SETTINGS, Raster_step=Raster_step, FlipXoffset=FlipXoffset)
+                    assert encode(raster, settings) == encode(ecoords, settings)
+    image = grey_photo(50, 40, 2).convert("1")
+    assert PackedRaster.from_image(image, 1)[1:] == scanline_ecoords(image, 1)[1:]
+
+
+def measure(function, *args):
+    # timed without tracing, which slows down every allocation
+    start = time()
+    result = function(*args)
+    elapsed = time()-start
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def ecoords_job(image, settings):
+    ecoords = scanline_ecoords(threshold(image), 1)[0]
+    return encode(ecoords, settings)[0]
+
+
+def packed_job(image, settings):
+    raster = PackedRaster.from_image(image, 1)[0]
+    return encode(raster, settings)[0]
+
+
+def main(width=2000, height=1500):
+    check()
+    image = grey_photo(width, height)
+    settings = dict(SETTINGS, Raster_step=-1, FlipXoffset=0)
+    print("%dx%d image" % (width, height))
+
+    old, t_old, peak_old = measure(ecoords_job, image, settings)
+    new, t_new, peak_new = measure(packed_job, image, settings)
+    assert new == old
+    print("ecoords:       %7.2f s  %8.1f MB peak" % (t_old, peak_old/1e6))
+    print("PackedRaster:  %7.2f s  %8.1f MB peak  (%.0fx less)" %
+          (t_new, peak_new/1e6, peak_old/peak_new))
+    print("EGV data:      %9.1f MB" % (len(new)/1e6))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:3]])
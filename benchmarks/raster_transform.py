@@ -0,0 +1,88 @@
+"""Compare transform_raster with the separate negate, mirror and per-pixel
+rotate steps make_raster_coords used before, on a full bed 1000 dpi photo
+(325 x 220 mm).
+
+Run from the repository root:  python -m benchmarks.raster_transform [width height]
+"""
+import sys
+from time import time
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from benchmarks.raster_strips import grey_photo
+from k40_web.laser_controller.utils import transform_raster
+
+
+def legacy_rotate_raster(image_in):
+    # the loop make_raster_coords rotated images with before transform_raster
+    wim, him = image_in.size
+    im_rotated = Image.new("L", (him, wim), "white")
+
+    image_in_np = image_in.load()
+    im_rotated_np = im_rotated.load()
+
+    for i in range(1, him):
+        for j in range(1, wim):
+            im_rotated_np[i, wim-j] = image_in_np[j, i]
+    return im_rotated
+
+
+def legacy_transform(image, negate, mirror, rotate, scale_x=1.0, scale_y=1.0):
+    image = image.convert("L")
+    if negate:
+        image = ImageOps.invert(image)
+    if mirror:
+        image = ImageOps.mirror(image)
+    if rotate:
+        image = legacy_rotate_raster(image)
+    if scale_x != 1.0 or scale_y != 1.0:
+        wim, him = image.size
+        image = image.resize((int(wim*scale_x), int(him*scale_y)))
+    return image
+
+
+def check():
+    image = grey_photo(300, 200, 1)
+    for negate in (False, True):
+        for mirror in (False, True):
+            for rotate in (False, True):
+                old = np.asarray(legacy_transform(image, negate, mirror, rotate))
+                new = np.asarray(transform_raster(image, negate, mirror, rotate))
+                assert old.shape == new.shape
+                if rotate:
+                    # the old loop drew one row too low and left the first row and column white
+                    assert np.array_equal(old[1:, 1:], new[:-1, 1:])
+                    assert (old[0] == 255).all() and (old[:, 0] == 255).all()
+                else:
+                    assert np.array_equal(old, new)
+                # the preview rotated with Image.rotate
+                preview = image.convert("L")
+                if mirror:
+                    preview = ImageOps.mirror(preview)
+                if rotate:
+                    preview = preview.rotate(90, expand=True)
+                shown = np.asarray(transform_raster(image, False, mirror, rotate))
+                assert np.array_equal(np.asarray(preview), shown)
+    scaled = transform_raster(image, rotate=True, scale_x=0.5, scale_y=2.0)
+    assert scaled.size == legacy_transform(image, False, False, True, 0.5, 2.0).size
+
+
+def main(width=12795, height=8661):
+    check()
+    image = grey_photo(width, height)
+    print("%dx%d image, negated, mirrored and rotated" % (width, height))
+
+    start = time()
+    old = legacy_transform(image, True, True, True)
+    t_old = time()-start
+    start = time()
+    new = transform_raster(image, True, True, True)
+    t_new = time()-start
+    assert np.array_equal(np.asarray(old)[1:, 1:], np.asarray(new)[:-1, 1:])
+    print("separate steps, pixel loop: %7.2f s" % t_old)
+    print("transform_raster:           %7.2f s  (%.0fx)" % (t_new, t_old/t_new))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:3]])
@@ -0,0 +1,103 @@
+"""Compare SVG_READER on a sheet of tiled <use> clones with the XPath id
+lookup and the flattening of every clone it did before: same lines, and
+the time make_paths takes.
+
+Run from the repository root:  python -m benchmarks.svg_clones [n_clones]
+"""
+import math
+import os
+import sys
+import tempfile
+from time import time
+
+import numpy as np
+
+import k40_web.laser_controller.inkex as inkex
+from k40_web.laser_controller.svg_reader import SVG_READER
+
+
+class LegacyReader(SVG_READER):
+    # an XPath query per <use>, and every clone flattened where it is drawn
+    def getElementById(self, id):
+        return inkex.Effect.getElementById(self, id)
+
+    def add_clone_lines(self, refnode, mat):
+        self.groupmat.append(mat)
+        self.process_reference(refnode)
+        self.groupmat.pop()
+
+
+def part(index):
+    # a badge: a cut outline with rounded corners and an engraved ring and star
+    star = " ".join("%.3f,%.3f" % (10+6*math.cos(a)*(1 if k % 2 == 0 else 0.45),
+                                    10+6*math.sin(a)*(1 if k % 2 == 0 else 0.45))
+                    for k, a in enumerate(np.linspace(0, 2*math.pi, 10, endpoint=False)))
+    return ('<g id="part%d">'
+            '<rect x="0" y="0" width="20" height="20" rx="3" style="fill:none;stroke:#ff0000"/>'
+            '<circle cx="10" cy="10" r="8" style="fill:none;stroke:#0000ff"/>'
+            '<path d="M 4,10 C 4,2 16,2 16,10" style="fill:none;stroke:#0000ff"/>'
+            '<polygon points="%s" style="fill:none;stroke:#0000ff"/>'
+            '</g>' % (index, star))
+
+
+def tiled_sheet(n_clones, n_parts=2, scale=1.0):
+    columns = int(math.ceil(math.sqrt(n_clones)))
+    uses = []
+    for i in range(n_clones):
+        x, y = 22*(i % columns), 22*(i//columns)
+        transform = ' transform="scale(%g)"' % scale if scale != 1.0 else ""
+        uses.append('<use xlink:href="#part%d" x="%d" y="%d"%s/>' % (i % n_parts, x, y, transform))
+    size = 22*columns*scale
+    filler = "".join('<rect id="filler%d" x="0" y="0" width="1" height="1"/>' % i
+                     for i in range(n_clones))
+    return ('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+            'width="%gmm" height="%gmm" viewBox="0 0 %g %g">'
+            '<defs>%s%s</defs>%s</svg>' %
+            (size, size, size, size, "".join(part(i) for i in range(n_parts)), filler, "".join(uses)))
+
+
+def read(reader_class, filename):
+    reader = reader_class()
+    reader.parse_svg(filename)
+    start = time()
+    reader.make_paths()
+    return reader, time()-start
+
+
+def lines_of(reader):
+    return np.array([line[:4] for line in reader.lines]), [reader.Cut_Type[line[5]] for line in reader.lines]
+
+
+def check(tmp_dir):
+    filename = os.path.join(tmp_dir, "check.svg")
+    for scale in (1.0, 3.0, 0.5):
+        with open(filename, "w") as f:
+            f.write(tiled_sheet(30, scale=scale))
+        old, old_types = lines_of(read(LegacyReader, filename)[0])
+        new, new_types = lines_of(read(SVG_READER, filename)[0])
+        assert new_types == old_types
+        if scale == 1.0:
+            # only moved: flattened the same, up to rounding
+            assert new.shape == old.shape and np.allclose(new, old, atol=1e-9)
+        else:
+            assert abs(len(new)-len(old)) <= len(old)//10
+            assert np.allclose(new.min(axis=0), old.min(axis=0), atol=0.02)
+            assert np.allclose(new.max(axis=0), old.max(axis=0), atol=0.02)
+
+
+def main(n_clones=2000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        check(tmp_dir)
+        filename = os.path.join(tmp_dir, "sheet.svg")
+        with open(filename, "w") as f:
+            f.write(tiled_sheet(n_clones))
+        print("%d clones of 2 parts" % n_clones)
+        old, t_old = read(LegacyReader, filename)
+        new, t_new = read(SVG_READER, filename)
+        assert np.allclose(lines_of(new)[0], lines_of(old)[0], atol=1e-9)
+        print("XPath, every clone flattened: %7.2f s" % t_old)
+        print("id index, cached clones:      %7.2f s  (%.0fx)" % (t_new, t_old/t_new))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
@@ -0,0 +1,121 @@
+"""Compare loading an SVG without units the way Open_SVG did before (parse
+with a deep copy of the tree, make_paths, then parse again with the
+default size) with the single lean parse it does now: time and peak
+resident memory, each measured in a fresh process as lxml allocates
+outside of Python.
+
+Run from the repository root:  python -m benchmarks.svg_parse [n_elements]
+"""
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+from time import time
+
+import numpy as np
+
+from k40_web.laser_controller.filereader import Open_SVG
+from k40_web.laser_controller.svg_reader import SVG_PXPI_EXCEPTION, SVG_READER
+from k40_web.laser_controller.util_classes import SVG_Settings
+
+OPTIONS = SVG_Settings(inkscape_path="", ink_timeout=3, default_pxpi=96.0, default_viewbox=(0, 0, 500, 500))
+
+
+class Quiet:
+    def __getattr__(self, name):
+        return lambda *args: None
+
+
+class LegacyReader(SVG_READER):
+    # parse_svg before: the tree was copied into original_document
+    def parse_svg(self, filename):
+        self.parse(filename)
+
+
+def legacy_open(filename):
+    # the parses of Open_SVG before, for a file without units
+    svg_reader = LegacyReader()
+    try:
+        svg_reader.parse_svg(filename)
+        svg_reader.make_paths()
+    except SVG_PXPI_EXCEPTION:
+        svg_reader = LegacyReader()
+        svg_reader.parse_svg(filename)
+        svg_reader.set_size(OPTIONS.default_pxpi, OPTIONS.default_viewbox, 1.0)
+        svg_reader.make_paths()
+    return len(svg_reader.cut_lines)
+
+
+def lean_open(filename):
+    # the reader steps of Open_SVG now
+    svg_reader = SVG_READER()
+    svg_reader.parse_svg(filename)
+    try:
+        svg_reader.read_size()
+    except SVG_PXPI_EXCEPTION:
+        svg_reader.set_size(OPTIONS.default_pxpi, OPTIONS.default_viewbox, 1.0)
+    svg_reader.make_paths(txt2paths=svg_reader.has_coded_text())
+    return len(svg_reader.cut_lines)
+
+
+def drawing(n_elements):
+    # a unit-less drawing of many small elements, a few of them red to cut, as exported by some tools
+    rng = np.random.default_rng(0)
+    elements = []
+    for i in range(n_elements):
+        x, y = rng.uniform(0, 490, 2)
+        color = "#ff0000" if i % 100 == 0 else "#000000"
+        elements.append('<g id="g%d" class="part"><line x1="%.3f" y1="%.3f" x2="%.3f" y2="%.3f" '
+                        'style="fill:none;stroke:%s;stroke-width:0.1" id="l%d"/></g>' %
+                        (i, x, y, x+5, y+5, color, i))
+    return '<svg xmlns="http://www.w3.org/2000/svg">%s</svg>' % "".join(elements)
+
+
+def measure(function, filename, queue):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time()
+    result = function(filename)
+    elapsed = time()-start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    queue.put((result, elapsed, peak*1024))
+
+
+def run(function, filename):
+    # in a fresh process, so the peak is that of this load only
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=measure, args=(function, filename, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def check(tmp_dir):
+    filename = os.path.join(tmp_dir, "check.svg")
+    with open(filename, "w") as f:
+        f.write(drawing(20))
+    reader = SVG_READER()
+    reader.parse_svg(filename)
+    assert reader.original_document is None
+    assert legacy_open(filename) == lean_open(filename) > 0
+    design = Open_SVG(filename, 1.0, OPTIONS, Quiet())
+    assert len(design.VcutData.ecoords) > 0
+
+
+def main(n_elements=200000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        check(tmp_dir)
+        filename = os.path.join(tmp_dir, "drawing.svg")
+        with open(filename, "w") as f:
+            f.write(drawing(n_elements))
+        print("%d elements, %.1f MB file" % (n_elements, os.path.getsize(filename)/1e6))
+        old, t_old, peak_old = run(legacy_open, filename)
+        new, t_new, peak_new = run(lean_open, filename)
+        assert new == old
+        print("two parses, copied tree: %7.2f s  %7.1f MB peak" % (t_old, peak_old/1e6))
+        print("one lean parse:          %7.2f s  %7.1f MB peak" % (t_new, peak_new/1e6))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
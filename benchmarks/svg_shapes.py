@@ -0,0 +1,161 @@
+"""Compare the direct outlines of SVG basic shapes in SVG_READER with the
+path data round trip it made before (format, parse as cubic Beziers,
+subdivide): same lines for straight edges, arcs within the flatness, and
+the time make_paths takes on a CAD-like export of large polygons.
+
+Run from the repository root:  python -m benchmarks.svg_shapes [n_points]
+"""
+import math
+import os
+import sys
+import tempfile
+from time import time
+
+import numpy as np
+from lxml import etree
+
+import k40_web.laser_controller.inkex as inkex
+from k40_web.laser_controller.svg_reader import SVG_READER
+
+
+def legacy_path_data(node):
+    # the path data process_shape wrote for the basic shapes before
+    tag = node.tag.split('}')[-1]
+    if tag == 'rect':
+        x = float(node.get('x') or 0.0)
+        y = float(node.get('y') or 0.0)
+        width = float(node.get('width'))
+        height = float(node.get('height'))
+        rx = float(node.get('rx') or 0.0)
+        ry = float(node.get('ry') or 0.0)
+        if max(rx, ry) > 0.0:
+            if rx == 0.0 or ry == 0.0:
+                rx = max(rx, ry)
+                ry = rx
+            rx = min(rx, abs(width)/2.0)
+            ry = min(ry, abs(height)/2.0)
+            L1 = "M %f,%f %f,%f " % (x+rx, y, x+width-rx, y)
+            C1 = "A %f,%f 0 0 1 %f,%f" % (rx, ry, x+width, y+ry)
+            L2 = "M %f,%f %f,%f " % (x+width, y+ry, x+width, y+height-ry)
+            C2 = "A %f,%f 0 0 1 %f,%f" % (rx, ry, x+width-rx, y+height)
+            L3 = "M %f,%f %f,%f " % (x+width-rx, y+height, x+rx, y+height)
+            C3 = "A %f,%f 0 0 1 %f,%f" % (rx, ry, x, y+height-ry)
+            L4 = "M %f,%f %f,%f " % (x, y+height-ry, x, y+ry)
+            C4 = "A %f,%f 0 0 1 %f,%f" % (rx, ry, x+rx, y)
+            return L1 + C1 + L2 + C2 + L3 + C3 + L4 + C4
+        return "M %f,%f %f,%f %f,%f %f,%f Z" % (x, y, x+width, y, x+width, y+height, x, y+height)
+    if tag in ('circle', 'ellipse'):
+        cx = float(node.get('cx') or 0.0)
+        cy = float(node.get('cy') or 0.0)
+        rx = ry = float(node.get('r') or 0.0)
+        rx = float(node.get('rx') or rx)
+        ry = float(node.get('ry') or ry)
+        return "M %f,%f A   %f,%f 0 0 1 %f,%f   %f,%f 0 0 1 %f,%f   %f,%f 0 0 1 %f,%f   %f,%f 0 0 1 %f,%f Z" % (
+            cx+rx, cy, rx, ry, cx, cy+ry, rx, ry, cx-rx, cy, rx, ry, cx, cy-ry, rx, ry, cx+rx, cy)
+    if tag in ('polygon', 'polyline'):
+        points = node.get('points').replace(',', ' ')
+        while points.find('  ') > -1:
+            points = points.replace('  ', ' ')
+        points = points.strip().split(" ")
+        d = "M "
+        for i in range(0, len(points), 2):
+            d = d + "%f,%f " % (float(points[i]), float(points[i+1]))
+        if tag == 'polygon':
+            d = d + "Z"
+        return d
+    if tag == 'line':
+        return "M %f,%f %f,%f" % tuple(float(node.get(a)) for a in ('x1', 'y1', 'x2', 'y2'))
+
+
+class LegacyReader(SVG_READER):
+    # basic shapes go through path data, as process_shape did before
+    def process_shape(self, node, mat, group_stroke=None):
+        d = legacy_path_data(node)
+        if d is not None:
+            path = etree.Element(inkex.addNS('path', 'svg'), dict(node.attrib))
+            path.set('d', d)
+            node = path
+        return SVG_READER.process_shape(self, node, mat, group_stroke)
+
+
+def svg(body, size=200):
+    return ('<svg xmlns="http://www.w3.org/2000/svg" width="%dmm" height="%dmm" viewBox="0 0 %d %d">'
+            '%s</svg>' % (size, size, size, size, body))
+
+
+def cad_export(n_points, n_polygons=50, seed=0):
+    # outlines of parts as long polygons and polylines with many short edges
+    rng = np.random.default_rng(seed)
+    body = []
+    per_polygon = n_points//n_polygons
+    for k in range(n_polygons):
+        t = np.linspace(0, 2*math.pi, per_polygon, endpoint=False)
+        r = 20 + 3*np.sin(7*t) + rng.uniform(0, 0.2, per_polygon)
+        cx, cy = rng.uniform(25, 175, 2)
+        points = " ".join("%.4f,%.4f" % p for p in zip(cx + r*np.cos(t), cy + r*np.sin(t)))
+        tag = 'polygon' if k % 2 == 0 else 'polyline'
+        body.append('<%s points="%s" style="fill:none;stroke:#ff0000"/>' % (tag, points))
+    return svg("".join(body))
+
+
+SHAPES = ('<rect x="10" y="10" width="50" height="30" style="fill:none;stroke:#ff0000"/>'
+          '<rect x="70" y="10" width="50" height="30" rx="8" ry="5" style="fill:none;stroke:#ff0000"/>'
+          '<circle cx="50" cy="100" r="30" style="fill:none;stroke:#0000ff"/>'
+          '<ellipse cx="130" cy="100" rx="40" ry="12" transform="rotate(30 130 100)" style="fill:none;stroke:#0000ff"/>'
+          '<polyline points="10,150 40,190 70,150" style="fill:none;stroke:#ff0000"/>'
+          '<polygon points="100,150 130,190 160,150" style="fill:none;stroke:#0000ff"/>'
+          '<line x1="170" y1="150" x2="190" y2="190" style="stroke:#ff0000"/>')
+
+
+def read(reader_class, filename):
+    reader = reader_class()
+    reader.parse_svg(filename)
+    start = time()
+    reader.make_paths()
+    return reader, time()-start
+
+
+def lines_by_id(reader):
+    shapes = {}
+    for line in reader.lines:
+        shapes.setdefault(line[5], []).append(line[:4])
+    return [np.array(lines) for lines in shapes.values()]
+
+
+def check(tmp_dir):
+    filename = os.path.join(tmp_dir, "shapes.svg")
+    with open(filename, "w") as f:
+        f.write(svg(SHAPES))
+    old = lines_by_id(read(LegacyReader, filename)[0])
+    new = lines_by_id(read(SVG_READER, filename)[0])
+    assert len(old) == len(new) == 7
+    for k in (0, 4, 5, 6):
+        # straight edges: the same lines, up to the six decimals of the path data
+        assert old[k].shape == new[k].shape and np.allclose(old[k], new[k], atol=1e-5)
+    # the circle, y flipped to the 200 mm page: vertices on it, chords within the flatness
+    center = np.array([50, 200-100])
+    vertices = np.linalg.norm(new[2][:, :2] - center, axis=1)
+    middles = np.linalg.norm((new[2][:, :2] + new[2][:, 2:])/2 - center, axis=1)
+    assert np.allclose(vertices, 30)
+    assert (30 - middles).max() <= SVG_READER().flatness
+    for k in (1, 2, 3):
+        assert np.allclose(new[k].min(axis=0), old[k].min(axis=0), atol=0.02)
+        assert np.allclose(new[k].max(axis=0), old[k].max(axis=0), atol=0.02)
+
+
+def main(n_points=200000):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        check(tmp_dir)
+        filename = os.path.join(tmp_dir, "export.svg")
+        with open(filename, "w") as f:
+            f.write(cad_export(n_points))
+        print("%d polygon points" % n_points)
+        old, t_old = read(LegacyReader, filename)
+        new, t_new = read(SVG_READER, filename)
+        assert np.allclose(np.array([l[:4] for l in old.lines]), np.array([l[:4] for l in new.lines]), atol=1e-5)
+        print("path data round trip: %7.2f s" % t_old)
+        print("direct outlines:      %7.2f s  (%.0fx)" % (t_new, t_old/t_new))
+
+
+if __name__ == "__main__":
+    main(*[int(v) for v in sys.argv[1:2]])
@@ -0,0 +1,70 @@
+"""Send representative EGV jobs to the simulated Nano board and report
+packets per second and time to first packet.
+
+Run from the repository root:  python -m benchmarks.usb [latency_us]
+"""
+import math
+import random
+import sys
+from time import perf_counter
+
+from benchmarks.legacy_raster import scanline_ecoords
+from benchmarks.raster import test_image
+from k40_web.laser_controller.egv import egv
+from k40_web.laser_controller.fake_nano import FakeNano
+from k40_web.laser_controller.nano_library import K40_CLASS
+from k40_web.laser_controller.reporter import Reporter
+
+
+def vector_job(n_loops=100, seed=0):
+    # small polygons scattered over the bed, in inches
+    rng = random.Random(seed)
+    ecoords = []
+    for loop in range(1, n_loops+1):
+        cx, cy = rng.uniform(0.5, 12), rng.uniform(0.5, 8)
+        r = rng.uniform(0.05, 0.3)
+        n = rng.randrange(3, 24)
+        for k in range(n+1):
+            a = 2*math.pi*k/n
+            ecoords.append([cx+r*math.cos(a), cy+r*math.sin(a), loop])
+    egv_inst = egv()
+    egv_inst.make_egv_data(ecoords, units='in', Feed=20)
+    return egv_inst.data
+
+
+def raster_job(width=1000, height=400):
+    ecoords = scanline_ecoords(test_image(width, height), 2)[0]
+    egv_inst = egv()
+    egv_inst.make_egv_data(ecoords, units='in', Feed=100, Raster_step=2)
+    return egv_inst.data
+
+
+def run(data, latency, adaptive, preprocess_crc, passes=1):
+    board = FakeNano(buffer_depth=8, latency=latency, packet_time=4*latency,
+                     crc_error_rate=0.001, timeout_rate=0.0005, realtime=True)
+    k40 = K40_CLASS()
+    k40.attach_device(board)
+    k40.set_adaptive_polling(adaptive)
+    start = perf_counter()
+    k40.send_data(data, Reporter, None, passes, preprocess_crc, True)
+    elapsed = perf_counter()-start
+    assert board.n_packets == k40.stats["packets"]
+    return board.n_packets/elapsed, board.first_packet_time-start, k40.stats
+
+
+def main(latency_us=100):
+    latency = latency_us*1e-6
+    jobs = [("vector", vector_job()), ("raster", raster_job())]
+    for name, data in jobs:
+        print("%s job: %d bytes" % (name, len(data)))
+        for adaptive in (False, True):
+            for preprocess_crc in (True, False):
+                pps, ttfb, stats = run(data, latency, adaptive, preprocess_crc)
+                print("  adaptive=%-5s pre_pr_crc=%-5s %8.0f packets/s  "
+                      "first packet %6.2f ms  %.2f hellos/packet  %d retries" %
+                      (adaptive, preprocess_crc, pps, 1000*ttfb,
+                       stats["hellos"]/stats["packets"], stats["retries"]))
+
+
+if __name__ == "__main__":
+    main(*[float(v) for v in sys.argv[1:2]])
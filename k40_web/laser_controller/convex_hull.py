@@ -2,6 +2,49 @@
 2D Convex Hull Code from Wikibooks
 https://en.wikibooks.org/wiki/Algorithm_Implementation/Geometry/Convex_hull/Monotone_chain
 """
+import numpy as np
+
+
+def interior_mask(points):
+    """Mask of the points strictly inside the polygon of the extreme points.
+
+    Those cannot be vertices of the hull (Akl-Toussaint), which leaves the
+    monotone chain only the points near the outline to go through. The
+    extreme points in the eight directions lie on the hull in this order
+    whichever of several equal points argmin and argmax pick.
+    """
+    x, y = points[:, 0], points[:, 1]
+    extremes = [np.argmin(x), np.argmin(x+y), np.argmin(y), np.argmax(x-y),
+                np.argmax(x), np.argmax(x+y), np.argmax(y), np.argmin(x-y)]
+    corners = list(dict.fromkeys(int(i) for i in extremes))
+    inside = np.ones(len(points), dtype=bool)
+    if len(corners) < 3:
+        inside[:] = False
+        return inside
+    # the extremes go around counter-clockwise
+    for a, b in zip(corners, corners[1:] + corners[:1]):
+        ax, ay = points[a]
+        bx, by = points[b]
+        inside &= (bx-ax)*(y-ay) - (by-ay)*(x-ax) > 0
+    return inside
+
+
+def convex_hull_ecoords(x, y):
+    """Closed loop around the convex hull of points given as x and y arrays.
+
+    Returns the same [x, y, 1] vertices as hull2D.convexHullecoords.
+    """
+    points = np.column_stack((x, y)).astype(np.float64)
+    if len(points) > 8:
+        points = points[~interior_mask(points)]
+    # sorted and unique, as the monotone chain needs them
+    points = points[np.lexsort((points[:, 1], points[:, 0]))]
+    new = np.ones(len(points), dtype=bool)
+    new[1:] = (points[1:] != points[:-1]).any(axis=1)
+    hull_data = hull2D().monotone_chain([tuple(p) for p in points[new].tolist()])
+    ecoords = [[px, py, 1] for px, py in hull_data]
+    ecoords.append(ecoords[0])
+    return ecoords
 
 
 class hull2D:
@@ -17,8 +60,10 @@ class hull2D:
 
         # Sort the points lexicographically (tuples are compared lexicographically).
         # Remove duplicates to detect the case we have just one unique point.
-        points = sorted(set(points))
+        return self.monotone_chain(sorted(set(points)))
 
+    def monotone_chain(self, points):
+        """convex_hull of points that are already sorted and unique."""
         # Boring case: no points or a single point, possibly repeated multiple times.
         if len(points) <= 1:
             return points
@@ -48,16 +93,8 @@ class hull2D:
         return lower[:-1] + upper[:-1]
 
     def convexHullecoords(self, ecoords):
-        p = []
-        for line in ecoords:
-            p.append((line[0], line[1]))
-
-        hull_data = self.convex_hull(p)
-        ecoords = []
-        for i in range(0, len(hull_data)):
-            ecoords.append([hull_data[i][0], hull_data[i][1], 1])
-        ecoords.append(ecoords[0])
-        return ecoords
+        points = np.asarray([(line[0], line[1]) for line in ecoords], dtype=np.float64)
+        return convex_hull_ecoords(points[:, 0], points[:, 1])
 
     ######################################################################
 
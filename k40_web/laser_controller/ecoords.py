@@ -16,6 +16,117 @@
 
 """
 from math import *
+import hashlib
+import numpy as np
+
+
+ECOORD_DTYPE = np.dtype([("x", np.float64), ("y", np.float64), ("loop", np.int64)])
+# g-code ecoords carry the feed rate and spindle state of every point
+GCODE_ECOORD_DTYPE = np.dtype(ECOORD_DTYPE.descr +
+                              [("feed", np.float64), ("spindle", np.float64)])
+
+
+class EcoordArray:
+    """ecoords stored in a contiguous NumPy structured array.
+
+    Behaves like the old list of [x, y, loop(, feed, spindle)] lists for
+    reading: iteration and comparison with lists use rows as lists. A row
+    taken by index is a tuple, so writing to it fails instead of changing
+    a copy; whole rows are assigned with ecoords[i] = row. Bulk operations
+    should use the x, y and loop columns instead.
+    """
+    chunk_size = 65536
+
+    def __init__(self, data=None):
+        if data is None:
+            data = np.zeros(0, dtype=ECOORD_DTYPE)
+        self.data = data
+
+    @classmethod
+    def from_columns(cls, x, y, loop, feed=None, spindle=None):
+        dtype = ECOORD_DTYPE if feed is None else GCODE_ECOORD_DTYPE
+        data = np.empty(len(x), dtype=dtype)
+        data["x"] = x
+        data["y"] = y
+        data["loop"] = loop
+        if feed is not None:
+            data["feed"] = feed
+            data["spindle"] = spindle
+        return cls(data)
+
+    @classmethod
+    def from_coords(cls, coords):
+        if isinstance(coords, EcoordArray):
+            return coords
+        if len(coords) == 0:
+            return cls()
+        values = np.asarray(coords, dtype=np.float64)
+        if values.ndim != 2 or values.shape[1] not in (3, 5):
+            raise ValueError("ecoords need 3 or 5 values per point, got shape %s" % (values.shape,))
+        return cls.from_columns(*(values[:, i] for i in range(values.shape[1])))
+
+    @property
+    def x(self):
+        return self.data["x"]
+
+    @property
+    def y(self):
+        return self.data["y"]
+
+    @property
+    def loop(self):
+        return self.data["loop"]
+
+    @property
+    def has_feed(self):
+        return "feed" in self.data.dtype.names
+
+    def tolist(self):
+        return [list(row) for row in self.data.tolist()]
+
+    def copy(self):
+        return EcoordArray(self.data.copy())
+
+    def update_hash(self, h):
+        h.update(self.data.dtype.str.encode())
+        h.update(self.data.tobytes())
+
+    def __len__(self):
+        return len(self.data)
+
+    def __bool__(self):
+        return len(self.data) > 0
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return EcoordArray(self.data[index])
+        return self.data[index].item()
+
+    def __setitem__(self, index, row):
+        self.data[index] = tuple(row)
+
+    def __iter__(self):
+        # convert in chunks so iterating never builds the whole list at once
+        for start in range(0, len(self.data), self.chunk_size):
+            for row in self.data[start:start+self.chunk_size].tolist():
+                yield list(row)
+
+    def __reversed__(self):
+        for stop in range(len(self.data), 0, -self.chunk_size):
+            for row in reversed(self.data[max(stop-self.chunk_size, 0):stop].tolist()):
+                yield list(row)
+
+    def __eq__(self, other):
+        if isinstance(other, EcoordArray):
+            return np.array_equal(self.data, other.data)
+        if len(other) != len(self.data):
+            return False
+        return self.tolist() == [list(row) for row in other]
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "EcoordArray(%d points)" % len(self.data)
 
 
 class ECoord:
@@ -27,7 +138,7 @@ class ECoord:
         self.reset_path()
 
     def reset_path(self):
-        self.ecoords = []
+        self.ecoords = EcoordArray()
         self.len = None
         self.move = 0
         self.sorted = False
@@ -36,95 +147,90 @@ class ECoord:
         self.gcode_time = 0
         self.hull_coords = []
         self.n_scanlines = 0
+        self._content_hash = None
 
     def make_ecoords(self, coords, scale=1):
         self.reset()
         self.len = 0
         self.move = 0
 
-        xmax, ymax = -1e10, -1e10
-        xmin, ymin = 1e10,  1e10
-        self.ecoords = []
+        if len(coords) == 0:
+            self.bounds = (1e10, -1e10, 1e10, -1e10)
+            return
+        lines = np.asarray(coords, dtype=np.float64)[:, :4]*scale
+        x1, y1, x2, y2 = lines.T
+
         Acc = .001
-        oldx = oldy = -99990.0
-        first_stroke = True
-        loop = 0
-        for line in coords:
-            XY = line
-            x1 = XY[0]*scale
-            y1 = XY[1]*scale
-            x2 = XY[2]*scale
-            y2 = XY[3]*scale
-            dxline = x2-x1
-            dyline = y2-y1
-            len_line = sqrt(dxline*dxline + dyline*dyline)
-
-            dx = oldx - x1
-            dy = oldy - y1
-            dist = sqrt(dx*dx + dy*dy)
-            # check and see if we need to move to a new discontinuous start point
-            if (dist > Acc) or first_stroke:
-                loop = loop+1
-                self.ecoords.append([x1, y1, loop])
-                if not first_stroke:
-                    self.move = self.move + dist
-                first_stroke = False
-
-            self.len = self.len + len_line
-            self.ecoords.append([x2, y2, loop])
-            oldx, oldy = x2, y2
-            xmax = max(xmax, x1, x2)
-            ymax = max(ymax, y1, y2)
-            xmin = min(xmin, x1, x2)
-            ymin = min(ymin, y1, y2)
-        self.bounds = (xmin, xmax, ymin, ymax)
-
-    def set_ecoords(self, ecoords, data_sorted=False):
-        self.ecoords = ecoords
+        # distance from the end of the previous line to the start of this one
+        dist = np.hypot(x1[1:]-x2[:-1], y1[1:]-y2[:-1])
+        # check and see if we need to move to a new discontinuous start point
+        new_loop = np.concatenate(([True], dist > Acc))
+        loop = np.cumsum(new_loop)
+
+        # every line adds its end point, plus its start point if it begins a loop
+        end = np.cumsum(new_loop + 1) - 1
+        start = end[new_loop] - 1
+        npoints = end[-1] + 1
+        x = np.empty(npoints)
+        y = np.empty(npoints)
+        loops = np.empty(npoints, dtype=np.int64)
+        x[start], y[start], loops[start] = x1[new_loop], y1[new_loop], loop[new_loop]
+        x[end], y[end], loops[end] = x2, y2, loop
+        self.ecoords = EcoordArray.from_columns(x, y, loops)
+
+        self.len = float(np.sum(np.hypot(x2-x1, y2-y1)))
+        self.move = float(np.sum(dist[new_loop[1:]]))
+        self.bounds = (float(min(x1.min(), x2.min())), float(max(x1.max(), x2.max())),
+                       float(min(y1.min(), y2.min())), float(max(y1.max(), y2.max())))
+
+    def set_ecoords(self, ecoords, data_sorted=False, content_hash=None):
+        # content_hash can be passed on when ecoords only re-orders the
+        # paths that were hashed, so the design keeps its identity
+        self.ecoords = EcoordArray.from_coords(ecoords)
         self.computeEcoordsLen()
-        self.data_sorted = data_sorted
+        self.sorted = data_sorted
+        self._content_hash = content_hash
+
+    def set_raster(self, raster):
+        # raster ecoords stay bit-packed, see packed_raster.PackedRaster
+        self.ecoords = raster
+        self.sorted = True
+        self._content_hash = None
+
+    def content_hash(self):
+        if self._content_hash is None:
+            h = hashlib.sha256()
+            self.ecoords.update_hash(h)
+            self._content_hash = h.hexdigest()
+        return self._content_hash
 
     def set_image(self, PIL_image):
         self.image = PIL_image
         self.reset_path()
 
     def computeEcoordsLen(self):
-        xmax, ymax = -1e10, -1e10
-        xmin, ymin = 1e10,  1e10
-
-        if self.ecoords == []:
+        if len(self.ecoords) == 0:
+            self.len = 0
+            return
+        # segments are measured from the second point on, as they always were
+        x = self.ecoords.x[1:]
+        y = self.ecoords.y[1:]
+        loop = self.ecoords.loop[1:]
+        if len(x) < 2:
+            self.bounds = (1e10, -1e10, 1e10, -1e10)
             self.len = 0
+            self.move = 0
+            self.gcode_time = 0
             return
-        on = 0
-        move = 0
+
+        dist = np.hypot(np.diff(x), np.diff(y))
+        on = loop[1:] == loop[:-1]
+
         time = 0
-        for i in range(2, len(self.ecoords)):
-            x1 = self.ecoords[i-1][0]
-            y1 = self.ecoords[i-1][1]
-            x2 = self.ecoords[i][0]
-            y2 = self.ecoords[i][1]
-            loop = self.ecoords[i][2]
-            loop_last = self.ecoords[i-1][2]
-
-            xmax = max(xmax, x1, x2)
-            ymax = max(ymax, y1, y2)
-            xmin = min(xmin, x1, x2)
-            ymin = min(ymin, y1, y2)
-
-            dx = x2-x1
-            dy = y2-y1
-            dist = sqrt(dx*dx + dy*dy)
-
-            if len(self.ecoords[i]) > 3:
-                feed = self.ecoords[i][3]
-                time = time + dist/feed*60
-
-            if loop == loop_last:
-                on = on + dist
-            else:
-                move = move + dist
-
-        self.bounds = (xmin, xmax, ymin, ymax)
-        self.len = on
-        self.move = move
+        if self.ecoords.has_feed:
+            time = float(np.sum(dist/self.ecoords.data["feed"][2:]*60))
+
+        self.bounds = (float(x.min()), float(x.max()), float(y.min()), float(y.max()))
+        self.len = float(np.sum(dist[on]))
+        self.move = float(np.sum(dist[~on]))
         self.gcode_time = time
@@ -23,13 +23,26 @@ import sys
 from k40_web.laser_controller.reporter import Reporter
 from math import *
 from time import time
+from itertools import chain, islice
+import numpy as np
+from k40_web.laser_controller.packed_raster import PackedRaster
 from k40_web.laser_controller.LaserSpeed import LaserSpeed
 
 ##############################################################################
 
 
+# make_distance results for the short moves of line runs
+DISTANCE_CODES = {}
+DIRECTION_CODES = {code: bytes([code]) for code in (66, 84, 76, 82, 77)}
+
+
 class egv:
-    def __init__(self, target=lambda s: sys.stdout.write(s)):
+    def __init__(self, target=None):
+        # without a target the codes are collected in self.data, one byte each
+        self.data = bytearray()
+        if target is None:
+            target = self.data.append
+            self.write_codes = self.data.extend
         self.write = target
         self.Modal_dir = 0
         self.Modal_dist = 0
@@ -53,6 +66,10 @@ class egv:
         # V is the start of 7 digits indicating the feed rate 255 255 1
         # CUT_TYPE cutting/marking, Engraving=G followed by the raster step in thousandths of an inch
 
+    def write_codes(self, codes):
+        for code in codes:
+            self.write(code)
+
     def move(self, direction, distance, laser_on=False, angle_dirs=None):
 
         if angle_dirs == None:
@@ -147,6 +164,14 @@ class egv:
                 "Error in EGV make_distance_in(): dist_milsA=", dist_milsA)
         return code
 
+    def distance_code(self, dist_mils):
+        code = DISTANCE_CODES.get(dist_mils)
+        if code is None:
+            code = bytes(self.make_distance(dist_mils))
+            if dist_mils < 1000:
+                DISTANCE_CODES[dist_mils] = code
+        return code
+
     def make_dir_dist(self, dxmils, dymils, laser_on=False):
         adx = abs(dxmils)
         ady = abs(dymils)
@@ -185,51 +210,62 @@ class egv:
             self.move(self.ANGLE, abs(dxmils), laser_on=Spindle,
                       angle_dirs=[XCODE, YCODE])
         else:
-            h = []
             if adx > ady:
                 slope = ady/adx
                 n = int(abs(dxmils))
+                m = int(abs(dymils))
                 CODE = XCODE
-                CODE1 = YCODE
             else:
                 slope = adx/ady
                 n = int(abs(dymils))
+                m = int(abs(dxmils))
                 CODE = YCODE
-                CODE1 = XCODE
-
-            for i in range(1, n+1):
-                h.append(round(i*slope, 0))
-
-            Lh = 0.0
-            d1 = 0.0
-            d2 = 0.0
-            d1cnt = 0.0
-            d2cnt = 0.0
-            for i in range(len(h)):
-                if h[i] == Lh:
-                    d1 = d1+1
-                    if d2 > 0.0:
-                        self.move(self.ANGLE, d2, laser_on=Spindle,
-                                  angle_dirs=[XCODE, YCODE])
-                        d2cnt = d2cnt+d2
-                        d2 = 0.0
+
+            # Step i (1..n) along the major axis is diagonal where
+            # round(i*slope) goes up. The first i where it reaches k is about
+            # (k-1/2)/slope; start from the exact integer value and move by
+            # one where the float rounding lands on the other side.
+            k = np.arange(1, int(round(n*slope, 0))+1)
+            steps = ((2*k-1)*n + 2*m - 1)//(2*m)
+            while True:
+                early = (steps > 1) & (np.round((steps-1)*slope) >= k)
+                late = np.round(steps*slope) < k
+                if not (early.any() or late.any()):
+                    break
+                steps = steps - early + late
+            steps = np.unique(steps)
+
+            # straight steps before every diagonal step, grouped into runs
+            # of alternating straight and diagonal moves
+            straight = np.diff(steps, prepend=0) - 1
+            runs = np.flatnonzero(np.concatenate(([True], straight[1:] > 0)))
+            run_len = np.diff(np.append(runs, len(steps)))
+            dists = np.stack((straight[runs], run_len), axis=1).ravel()
+            dirs = np.tile([CODE, self.ANGLE], len(runs))
+            tail = n - int(steps[-1])
+            if tail > 0:
+                dists = np.append(dists, tail)
+                dirs = np.append(dirs, CODE)
+            keep = dists > 0
+            dists = dists[keep].tolist()
+            dirs = dirs[keep].tolist()
+
+            # after the first two moves the laser state and angle directions
+            # are set and every further move just flushes the one before it
+            for direction, dist in zip(dirs[:2], dists[:2]):
+                if direction == self.ANGLE:
+                    self.move(direction, dist, laser_on=Spindle,
+                              angle_dirs=[XCODE, YCODE])
                 else:
-                    d2 = d2+1
-                    if d1 > 0.0:
-                        self.move(CODE, d1, laser_on=Spindle)
-                        d1cnt = d1cnt+d1
-                        d1 = 0.0
-                Lh = h[i]
-
-            if d1 > 0.0:
-                self.move(CODE, d1, laser_on=Spindle)
-                d1cnt = d1cnt+d1
-                d1 = 0.0
-            if d2 > 0.0:
-                self.move(self.ANGLE, d2, laser_on=Spindle,
-                          angle_dirs=[XCODE, YCODE])
-                d2cnt = d2cnt+d2
-                d2 = 0.0
+                    self.move(direction, dist, laser_on=Spindle)
+            if len(dists) > 2:
+                self.write_codes(b"".join(
+                    [DIRECTION_CODES[direction] + self.distance_code(dist)
+                     for direction, dist in zip(dirs[1:-1], dists[1:-1])]))
+                self.Modal_dir = dirs[-1]
+                self.Modal_dist = dists[-1]
+            d2cnt = len(steps)
+            d1cnt = n - d2cnt
 
             DX = d2cnt
             DY = (d1cnt+d2cnt)
@@ -270,6 +306,33 @@ class egv:
         e2 = ecoords_adj_in[2]
         return e0, e1, e2
 
+    def group_scanlines(self, ecoords_in, Raster_step, FlipXoffset, reporter):
+        # group raster ecoords into scanlines in the order they are engraved
+        scanline = []
+        scanline_y = None
+        if Raster_step < 0.0:
+            ecoords_iter = iter(ecoords_in)
+        else:
+            ecoords_iter = reversed(ecoords_in)
+        timestamp = 0
+        for i, ecoord in enumerate(ecoords_iter):
+            # if i%1000 == 0:
+            stamp = int(3*time())  # update every 1/3 of a second
+            if (stamp != timestamp):
+                timestamp = stamp  # interlock
+                reporter.status("Preprocessing Raster Data: %.1f%%" %
+                           (100.0*float(i)/float(len(ecoords_in))))
+            y = ecoord[1]
+            if y != scanline_y:
+                scanline.append([ecoord])
+                scanline_y = y
+            else:
+                if bool(FlipXoffset) ^ bool(Raster_step > 0.0):  # ^ is bitwise XOR
+                    scanline[-1].insert(0, ecoord)
+                else:
+                    scanline[-1].append(ecoord)
+        return scanline
+
     def make_egv_data(self, ecoords_in,
                       startX=0,
                       startY=0,
@@ -345,14 +408,14 @@ class egv:
                 self.rapid_move_slow(
                     lastx-startX, lasty-startY, Rapid_Feed_Rate, Feed, board_name)
             timestamp = 0
-            for i in range(1, len(ecoords_in)):
-                e0, e1, e2 = self.ecoord_adj(ecoords_in[i], scale, FlipXoffset)
+            for i, ecoord in enumerate(islice(ecoords_in, 1, None), 1):
+                e0, e1, e2 = self.ecoord_adj(ecoord, scale, FlipXoffset)
                 stamp = int(3*time())  # update every 1/3 of a second
                 if (stamp != timestamp):
                     timestamp = stamp  # interlock
                     reporter.status("Generating EGV Data: %.1f%%" %
                                (100.0*float(i)/float(len(ecoords_in))))
-                    if stop_calc == True:
+                    if stop_calc:
                         reporter.information("Action Stopped by User.")
                         return
 
@@ -368,8 +431,8 @@ class egv:
                     if laser:
                         if variable_feed_scale != None:
                             Feed_current = round(
-                                ecoords_in[i][3]*variable_feed_scale, 2)
-                            Spindle = ecoords_in[i][4] > 0 and use_laser
+                                ecoord[3]*variable_feed_scale, 2)
+                            Spindle = ecoord[4] > 0 and use_laser
                             if Feed != Feed_current:
                                 Feed = Feed_current
                                 self.flush()
@@ -402,33 +465,20 @@ class egv:
             ###########################################################
             Rapid_flag = True
             ###################################################
-            scanline = []
-            scanline_y = None
-            if Raster_step < 0.0:
-                irange = list(range(len(ecoords_in)))
+            if isinstance(ecoords_in, PackedRaster):
+                # scanlines are unpacked a strip at a time while they are encoded
+                scanlines = ecoords_in.scanlines(bottom_up=Raster_step > 0.0,
+                                                 reverse_x=bool(FlipXoffset))
+                n_scanlines = ecoords_in.n_scanlines
             else:
-                irange = list(range(len(ecoords_in)-1, -1, -1))
-            timestamp = 0
-            for i in irange:
-                # if i%1000 == 0:
-                stamp = int(3*time())  # update every 1/3 of a second
-                if (stamp != timestamp):
-                    timestamp = stamp  # interlock
-                    reporter("Preprocessing Raster Data: %.1f%%" %
-                               (100.0*float(i)/float(len(ecoords_in))))
-                y = ecoords_in[i][1]
-                if y != scanline_y:
-                    scanline.append([ecoords_in[i]])
-                    scanline_y = y
-                else:
-                    if bool(FlipXoffset) ^ bool(Raster_step > 0.0):  # ^ is bitwise XOR
-                        scanline[-1].insert(0, ecoords_in[i])
-                    else:
-                        scanline[-1].append(ecoords_in[i])
-            reporter("Raster Data Ready")
+                scanline = self.group_scanlines(ecoords_in, Raster_step, FlipXoffset, reporter)
+                scanlines = iter(scanline)
+                n_scanlines = len(scanline)
+            reporter.status("Raster Data Ready")
             ###################################################
+            first_scan = next(scanlines)
             lastx, lasty, last_loop = self.ecoord_adj(
-                scanline[0][0], scale, FlipXoffset)
+                first_scan[0], scale, FlipXoffset)
 
             DXstart = lastx-startX
             DYstart = lasty-startY
@@ -461,7 +511,7 @@ class egv:
             sign = -1
             cnt = 1
             timestamp = 0
-            for scan_raw in scanline:
+            for scan_raw in chain([first_scan], scanlines):
                 scan = []
                 for point in scan_raw:
                     e0, e1, e2 = self.ecoord_adj(point, scale, FlipXoffset)
@@ -469,8 +519,8 @@ class egv:
                 stamp = int(3*time())  # update every 1/3 of a second
                 if (stamp != timestamp):
                     timestamp = stamp  # interlock
-                    reporter("Generating EGV Data: %.1f%%" %
-                               (100.0*float(cnt)/float(len(scanline))))
+                    reporter.status("Generating EGV Data: %.1f%%" %
+                               (100.0*float(cnt)/float(n_scanlines)))
                     if stop_calc:
                         reporter.information("Action Stopped by User.")
                         return
@@ -606,7 +656,7 @@ class egv:
         self.write(ord("N"))
         self.write(ord("S"))
         self.write(ord("E"))
-        reporter("EGV Data Complete")
+        reporter.status("EGV Data Complete")
         return
 
     def make_egv_rapid(self, DX, DY, Feed=None, board_name="LASER-M2", finish=True):
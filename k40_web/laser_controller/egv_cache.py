@@ -0,0 +1,97 @@
+'''
+On-disk cache of generated EGV data.
+
+Jobs are stored under a hash of everything that went into generating
+them (see job_key) and EGV_CACHE_VERSION, one file per job. The least recently used files are
+removed once the cache grows past max_size bytes.
+'''
+import hashlib
+import os
+from numbers import Number
+
+from k40_web.laser_controller.ecoords import EcoordArray
+
+# part of every job key, files cached by older versions are never read again.
+# bump when egv.make_egv_data, optimize_egv or the EGVJob format change
+EGV_CACHE_VERSION = 1
+
+
+def job_key(*parts):
+    """Hash the design data and settings of a job into a file name."""
+    h = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, EcoordArray):
+            h.update(part.data.dtype.str.encode())
+            h.update(part.data.tobytes())
+        elif isinstance(part, (bytes, bytearray)):
+            h.update(part)
+        elif isinstance(part, (str, Number)) or part is None:
+            h.update(repr(part).encode())
+        else:
+            # lists and tuples of the above
+            h.update(b"(")
+            h.update(job_key(*part).encode())
+            h.update(b")")
+        h.update(b"|")
+    return h.hexdigest()
+
+
+class EGVCache:
+    suffix = ".egv"
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        if self.max_size <= 0:
+            return None
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = bytearray(f.read())
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, key, data):
+        if self.max_size <= 0 or len(data) > self.max_size:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.path(key)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.evict()
+        except OSError:
+            # a cache that cannot be written only costs time
+            pass
+
+    def evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.suffix):
+                os.remove(entry.path)
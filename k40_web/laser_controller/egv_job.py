@@ -0,0 +1,161 @@
+'''
+EGV data for a whole job, assembled from the data of its operations.
+
+Each operation is generated once and referenced for all of its passes
+instead of being copied, so a job takes the same memory for any number
+of passes. The bytes that separate the passes are put in while the job
+is read. EGV files are read the same way, in chunks, so sending one
+does not load it into memory.
+'''
+import struct
+
+# marks the compact form written by EGVJob.dumps
+MAGIC = b"EGVJOB\x01\n"
+HEADER = struct.Struct("<I")
+SEGMENT = struct.Struct("<II")
+
+
+def segment_chunks(data):
+    if isinstance(data, EGVFile):
+        return data.chunks()
+    return (memoryview(data),)
+
+
+def pass_chunks(chunks):
+    """Yield chunks with "@" in place of the fourth last byte ("FNSE")."""
+    tail = bytearray()
+    for chunk in chunks:
+        if len(chunk) >= 4:
+            if tail:
+                yield tail
+            yield chunk[:-4]
+            tail = bytearray(chunk[-4:])
+        else:
+            tail += chunk
+            if len(tail) > 4:
+                yield tail[:-4]
+                tail = tail[-4:]
+    if len(tail) == 4:
+        tail[0] = ord("@")
+    yield tail
+
+
+class EGVFile:
+    """Payload of an EGV file, read in chunks each time it is sent.
+
+    The header, "%" followed by the start y, start x, end y and end x
+    positions in mils each ending with "%", is parsed from a short
+    prefix. Line breaks and spaces in the payload are skipped. The first
+    byte of the payload is split off as head.
+    """
+    chunk_size = 1 << 20
+    prefix_size = 4096
+    whitespace = b" \r\n"
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, "rb") as f:
+            prefix = f.read(self.prefix_size)
+            fields = prefix.split(b"%", 5)
+            while len(fields) < 6:
+                more = f.read(self.prefix_size)
+                if not more:
+                    raise Exception("No EGV header found in %s" % (filename))
+                prefix += more
+                fields = prefix.split(b"%", 5)
+            self.positions = [int(v) for v in fields[1:5]]
+            # the "I" that starts the data is only sent once, see EGVJob
+            data = fields[5].lstrip(self.whitespace)
+            self.head = data[:1]
+            self.offset = len(prefix)-len(data)+len(self.head)
+            self.length = 0
+            f.seek(self.offset)
+            for chunk in self.read_chunks(f):
+                self.length += len(chunk)
+
+    def read_chunks(self, f):
+        while True:
+            chunk = f.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk.translate(None, self.whitespace)
+
+    def chunks(self):
+        with open(self.filename, "rb") as f:
+            f.seek(self.offset)
+            yield from self.read_chunks(f)
+
+    def __len__(self):
+        return self.length
+
+
+class EGVJob:
+    """A head sent once followed by segments that are each repeated.
+
+    chunks() yields the data in order. Every pass but the very last ends
+    with "@NSE" instead of "FNSE", so the laser carries on with the next
+    pass instead of finishing the job.
+    """
+
+    def __init__(self, head=b"I"):
+        self.head = head
+        self.segments = []
+
+    @classmethod
+    def from_data(cls, data, passes=1):
+        """Job that sends data, starting with "I", passes times.
+
+        The leading "I" is only sent with the first pass.
+        """
+        job = cls(data[:1])
+        job.add(data[1:], passes)
+        return job
+
+    def add(self, data, passes=1):
+        if len(data) > 0 and passes > 0:
+            self.segments.append((data, passes))
+
+    def __len__(self):
+        return len(self.head) + sum(len(data)*passes for data, passes in self.segments)
+
+    def chunks(self):
+        yield self.head
+        last = len(self.segments)-1
+        for i, (data, passes) in enumerate(self.segments):
+            for j in range(passes):
+                if i == last and j == passes-1:
+                    yield from segment_chunks(data)
+                else:
+                    yield from pass_chunks(segment_chunks(data))
+
+    def tobytes(self):
+        return b"".join(self.chunks())
+
+    def dumps(self):
+        """Compact form that keeps every segment once, see loads.
+
+        Jobs made from an EGVFile are not meant to be stored.
+        """
+        parts = [MAGIC, HEADER.pack(len(self.head)), self.head]
+        for data, passes in self.segments:
+            parts.append(SEGMENT.pack(passes, len(data)))
+            parts.append(data)
+        return b"".join(parts)
+
+    @classmethod
+    def loads(cls, data):
+        """Read the form written by dumps. Plain EGV data is sent once."""
+        if not data.startswith(MAGIC):
+            return cls.from_data(data)
+        view = memoryview(data)
+        i = len(MAGIC)
+        n, = HEADER.unpack_from(view, i)
+        i += HEADER.size
+        job = cls(bytes(view[i:i+n]))
+        i += n
+        while i < len(view):
+            passes, n = SEGMENT.unpack_from(view, i)
+            i += SEGMENT.size
+            job.add(view[i:i+n], passes)
+            i += n
+        return job
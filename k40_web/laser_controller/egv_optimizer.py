@@ -0,0 +1,220 @@
+'''
+Peephole optimizer for generated EGV (LHYMICRO-GL) data.
+
+The encoder cannot merge moves across its flush() calls and emits a
+complete speed block, with its padding moves, for every speed change,
+even when the speed code comes out the same. optimize_egv rewrites the
+stream without changing where the head goes or where the laser is on:
+
+- adjacent moves in the same direction are merged: "Be" "Bc" -> "Bh"
+- laser on/off codes that do not change the laser state are dropped,
+  as is a "U" directly followed by "D"
+- a run of laser-off moves and speed blocks that ends at the speed it
+  started with and moves the head by zero in total is dropped, keeping
+  only the direction letters later moves depend on
+- a speed block followed only by laser-off moves that add up to zero
+  before the next speed block is dropped together with those moves,
+  e.g. the return of one rapid_move_slow and the start of the next
+
+Runs containing raster speed codes (with a G step) are left alone,
+because a change of direction there also steps the head in y.
+'''
+import re
+
+from k40_web.laser_controller.egv import egv
+
+TOKEN = re.compile(rb"""
+    (?P<move>[BTLRM]z*(?:[a-y]|\|[a-z]|[0-9]{3})?)
+  | (?P<laser>[DU])
+  | (?P<block>[@F]NSE)
+  | (?P<speed>C?V[0-9]+(?:G[0-9]{3})?C?)
+  | (?P<other>.)
+""", re.X | re.S)
+
+
+def decode_distance(code):
+    dist = 255*code.count(b"z")
+    rest = code.lstrip(b"z")
+    if not rest:
+        return dist
+    if rest[0] == ord("|"):
+        return dist + rest[1]-96+25
+    if len(rest) == 3:
+        return dist + int(rest)
+    return dist + rest[0]-96
+
+
+class EGVOptimizer:
+    def __init__(self):
+        self.out = bytearray()
+        self.encoder = egv()
+        # the last move is held back so a following one can be merged
+        self.move_dir = None
+        self.move_dist = 0
+        self.move_raw = b""
+        self.merged = False
+        self.laser_on = False
+        self.current_speed = None
+        self.in_header = False
+        # modal x and y directions, used by diagonal moves
+        self.x_dir = None
+        self.y_dir = None
+        # run of laser-off tokens that may be dropped, see open_run
+        self.run_start = None
+
+    def flush_move(self):
+        if self.move_dir is None:
+            return
+        if self.merged:
+            self.out.append(self.move_dir)
+            self.out += self.encoder.distance_code(self.move_dist)
+        else:
+            self.out += self.move_raw
+        self.move_dir = None
+
+    def open_run(self):
+        # the pending move is restored if the run is dropped
+        self.run_pending = (len(self.out), self.move_dir, self.move_dist,
+                            self.move_raw, self.merged)
+        self.flush_move()
+        self.run_start = len(self.out)
+        self.run_state = (self.laser_on, self.x_dir, self.y_dir)
+        self.run_speed = self.current_speed
+        self.run_valid = self.current_speed is None or b"G" not in self.current_speed
+        self.run_net = [0, 0]
+        self.run_blocks = 0
+        # start of the last speed block in the run and the net move since
+        self.block_start = None
+        self.block_net = [0, 0]
+
+    def close_run(self, laser_on=False):
+        if self.run_start is None:
+            return
+        self.flush_move()
+        run_start = self.run_start
+        self.run_start = None
+        if not (self.run_valid and self.run_blocks and self.current_speed == self.run_speed and
+                self.run_net == [0, 0]):
+            return
+        # nothing happened in the run, put back the state later codes need
+        (end, self.move_dir, self.move_dist,
+         self.move_raw, self.merged) = self.run_pending
+        del self.out[end:]
+        was_on, x_dir, y_dir = self.run_state
+        for direction, old in ((self.x_dir, x_dir), (self.y_dir, y_dir)):
+            if direction != old and direction != self.move_dir:
+                self.flush_move()
+                self.move_dir = direction
+                self.move_dist = 0
+                self.move_raw = bytes([direction])
+                self.merged = False
+        if was_on and not laser_on:
+            self.flush_move()
+            self.out += b"U"
+        else:
+            self.laser_on = was_on
+
+    def move(self, raw):
+        direction = raw[0]
+        dist = decode_distance(raw[1:])
+        if direction in b"BT":
+            self.x_dir = direction
+            dx, dy = (dist if direction == ord("B") else -dist), 0
+        elif direction in b"LR":
+            self.y_dir = direction
+            dx, dy = 0, (dist if direction == ord("L") else -dist)
+        elif self.x_dir is None or self.y_dir is None:
+            dx = dy = None
+        else:
+            dx = dist if self.x_dir == ord("B") else -dist
+            dy = dist if self.y_dir == ord("L") else -dist
+
+        if self.laser_on:
+            self.close_run()
+        else:
+            if self.run_start is None:
+                self.open_run()
+            if dx is None or (self.in_header and dist):
+                self.run_valid = False
+            else:
+                self.run_net[0] += dx
+                self.run_net[1] += dy
+                self.block_net[0] += dx
+                self.block_net[1] += dy
+
+        if direction == self.move_dir:
+            self.move_dist += dist
+            self.merged = True
+            return
+        self.flush_move()
+        self.move_dir = direction
+        self.move_dist = dist
+        self.move_raw = raw
+        self.merged = False
+
+    def laser(self, raw):
+        on = raw == b"D"
+        if on == self.laser_on:
+            return
+        if on:
+            self.close_run(laser_on=True)
+            if self.laser_on:
+                return
+            self.flush_move()
+            self.laser_on = True
+            if self.out[-1:] == b"U":
+                # off and on again without moving
+                del self.out[-1]
+            else:
+                self.out += raw
+        else:
+            self.open_run()
+            self.laser_on = False
+            self.out += raw
+
+    def block(self, raw):
+        if raw == b"@NSE":
+            if self.run_start is None:
+                self.open_run()
+            self.flush_move()
+            if self.block_start is not None and self.block_net == [0, 0]:
+                # nothing happened since the last speed block
+                del self.out[self.block_start:]
+            self.block_start = len(self.out)
+            self.block_net = [0, 0]
+            self.run_blocks += 1
+            self.in_header = True
+        else:
+            self.close_run()
+            self.flush_move()
+        self.out += raw
+
+    def speed(self, raw):
+        self.flush_move()
+        self.out += raw
+        self.current_speed = raw
+        if b"G" in raw and self.run_start is not None:
+            self.run_valid = False
+
+    def other(self, raw):
+        if self.in_header:
+            self.flush_move()
+            if raw == b"E":
+                self.in_header = False
+        else:
+            self.close_run()
+            self.flush_move()
+        self.out += raw
+
+    def run(self, data):
+        for m in TOKEN.finditer(data):
+            getattr(self, m.lastgroup)(m.group())
+        self.close_run()
+        self.flush_move()
+        return self.out
+
+
+def optimize_egv(data):
+    """Return the optimized EGV data and the number of bytes saved."""
+    out = EGVOptimizer().run(bytes(data))
+    return out, len(data)-len(out)
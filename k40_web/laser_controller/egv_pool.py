@@ -0,0 +1,124 @@
+'''
+Run the EGV encoders of the operations of a job in worker processes.
+
+Each operation is encoded on its own once its start position is known,
+so the Vector_Cut, Vector_Eng, Trace_Eng, Raster_Eng and Gcode_Cut data
+of a combined job can be generated at the same time. Status messages of
+the workers are passed on to the reporter of the service and a stop of
+the service stops the workers.
+'''
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+from queue import Empty
+
+from k40_web.laser_controller.egv import egv
+from k40_web.laser_controller.egv_optimizer import optimize_egv
+
+# points the operations of a job need, all but the largest one, before
+# they go to the pool. starting the workers takes most of a second
+POOL_MIN_POINTS = 20000
+
+
+def encode(ecoords, settings, optimize=False, reporter=None, stop_calc=False):
+    """Encode one operation, return its EGV data and the bytes saved."""
+    egv_inst = egv()
+    egv_inst.make_egv_data(ecoords, reporter=reporter, stop_calc=stop_calc, **settings)
+    if optimize and not stop_calc:
+        return optimize_egv(egv_inst.data)
+    return egv_inst.data, 0
+
+
+class QueueReporter:
+    """Reporter for a worker process, the messages go to the service."""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def status(self, text):
+        self.messages.put(("status", text))
+
+    def information(self, text):
+        self.messages.put(("information", text))
+
+    def warning(self, text):
+        self.messages.put(("warning", text))
+
+    def error(self, text):
+        self.messages.put(("error", text))
+
+
+class EventStop:
+    """Stop state of a worker process, set by the service."""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __bool__(self):
+        return self.event.is_set()
+
+
+worker_reporter = None
+worker_stop = None
+
+
+def init_worker(messages, stop_event):
+    global worker_reporter, worker_stop
+    worker_reporter = QueueReporter(messages)
+    worker_stop = EventStop(stop_event)
+
+
+def use_pool(jobs, processes):
+    """Whether encoding (ecoords, settings, optimize) jobs in a pool can pay off."""
+    if processes < 2 or len(jobs) < 2:
+        return False
+    points = sorted(len(job[0]) for job in jobs)
+    return sum(points[:-1]) >= POOL_MIN_POINTS
+
+
+def encode_in_worker(ecoords, settings, optimize):
+    return encode(ecoords, settings, optimize, worker_reporter, worker_stop)
+
+
+class EGVPool:
+    poll_interval = 0.1
+
+    def __init__(self, processes):
+        self.processes = processes
+        # not fork: the pool is made while the service runs other threads,
+        # and a forked child can hang on a lock one of them held. the fork
+        # server is started fresh and forks the workers while it has one
+        # thread. the workers import the main script again, which is why
+        # k40_web/worker.py only starts the service under __main__
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context("forkserver")
+        else:
+            context = multiprocessing.get_context("spawn")
+        self.messages = context.Queue()
+        self.stop_event = context.Event()
+        self.executor = ProcessPoolExecutor(processes, mp_context=context,
+                                            initializer=init_worker,
+                                            initargs=(self.messages, self.stop_event))
+
+    def map(self, jobs, reporter, stop_calc):
+        """Encode (ecoords, settings, optimize) jobs, results in job order."""
+        self.stop_event.clear()
+        futures = [self.executor.submit(encode_in_worker, *job) for job in jobs]
+        pending = futures
+        while pending:
+            done, pending = wait(pending, timeout=self.poll_interval)
+            if stop_calc:
+                self.stop_event.set()
+            self.forward(reporter)
+        self.forward(reporter)
+        return [future.result() for future in futures]
+
+    def forward(self, reporter):
+        while True:
+            try:
+                kind, text = self.messages.get_nowait()
+            except Empty:
+                return
+            getattr(reporter, kind)(text)
+
+    def shutdown(self):
+        self.executor.shutdown()
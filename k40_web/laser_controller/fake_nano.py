@@ -0,0 +1,117 @@
+'''
+A simulated K40 Nano controller board.
+
+FakeNano answers the same write and read calls K40_CLASS makes on a pyusb
+device, so the send path can be run and timed without a laser:
+
+    k40 = K40_CLASS()
+    k40.attach_device(FakeNano(buffer_depth=8, packet_time=0.004))
+
+The board keeps a buffer of received packets and executes them at a fixed
+rate on a clock that advances by `latency` for every USB transfer, so
+replies only depend on the order of calls and on `seed`.
+'''
+import random
+from time import perf_counter, sleep
+
+from k40_web.laser_controller.nano_library import OneWireCRC
+
+OK = 206
+BUFFER_FULL = 238
+CRC_ERROR = 207
+TASK_COMPLETE = 236
+
+HELLO = 160
+PACKET_LENGTH = 34
+
+
+class FakeNano:
+    def __init__(self, buffer_depth=8, latency=0.0, packet_time=0.0,
+                 crc_error_rate=0.0, timeout_rate=0.0, seed=0, realtime=False):
+        # buffer_depth:   packets the board holds before it reports BUFFER_FULL
+        # latency:        seconds per USB transfer
+        # packet_time:    seconds the board needs to execute one packet
+        # crc_error_rate: fraction of packets that arrive corrupted
+        # timeout_rate:   fraction of writes that time out
+        # realtime:       also sleep for the latency of every transfer
+        self.buffer_depth = buffer_depth
+        self.latency = latency
+        self.packet_time = packet_time
+        self.crc_error_rate = crc_error_rate
+        self.timeout_rate = timeout_rate
+        self.realtime = realtime
+        self.random = random.Random(seed)
+        self.reset()
+
+    def reset(self):
+        self.clock = 0.0
+        self.buffered = 0
+        self.busy_until = 0.0
+        self.status = OK
+        self.received = bytearray()
+        self.n_writes = 0
+        self.n_reads = 0
+        self.n_packets = 0
+        self.n_dropped = 0
+        self.first_packet_time = None
+
+    def _transfer(self):
+        self.clock += self.latency
+        if self.realtime and self.latency:
+            sleep(self.latency)
+        # execute the packets that are due by now
+        if self.packet_time > 0:
+            while self.buffered and self.busy_until <= self.clock:
+                self.buffered -= 1
+                if self.buffered:
+                    self.busy_until += self.packet_time
+        else:
+            self.buffered = 0
+
+    def write(self, addr, line, timeout=None):
+        self._transfer()
+        self.n_writes += 1
+        if self.timeout_rate and self.random.random() < self.timeout_rate:
+            raise TimeoutError("Simulated USB timeout")
+        if len(line) == 1 and line[0] == HELLO:
+            return 1
+        if len(line) != PACKET_LENGTH:
+            raise ValueError("Unexpected packet length %d" % len(line))
+        if self.first_packet_time is None:
+            self.first_packet_time = perf_counter()
+        payload = bytes(line[2:32])
+        if line[0] != 166 or line[32] != 166 or line[33] != OneWireCRC(payload) or \
+           (self.crc_error_rate and self.random.random() < self.crc_error_rate):
+            self.status = CRC_ERROR
+            return len(line)
+        if self.buffered >= self.buffer_depth:
+            self.n_dropped += 1
+            self.status = BUFFER_FULL
+            return len(line)
+        if not self.buffered:
+            self.busy_until = self.clock + self.packet_time
+        self.buffered += 1
+        self.n_packets += 1
+        self.received += payload
+        self.status = OK
+        return len(line)
+
+    def read(self, addr, length, timeout=None):
+        self._transfer()
+        self.n_reads += 1
+        if self.status == CRC_ERROR:
+            # reported once for the corrupted packet
+            status = CRC_ERROR
+        elif self.buffered >= self.buffer_depth:
+            status = BUFFER_FULL
+            # the host waits at least until the current packet is done
+            self.clock = max(self.clock, self.busy_until)
+        elif self.n_packets and not self.buffered:
+            status = TASK_COMPLETE
+        else:
+            status = OK
+        self.status = OK
+        return [255, status, 111, 8, 19, 0]
+
+    def ctrl_transfer(self, *args):
+        return 0
@@ -15,9 +15,10 @@ def Open_SVG(filename, design_scale, svg_options,  reporter):
     dialog_viewbox = None
     try:
         try:
+            # one parse: the size and the text conversion are settled before the paths are made
+            svg_reader.parse_svg(filename)
             try:
-                svg_reader.parse_svg(filename)
-                svg_reader.make_paths()
+                svg_reader.read_size()
             except SVG_PXPI_EXCEPTION as e:
                 reporter.error(str(e))
                 # pxpi_dialog = pxpiDialog(root, #FIXME
@@ -26,20 +27,23 @@ def Open_SVG(filename, design_scale, svg_options,  reporter):
                 #                          svg_reader.SVG_ViewBox,
                 #                          svg_reader.SVG_inkscape_version)
 
-                svg_reader = SVG_READER()
-                svg_reader.set_inkscape_path(svg_options.inkscape_path)
                 # if True:#pxpi_dialog.result == None: #FIXME
                 #     return
                 reporter.warning("No units or viewbox defined in svg file, using mm and (0,0,100,100) for now.")
                 dialog_pxpi, dialog_viewbox = svg_options.default_pxpi, svg_options.default_viewbox#pxpi_dialog.result
-                svg_reader.parse_svg(filename)
                 svg_reader.set_size(
                     dialog_pxpi, dialog_viewbox, design_scale)
-                svg_reader.make_paths()
+            txt2paths = svg_reader.has_coded_text()
+            if txt2paths:
+                reporter.status("Converting TEXT to PATHS.")
+            svg_reader.make_paths(txt2paths=txt2paths)
 
         except SVG_TEXT_EXCEPTION as e:
+            # coded text has_coded_text did not see, e.g. through a clone
             svg_reader = SVG_READER()
             svg_reader.set_inkscape_path(svg_options.inkscape_path)
+            svg_reader.image_dpi = input_dpi
+            svg_reader.timout = int(float(svg_options.ink_timeout)*60.0)
             reporter.status("Converting TEXT to PATHS.")
             #master.update()
             svg_reader.parse_svg(filename)
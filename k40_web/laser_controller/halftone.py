@@ -0,0 +1,135 @@
+'''
+Halftoning of raster images.
+
+The darkness of the image is adjusted with the Bezier curve of the
+bezier settings, as a lookup table applied by Image.point, and the
+result is dithered to a one bit image by one of HALFTONE_METHODS:
+
+- "floyd-steinberg": PIL's Floyd-Steinberg error diffusion
+- "bayer": ordered dithering with an 8x8 Bayer matrix, the fastest and
+  without the worms error diffusion can leave in flat areas
+- "stucki": error diffusion to twelve neighbours (Stucki), smoother than
+  Floyd-Steinberg, run on all pixels of a wavefront at once with NumPy
+
+The halftoning was originally written by Isai B. Cicourel.
+'''
+import numpy as np
+from PIL import Image
+
+from k40_web.laser_controller.interpolate import interpolate
+
+
+def generate_bezier(bezier_settings, n=100):
+    m1 = bezier_settings.m1
+    m2 = bezier_settings.m2
+    w = bezier_settings.weight
+    if (m1 == m2):
+        x1 = 0
+        y1 = 0
+    else:
+        x1 = 255*(1-m2)/(m1-m2)
+        y1 = m1*x1
+    x = []
+    y = []
+    # Calculate Bezier Curve
+    for step in range(0, n+1):
+        t = float(step)/float(n)
+        Ct = 1 / (pow(1-t, 2)+2*(1-t)*t*w+pow(t, 2))
+        x.append(Ct*(2*(1-t)*t*w*x1+pow(t, 2)*255))
+        y.append(Ct*(2*(1-t)*t*w*y1+pow(t, 2)*255))
+    return x, y
+
+
+def darkness_lut(bezier_settings):
+    """Map of the 256 grey levels through the Bezier curve, for Image.point."""
+    x, y = generate_bezier(bezier_settings)
+    interp = interpolate(x, y)
+    return [int(round(interp[val])) for val in range(256)]
+
+
+def bayer_matrix(n):
+    # the n x n Bayer index matrix, n a power of two
+    m = np.zeros((1, 1), dtype=np.int64)
+    while len(m) < n:
+        m = np.block([[4*m, 4*m+2], [4*m+3, 4*m+1]])
+    return m
+
+
+# (dy, dx, weight) of the neighbours that get a share of the error of a pixel
+STUCKI = [(0, 1, 8), (0, 2, 4),
+          (1, -2, 2), (1, -1, 4), (1, 0, 8), (1, 1, 4), (1, 2, 2),
+          (2, -2, 1), (2, -1, 2), (2, 0, 4), (2, 1, 2), (2, 2, 1)]
+FLOYD_STEINBERG = [(0, 1, 7), (1, -1, 3), (1, 0, 5), (1, 1, 1)]
+
+
+def error_diffusion(pixels, kernel=STUCKI):
+    """Dither grey levels with error diffusion, True where the result is white.
+
+    A pixel only takes error from pixels above it or to its left. For a
+    large enough slope a, all of those have a smaller a*y + x than the
+    pixel itself, so the pixels on a line a*y + x = t do not depend on
+    each other and are done at once. The Python loop runs over the
+    width + a*height lines instead of over the pixels.
+
+    The errors are kept by line, indexed by y, for the last few lines
+    only: a neighbour (dy, dx) of the line t lies on line t - a*dy - dx,
+    in the same places shifted by dy.
+    """
+    h, w = pixels.shape
+    out = np.empty(h*w, dtype=bool)
+    if h == 0 or w == 0:
+        return out.reshape(h, w)
+    total = float(sum(weight for dy, dx, weight in kernel))
+    a = max([-dx//dy+1 for dy, dx, weight in kernel if dy > 0] + [1])
+    top = max(dy for dy, dx, weight in kernel)
+    pulls = [(a*dy+dx, dy, np.float32(weight/total)) for dy, dx, weight in kernel]
+    n_lines = max(back for back, dy, weight in pulls)+1
+    # errors of the last n_lines lines, zero rows on top for neighbours above the image
+    err = np.zeros((n_lines, h+top), dtype=np.float32)
+    flat = pixels.ravel()
+    for t in range(a*(h-1)+w):
+        y0 = max(0, -((w-1-t)//a))
+        y1 = min(h-1, t//a)+1
+        ys = np.arange(y0, y1)
+        index = ys*(w-a)+t
+        value = flat[index].astype(np.float32)
+        for back, dy, weight in pulls:
+            value += weight*err[(t-back) % n_lines, y0+top-dy:y1+top-dy]
+        white = value >= 128
+        out[index] = white
+        line = err[t % n_lines]
+        line[:] = 0
+        line[y0+top:y1+top] = value-255*white
+    return out.reshape(h, w)
+
+
+def dither_floyd_steinberg(image):
+    return image.convert('1')
+
+
+def dither_bayer(image):
+    pixels = np.asarray(image)
+    h, w = pixels.shape
+    # thresholds spread evenly between the 256 grey levels
+    levels = ((bayer_matrix(8)*256+128)//64).astype(np.uint8)
+    thresholds = np.tile(levels, (-(-h//8), -(-w//8)))[:h, :w]
+    return Image.fromarray(pixels >= thresholds)
+
+
+def dither_stucki(image):
+    return Image.fromarray(error_diffusion(np.asarray(image), STUCKI))
+
+
+HALFTONE_METHODS = {
+    "floyd-steinberg": dither_floyd_steinberg,
+    "bayer": dither_bayer,
+    "stucki": dither_stucki,
+}
+
+
+def convert_halftoning(image, bezier_settings, method="floyd-steinberg"):
+    """Adjust the darkness of an image and dither it to a '1' image."""
+    image = image.convert('L')
+    if bezier_settings.weight > 0:
+        image = image.point(darkness_lut(bezier_settings))
+    return HALFTONE_METHODS[method](image)
@@ -163,8 +163,12 @@ class Effect:
         """Collect command line arguments"""
         self.options, self.args = self.OptionParser.parse_args(args)
 
-    def parse(self, filename=None, encoding=None):
-        """Parse document in specified file or on stdin"""
+    def parse(self, filename=None, encoding=None, keep_original=True):
+        """Parse document in specified file or on stdin
+
+        A copy of the document is kept in original_document for output(),
+        unless keep_original is False.
+        """
 
         # First try to open the file from the function argument
         if filename is not None:
@@ -196,7 +200,10 @@ class Effect:
                 huge_tree=True, recover=True, encoding=encoding)
 
         self.document = etree.parse(stream, parser=p)
-        self.original_document = copy.deepcopy(self.document)
+        if keep_original:
+            self.original_document = copy.deepcopy(self.document)
+        else:
+            self.original_document = None
         stream.close()
 
     # defines view_center in terms of document units
@@ -27,8 +27,13 @@ except:
 import sys
 import os
 from k40_web.laser_controller.egv import egv
+from k40_web.laser_controller.egv_job import EGVJob
+from k40_web.laser_controller.reporter import Reporter
+from k40_web.laser_controller.util_classes import StoppedState
 import xmlrpc.client
-from time import time
+from queue import Queue, Full
+from threading import Event, Thread
+from time import sleep, time
 
 
 #######################################################################
@@ -36,19 +41,117 @@ from time import time
 #  The latest version of this library may be found at:
 #  http://www.pjrc.com/teensy/td_libs_OneWire.html
 #######################################################################
-def OneWireCRC(line):
-    crc = 0
-    for i in range(len(line)):
-        inbyte = line[i]
+def _make_crc_table():
+    table = []
+    for inbyte in range(256):
+        crc = 0
         for j in range(8):
             mix = (crc ^ inbyte) & 0x01
             crc >>= 1
             if (mix):
                 crc ^= 0x8C
             inbyte >>= 1
+        table.append(crc)
+    return bytes(table)
+
+
+CRC_TABLE = _make_crc_table()
+
+
+def OneWireCRC(line):
+    crc = 0
+    for inbyte in line:
+        crc = CRC_TABLE[crc ^ inbyte]
     return crc
 #######################################################################
 
+PACKET_PAYLOAD = 30
+PACKET_HEADER = bytes([166, 0])
+PACKET_PADDING = bytes([70])*PACKET_PAYLOAD
+
+
+def make_packets(chunks):
+    """Slice a stream of byte chunks into 34 byte packets.
+
+    Every packet carries 30 bytes of data, the last one padded with "F",
+    between a 166, 0 header and a 166, CRC trailer.
+    """
+    pending = bytearray()
+    for chunk in chunks:
+        view = memoryview(chunk)
+        i = 0
+        if pending:
+            i = PACKET_PAYLOAD - len(pending)
+            pending += view[:i]
+            if len(pending) < PACKET_PAYLOAD:
+                continue
+            yield PACKET_HEADER + pending + bytes([166, OneWireCRC(pending)])
+            pending = bytearray()
+        n = len(view)
+        while i + PACKET_PAYLOAD <= n:
+            payload = view[i:i+PACKET_PAYLOAD]
+            yield PACKET_HEADER + payload + bytes([166, OneWireCRC(payload)])
+            i += PACKET_PAYLOAD
+        pending += view[i:]
+    if pending:
+        payload = pending + PACKET_PADDING[len(pending):]
+        yield PACKET_HEADER + payload + bytes([166, OneWireCRC(payload)])
+
+
+class PacketPipeline:
+    """Build packets in a background thread while they are being sent.
+
+    The packetizer thread fills a queue holding at most queue_depth packets
+    (0 for no limit) and iterating the pipeline hands them to the sender, so
+    the first packet goes out as soon as it is built.
+    """
+    # about 500 bytes of EGV data, enough to build the next packets while
+    # one is sent
+    queue_depth = 16
+    # 2 MB of EGV data, minutes of laser time but bounded memory for
+    # files that are streamed from disk
+    preprocess_depth = 1 << 16
+
+    def __init__(self, packets, queue_depth=None):
+        if queue_depth is None:
+            queue_depth = self.queue_depth
+        self.queue = Queue(maxsize=queue_depth)
+        self.closed = Event()
+        self.thread = Thread(target=self._packetize, args=(packets,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _packetize(self, packets):
+        try:
+            for packet in packets:
+                if not self._put((packet, None)):
+                    return
+            self._put((None, None))
+        except Exception as e:
+            self._put((None, e))
+
+    def _put(self, item):
+        # poll so a sender that gave up does not leave this thread blocked
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def __iter__(self):
+        while True:
+            packet, error = self.queue.get()
+            if error is not None:
+                raise error
+            if packet is None:
+                return
+            yield packet
+
+    def close(self):
+        self.closed.set()
+
 
 class K40_CLASS:
     def __init__(self):
@@ -75,6 +178,21 @@ class K40_CLASS:
                       70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 166, 130]
         self.USB_Location = None
 
+        # skip the hello before a write while the board reports OK and back
+        # off from poll_delay up to max_poll_delay seconds while it is full
+        self.adaptive_polling = True
+        self.poll_delay = 0.002
+        self.max_poll_delay = 0.128
+        self.last_response = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"packets": 0, "hellos": 0, "buffer_full": 0,
+                      "retries": 0, "crc_errors": 0, "timeouts": 0}
+
+    def set_adaptive_polling(self, value):
+        self.adaptive_polling = value
+
     def set_n_timeouts(self, value):
         self.n_timeouts = value
 
@@ -82,6 +200,8 @@ class K40_CLASS:
         self.timeout = value
 
     def say_hello(self):
+        self.stats["hellos"] += 1
+        self.last_response = None
         cnt = 0
         status_timeouts = self.n_timeouts
         while cnt < status_timeouts:
@@ -128,6 +248,7 @@ class K40_CLASS:
                response[1] == self.CRC_ERROR or \
                response[1] == self.TASK_COMPLETE or \
                response[1] == self.UNKNOWN_2:
+                self.last_response = response[1]
                 return response[1]
             else:
                 return 9999
@@ -146,80 +267,50 @@ class K40_CLASS:
     def reset_usb(self):
         self.dev.reset()
 
+    def attach_device(self, dev):
+        # dev can be anything with the write, read and ctrl_transfer calls
+        # of a pyusb device, e.g. the simulated board in fake_nano
+        self.release_usb()
+        self.dev = dev
+
     def release_usb(self):
-        usb.util.dispose_resources(self.dev)
+        if self.USB_Location != None:
+            usb.util.dispose_resources(self.dev)
         self.dev = None
         self.USB_Location = None
 
     def pause_un_pause(self):
-        self.send_data([ord('P'), ord('N')], None, None, 1, True, False)
-
-    def none_function(self, dummy, bgcolor):
-        # Don't delete this function (used in send_data)
-        return False
+        self.send_data(b"PN", None, None, 1, True, False)
 
     def send_data(self, data, reporter, stop_calc, passes, preprocess_crc, wait_for_laser):
         if stop_calc == None:
-            stop_calc = []
-            stop_calc.append(0)
+            stop_calc = StoppedState()
         if reporter == None:
-            reporter = self.none_function
-
-        blank = [166, 0, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70,
-                 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 70, 166, 0]
-        packets = []
-        packet = blank[:]
-        cnt = 2
-        len_data = len(data)
-        for j in range(passes):
-            if j == 0:
-                istart = 0
-            else:
-                istart = 1
-            if passes > 1:
-                if j == passes-1:
-                    data[-4] = ord("F")
-                else:
-                    data[-4] = ord("@")
+            reporter = Reporter
+
+        if not isinstance(data, EGVJob):
+            data = EGVJob.from_data(data, passes)
+
+        self.reset_stats()
+        self.last_response = None
+        n_packets = max((len(data) + PACKET_PAYLOAD-1)//PACKET_PAYLOAD, 1)
+        # with preprocess_crc the packetizer may run far ahead of the laser,
+        # otherwise at most queue_depth packets
+        pipeline = PacketPipeline(make_packets(data.chunks()),
+                                  PacketPipeline.preprocess_depth if preprocess_crc else None)
+        try:
             timestamp = 0
-            for i in range(istart, len_data):
-                if cnt > 31:
-                    packet[-1] = OneWireCRC(packet[1:len(packet)-2])
-                    stamp = int(3*time())  # update every 1/3 of a second
-                    if not preprocess_crc:
-                        self.send_packet_w_error_checking(
-                            packet, reporter, stop_calc)
-                        if (stamp != timestamp):
-                            timestamp = stamp  # interlock
-                            reporter.status("Sending Data to Laser = %.1f%%" %
-                                       (100.0*float(i)/float(len_data)))
-                    else:
-                        packets.append(packet)
-                        if (stamp != timestamp):
-                            timestamp = stamp  # interlock
-                            reporter.status("Calculating CRC data and Generate Packets: %.1f%%" % (
-                                100.0*float(i)/float(len_data)))
-                    packet = blank[:]
-                    cnt = 2
-
-                    if stop_calc[0] == True:
-                        self.stop_sending_data()
-                        #raise Exception("Action Stopped by User.")
-                packet[cnt] = data[i]
-                cnt = cnt+1
-        packet[-1] = OneWireCRC(packet[1:len(packet)-2])
-        if not preprocess_crc:
-            self.send_packet_w_error_checking(packet, reporter, stop_calc)
-        else:
-            packets.append(packet)
-            reporter.status("CRC data and Packets are Ready")
-        packet_cnt = 0
-        for line in packets:
-            reporter.clear()
-            self.send_packet_w_error_checking(line, reporter, stop_calc)
-            packet_cnt = packet_cnt+1.0
-            reporter.status("Sending Data to Laser = %.1f%%" %
-                       (100.0*packet_cnt/len(packets)))
+            for packet_cnt, packet in enumerate(pipeline, 1):
+                self.send_packet_w_error_checking(packet, reporter, stop_calc)
+                stamp = int(3*time())  # update every 1/3 of a second
+                if (stamp != timestamp):
+                    timestamp = stamp  # interlock
+                    reporter.status("Sending Data to Laser = %.1f%%" %
+                               (100.0*packet_cnt/n_packets))
+                if stop_calc:
+                    self.stop_sending_data()
+        finally:
+            pipeline.close()
         ##############################################################
         if wait_for_laser:
             self.wait_for_laser_to_finish(reporter, stop_calc)
@@ -228,19 +319,31 @@ class K40_CLASS:
         timeout_cnt = 1
         crc_cnt = 1
         while True:
-            if stop_calc[0]:
+            if stop_calc:
                 self.stop_sending_data()
 
-            response = self.say_hello()
-            if response == self.BUFFER_FULL:
-                while response == self.BUFFER_FULL:
-                    response = self.say_hello()
-                    reporter.clear()
-                    if stop_calc[0]:
-                        self.stop_sending_data()
+            if self.adaptive_polling and \
+               self.last_response in (self.OK, self.TASK_COMPLETE):
+                # the board had room after the last packet
+                response = self.OK
+            else:
+                response = self.say_hello()
+            delay = self.poll_delay
+            while response == self.BUFFER_FULL:
+                self.stats["buffer_full"] += 1
+                if self.adaptive_polling:
+                    sleep(delay)
+                    delay = min(2*delay, self.max_poll_delay)
+                response = self.say_hello()
+                reporter.clear()
+                if stop_calc:
+                    self.stop_sending_data()
             try:
                 self.send_packet(line)
             except:
+                self.last_response = None
+                self.stats["timeouts"] += 1
+                self.stats["retries"] += 1
                 timeout_cnt = timeout_cnt+1
                 if timeout_cnt < self.n_timeouts:
                     msg = "USB Timeout #%d" % (timeout_cnt)
@@ -267,6 +370,8 @@ class K40_CLASS:
             response = self.say_hello()
 
             if response == self.CRC_ERROR:
+                self.stats["crc_errors"] += 1
+                self.stats["retries"] += 1
                 crc_cnt = crc_cnt+1
                 if crc_cnt < self.n_timeouts:
                     msg = "Data transmission (CRC) error #%d" % (crc_cnt)
@@ -281,7 +386,8 @@ class K40_CLASS:
                     #         crc_cnt)
                     #     raise Exception(msg)
                 continue
-            elif response == None:
+            self.stats["packets"] += 1
+            if response == None:
                 # The controller board is not reportering status. but we will
                 # assume things are going OK. until we cannot transmit to the controller.
                 break  # break to move on to next packet
@@ -298,13 +404,13 @@ class K40_CLASS:
                 break
             elif response == None:
                 msg = "Laser stopped responding after operation was complete."
-                reporter.status(msg, None)
+                reporter.status(msg)
                 #raise Exception(msg)
                 FINISHED = True
             else:  # assume: response == self.OK:
                 msg = "Waiting for the laser to finish."
-                reporter.status(msg, None)
-            if stop_calc[0]:
+                reporter.status(msg)
+            if stop_calc:
                 self.stop_sending_data()
 
     def stop_sending_data(self):
@@ -316,10 +422,9 @@ class K40_CLASS:
 
     def rapid_move(self, dxmils, dymils):
         if (dxmils != 0 or dymils != 0):
-            data = []
-            egv_inst = egv(target=lambda s: data.append(s))
+            egv_inst = egv()
             egv_inst.make_move_data(dxmils, dymils)
-            self.send_data(data, None, None, 1, True, False)
+            self.send_data(egv_inst.data, None, None, 1, True, False)
 
     def initialize_device(self, USB_Location, verbose):
         try:
@@ -0,0 +1,213 @@
+'''
+Raster engraving data kept as a bit-packed image.
+
+Turning a whole image into ecoords takes two points for every laser-on
+run, and the EGV encoder used to group all of them into Python lists of
+scanlines before writing the first byte. For a full bed photo at 1000 dpi
+that is several gigabytes. PackedRaster keeps one bit per pixel of every
+scanline instead and finds the runs again, a strip of scanlines at a time,
+whenever they are read. Building it works through the image in strips as
+well, so no thresholded copy of the whole image is made.
+'''
+import numpy as np
+
+from k40_web.laser_controller.convex_hull import convex_hull_ecoords
+
+# scanlines per strip
+BAND_ROWS = 256
+
+
+def band_scanlines(dark):
+    """Laser-on runs and extents of the rows of a boolean band, True is engraved.
+
+    Returns two tuples of arrays: (row, start, end) for every laser-on run
+    in scan order, with end exclusive and row counted from the top of the
+    band, and (row, left, right) with the engraved extent of every row
+    that contains at least one run.
+    """
+    nrows, wim = dark.shape
+
+    # a run starts at column 0 and wherever a pixel differs from its left neighbour
+    run_start = np.empty(dark.shape, dtype=bool)
+    run_start[:, 0] = True
+    np.not_equal(dark[:, 1:], dark[:, :-1], out=run_start[:, 1:])
+    rows, starts = np.nonzero(run_start)
+    del run_start
+
+    row_end = np.empty(len(rows), dtype=bool)
+    row_end[:-1] = rows[1:] != rows[:-1]
+    row_end[-1:] = True
+    ends = np.empty_like(starts)
+    ends[:-1] = starts[1:]
+    ends[row_end] = wim
+
+    laser_on = dark[rows, starts]
+    # the last run of a row takes its state from the next to last pixel
+    laser_on[row_end] = dark[rows[row_end], max(wim-2, 0)]
+
+    rows, starts, ends, row_end = rows[laser_on], starts[laser_on], ends[laser_on], row_end[laser_on]
+
+    # the last run of a row is measured one pixel to the left, as it always was
+    left = starts.copy()
+    right = ends.copy()
+    left[row_end] -= 1
+    right[row_end] = wim-1
+
+    if len(rows) > 0:
+        first = np.flatnonzero(np.concatenate(([True], rows[1:] != rows[:-1])))
+        ext_rows = rows[first]
+        LEFT = np.minimum.reduceat(left, first)
+        RIGHT = np.maximum.reduceat(right, first)
+    else:
+        ext_rows = LEFT = RIGHT = np.zeros(0, dtype=np.intp)
+    return (rows, starts, ends), (ext_rows, LEFT, RIGHT)
+
+
+def scanline_y(rows, height, raster_step):
+    # y in inches of scanlines counted from the top of an image height pixels high
+    return (height - rows*raster_step) / 1000.0
+
+
+def scanline_extents(ext_rows, LEFT, RIGHT, height, raster_step):
+    """Engraved length and number of scanlines, and the convex hull of the engraved area."""
+    LENGTH = sum(((RIGHT - LEFT) / 1000.0).tolist())
+    hcoords = []
+    if len(ext_rows) > 0:
+        y_ext = scanline_y(ext_rows, height, raster_step)
+        hcoords = convex_hull_ecoords(np.concatenate((LEFT / 1000.0, RIGHT / 1000.0)),
+                                      np.concatenate((y_ext, y_ext)))
+    return LENGTH, len(ext_rows), hcoords
+
+
+class PackedRaster:
+    """The scanlines of a raster engraving, one bit per pixel.
+
+    Reads like raster ecoords: iterating gives an [x, y, loop] point in
+    inches for both ends of every laser-on run, row by row from the top,
+    the runs numbered from 2 through the whole image, and len() is the
+    number of points. scanlines() gives the points grouped by
+    scanline in the order the EGV encoder engraves them.
+    """
+    strip_rows = BAND_ROWS
+
+    def __init__(self, packed, width, height, raster_step, run_counts):
+        self.packed = packed
+        self.width = width
+        self.height = height
+        self.raster_step = raster_step
+        self.run_counts = run_counts
+        # runs are numbered through the whole image, from 2 as before
+        self.first_run = np.concatenate(([0], np.cumsum(run_counts, dtype=np.int64)))
+        self.n_scanlines = int(np.count_nonzero(run_counts))
+
+    @classmethod
+    def from_image(cls, image, raster_step):
+        """Pack every raster_step'th row of an image, pixels below 128 are engraved.
+
+        Returns the raster, the engraved length and number of scanlines and
+        the convex hull of the engraved area.
+        """
+        wim, him = image.size
+        nrows = len(range(0, him, raster_step))
+        packed = np.empty((nrows, (wim+7)//8), dtype=np.uint8)
+        run_counts = np.zeros(nrows, dtype=np.int64)
+
+        def strip(first):
+            top = first*raster_step
+            bottom = min(him, (first+cls.strip_rows-1)*raster_step+1)
+            pixels = np.asarray(image.crop((0, top, wim, bottom)).convert("L"))
+            dark = pixels[::raster_step] < 128
+            (rows, starts, ends), (ext_rows, LEFT, RIGHT) = band_scanlines(dark)
+            packed[first:first+len(dark)] = np.packbits(dark, axis=1)
+            run_counts[first:first+len(dark)] = np.bincount(rows, minlength=len(dark))
+            return ext_rows+first, LEFT, RIGHT
+
+        strips = [strip(first) for first in range(0, nrows, cls.strip_rows)]
+
+        if strips:
+            ext_rows, LEFT, RIGHT = (np.concatenate(a) for a in zip(*strips))
+        else:
+            ext_rows = LEFT = RIGHT = np.zeros(0, dtype=np.intp)
+        raster = cls(packed, wim, him, raster_step, run_counts)
+        return (raster,) + scanline_extents(ext_rows, LEFT, RIGHT, him, raster_step)
+
+    def strip_lines(self, first, bottom_up=False):
+        """Yield the points of the scanlines of the strip that starts at scanline first.
+
+        Gives one list of points per scanline, empty for scanlines without
+        laser-on runs, from the top down or from the bottom up.
+        """
+        packed = self.packed[first:first+self.strip_rows]
+        dark = np.unpackbits(packed, axis=1, count=self.width).view(bool)
+        (rows, starts, ends), _ = band_scanlines(dark)
+        x = np.column_stack((starts, ends)).ravel() / 1000.0
+        y = scanline_y(np.arange(first, first+len(packed)), self.height, self.raster_step).tolist()
+        loop = np.repeat(np.arange(2, len(rows)+2) + self.first_run[first], 2)
+        bounds = (2*(self.first_run[first:first+len(packed)+1] - self.first_run[first])).tolist()
+        lines = range(len(packed))
+        if bottom_up:
+            lines = reversed(lines)
+        for i in lines:
+            a, b = bounds[i], bounds[i+1]
+            yield [[xi, y[i], li] for xi, li in zip(x[a:b].tolist(), loop[a:b].tolist())]
+
+    def strip_starts(self, bottom_up=False):
+        strip_starts = range(0, len(self.packed), self.strip_rows)
+        if bottom_up:
+            return reversed(strip_starts)
+        return strip_starts
+
+    def scanlines(self, bottom_up=False, reverse_x=False):
+        """Yield the points of every scanline with laser-on runs.
+
+        Scanlines come from the top down, or from the bottom up, and their
+        points from left to right, or from right to left with reverse_x.
+        Only one strip is unpacked at a time.
+        """
+        for first in self.strip_starts(bottom_up):
+            for line in self.strip_lines(first, bottom_up):
+                if line:
+                    if reverse_x:
+                        line.reverse()
+                    yield line
+
+    def update_hash(self, h):
+        h.update(b"PackedRaster %d %d %d" % (self.width, self.height, self.raster_step))
+        h.update(self.packed)
+
+    def __array__(self, dtype=None, copy=None):
+        # lets EcoordArray.from_coords make the full ecoords, e.g. for plotting
+        out = np.empty((len(self), 3), dtype=dtype or np.float64)
+        i = 0
+        for line in self.scanlines():
+            out[i:i+len(line)] = line
+            i += len(line)
+        return out
+
+    def __len__(self):
+        return 2*int(self.first_run[-1])
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        for line in self.scanlines():
+            yield from line
+
+    def __reversed__(self):
+        for line in self.scanlines(bottom_up=True, reverse_x=True):
+            yield from line
+
+    def __eq__(self, other):
+        if isinstance(other, PackedRaster):
+            return ((self.width, self.height, self.raster_step) ==
+                    (other.width, other.height, other.raster_step) and
+                    np.array_equal(self.packed, other.packed))
+        if len(other) != len(self):
+            return False
+        return list(self) == [list(row) for row in other]
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "PackedRaster(%d scanlines, %d points)" % (self.n_scanlines, len(self))
@@ -17,14 +17,18 @@
     along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """
-from PIL import ImageOps
 import PIL
 from time import time
 import os
-from k40_web.laser_controller.utils import format_time, inch2thou, generate_bezier, ecoords2lines, make_raster_coords, scale_vector_coords, make_trace_path, optimize_paths, mirror_rotate_vector_coords
+from k40_web.laser_controller.utils import DEBUG, format_time, inch2thou, ecoords2lines, make_raster_coords, transform_raster, scale_vector_coords, make_trace_path, optimize_paths, mirror_rotate_vector_coords
 from k40_web.laser_controller.nano_library import K40_CLASS
+from k40_web.laser_controller.fake_nano import FakeNano
 from k40_web.laser_controller.egv import egv
 from k40_web.laser_controller.ecoords import ECoord
+from k40_web.laser_controller.egv_cache import EGV_CACHE_VERSION, EGVCache, job_key
+from k40_web.laser_controller.egv_job import EGVFile, EGVJob
+from k40_web.laser_controller.egv_pool import EGVPool, encode, use_pool
+from k40_web.laser_controller.halftone import HALFTONE_METHODS, generate_bezier
 import json
 from pathlib import Path
 from math import *
@@ -97,6 +101,11 @@ class Laser_Service():
             self.HOME_DIR = ""
 
         self.DESIGN_FILE = (self.HOME_DIR+"/None")
+        self.egv_cache = EGVCache(os.path.join(self.HOME_DIR, ".k40_web", "egv_cache"),
+                                  int(self.egv_cache_size*1e6))
+        self.egv_pool = None
+        self.trace_path = []
+        self.trace_key = None
         self.EGV_FILE = None
 
         self.aspect_ratio = 0
@@ -119,7 +128,8 @@ class Laser_Service():
                                             self.mirror,
                                             self.negate,
                                             self.halftone,
-                                            self.ht_size)
+                                            self.ht_size,
+                                            self.ht_method)
         self.design = Design()
         self.pos_offset = Position(0,0)
 
@@ -202,6 +212,18 @@ class Laser_Service():
         self.pre_pr_crc = value==True
         self.reporter.data("pre_pr_crc", self.pre_pr_crc)
 
+    def set_adaptive_polling(self, value):
+        self.adaptive_polling = value==True
+        self.reporter.data("adaptive_polling", self.adaptive_polling)
+
+    def set_optimize_egv(self, value):
+        self.optimize_egv = value==True
+        self.reporter.data("optimize_egv", self.optimize_egv)
+
+    def set_simulate_laser(self, value):
+        self.simulate_laser = value==True
+        self.reporter.data("simulate_laser", self.simulate_laser)
+
     def set_inside_first(self, value):
         self.inside_first = value==True
         self.reporter.data("inside_first", self.inside_first)
@@ -237,6 +259,8 @@ class Laser_Service():
 
     def Quit_Click(self):
         self.reporter.status("Exiting!")
+        if self.egv_pool != None:
+            self.egv_pool.shutdown()
         self.Release_USB()
 
     # callback laser_pos
@@ -485,6 +509,15 @@ class Laser_Service():
         x, y = generate_bezier(self.bezier_settings, n=num)
         self.reporter.data("bezier_plot", dict(x=x, y=y))
 
+    def set_ht_method(self, value):
+        if value not in HALFTONE_METHODS:
+            self.reporter.error("Halftone method should be one of: %s" % (", ".join(HALFTONE_METHODS)))
+            return
+        self.ht_method = value
+        self.design_transform.ht_method = self.ht_method
+        self.reporter.data("ht_method", self.ht_method)
+        self.Reset_RasterPath_and_Update_Time()
+
     def set_ink_timeout(self, value):
         check_result = self.check_larger_than(value, "Timeout")
         if check_result == 0:
@@ -504,6 +537,12 @@ class Laser_Service():
             self.n_timeouts = int(value)
         self.entry_set("N_Timeouts", check_result)
 
+    def set_egv_processes(self, value):
+        check_result = self.check_larger_than(value, "EGV processes", limit=1)
+        if check_result == 0:
+            self.egv_processes = int(value)
+        self.entry_set("EGV_Processes", check_result)
+
     def set_n_egv_passes(self, value):
         check_result = self.check_larger_than(value, "EGV passes", limit=1)
         if check_result == 0:
@@ -728,56 +767,10 @@ class Laser_Service():
 
     def Open_EGV(self, filemname, n_passes=1):
         self.stop.reset()
-        EGV_data = []
-        value1 = ""
-        value2 = ""
-        value3 = ""
-        value4 = ""
-        data = ""
-        # value1 and value2 are the absolute y and x starting positions
-        # value3 and value4 are the absolute y and x end positions
-        with open(filemname) as f:
-            while True:
-                # Skip header
-                c = f.read(1)
-                while c != "%" and c:
-                    c = f.read(1)
-                # Read 1st Value
-                c = f.read(1)
-                while c != "%" and c:
-                    value1 = value1 + c
-                    c = f.read(1)
-                y_start_mils = int(value1)*self.design_scale
-                # Read 2nd Value
-                c = f.read(1)
-                while c != "%" and c:
-                    value2 = value2 + c
-                    c = f.read(1)
-                x_start_mils = int(value2)*self.design_scale
-                # Read 3rd Value
-                c = f.read(1)
-                while c != "%" and c:
-                    value3 = value3 + c
-                    c = f.read(1)
-                y_end_mils = int(value3)*self.design_scale
-                # Read 4th Value
-                c = f.read(1)
-                while c != "%" and c:
-                    value4 = value4 + c
-                    c = f.read(1)
-                x_end_mils = int(value4)*self.design_scale
-                break
-
-            # Read Data
-            while True:
-                c = f.read(1)
-                if not c:
-                    break
-                if c == '\n' or c == ' ' or c == '\r':
-                    pass
-                else:
-                    data = data+"%c" % c
-                    EGV_data.append(ord(c)*self.design_scale)
+        egv_file = EGVFile(filemname)
+        # the absolute y and x starting and end positions
+        y_start_mils, x_start_mils, y_end_mils, x_end_mils = [
+            v*self.design_scale for v in egv_file.positions]
 
         if ((x_end_mils != 0) or (y_end_mils != 0)):
             n_passes = 1
@@ -785,8 +778,10 @@ class Laser_Service():
             x_start_mils = 0
             y_start_mils = 0
 
+        EGV_data = EGVJob(egv_file.head)
+        EGV_data.add(egv_file, n_passes)
         try:
-            self.send_egv_data(EGV_data, n_passes)
+            self.send_egv_data(EGV_data, 1)
         except MemoryError as e:
             msg1 = "Memory Error:"
             msg2 = "Memory Error:  Out of Memory."
@@ -803,7 +798,7 @@ class Laser_Service():
         # rapid move back to starting position
         dxmils = -(x_end_mils - x_start_mils)
         dymils = y_end_mils - y_start_mils
-        self.Send_Rapid_Move(dxmils, dxmils)
+        self.Send_Rapid_Move(dxmils, dymils)
         self.stop.set()
 
     #####################################################################
@@ -1003,12 +998,11 @@ class Laser_Service():
         if int(dxmils) == 0 and int(dymils) == 0:
             return
         self.stop.reset()
-        Rapid_data = []
-        Rapid_inst = egv(target=lambda s: Rapid_data.append(s))
+        Rapid_inst = egv()
         Rapid_feed = float(self.rapid_feed)/self.units.velocity_scale()
         Rapid_inst.make_egv_rapid(
             dxmils, dymils, Feed=Rapid_feed, board_name=self.board_name)
-        self.send_egv_data(Rapid_data, 1, None)
+        self.send_egv_data(Rapid_inst.data, 1, None)
         self.stop.set()
 
     def Vector_Cut(self, output_filename=None):
@@ -1139,227 +1133,43 @@ class Laser_Service():
 
     def make_trace_path(self):
         if self.inputCSYS and self.design.RengData.image == None:
-            bounds = 0.0, 0.0, 0.0, 0.0
+            bounds = DesignBounds(0.0, 0.0, 0.0, 0.0)
         else:
             bounds = self.Get_Design_Bounds()
-        
-        Vcut_coords = mirror_rotate_vector_coords(self.design.VcutData.ecoords, self.design.bounds, self.design_transform)
-        Veng_coords = mirror_rotate_vector_coords(self.design.VengData.ecoords, self.design.bounds, self.design_transform)
-        Gcode_coords = mirror_rotate_vector_coords(self.design.GcodeData.ecoords, self.design.bounds, self.design_transform)
-        
+
         if self.design.RengData.ecoords == []:
             self.make_raster_coords()
-        return make_trace_path(bounds, self.laser_scale, self.design.RengData, Vcut_coords, Veng_coords, Gcode_coords, self.trace_gap, self.is_rotary)
+
+        # the path is made again only when the design or its transform changed
+        key = job_key(bounds.bounds, self.design.bounds.bounds,
+                      self.design_transform.rotate, self.design_transform.mirror,
+                      self.laser_scale.aslist(), self.trace_gap, self.is_rotary,
+                      self.design.VcutData.content_hash(), self.design.VengData.content_hash(),
+                      self.design.GcodeData.content_hash(), self.design.RengData.hull_coords)
+        if key != self.trace_key:
+            Vcut_coords = mirror_rotate_vector_coords(self.design.VcutData.ecoords, self.design.bounds, self.design_transform)
+            Veng_coords = mirror_rotate_vector_coords(self.design.VengData.ecoords, self.design.bounds, self.design_transform)
+            Gcode_coords = mirror_rotate_vector_coords(self.design.GcodeData.ecoords, self.design.bounds, self.design_transform)
+            self.trace_path = make_trace_path(bounds, self.laser_scale, self.design.RengData, Vcut_coords, Veng_coords, Gcode_coords, self.trace_gap, self.is_rotary)
+            self.trace_key = key
+        return self.trace_path
 
     ################################################################################
 
     def send_data(self, operation_type=None, output_filename=None):
-        num_passes = 0
         if self.k40 == None and output_filename == None:
             self.reporter.error("Laser Cutter is not Initialized...")
             return
         try:
-            feed_factor = self.units.velocity_scale()
-            xmin, xmax, ymin, ymax = self.Get_Design_Bounds().bounds
-
-            startx = xmin
-            starty = ymax
-
-            if self.HomeUR:
-                FlipXoffset = abs(xmax-xmin)
-                if self.rotate:
-                    startx = -xmin
+            key = self.job_key(operation_type)
+            data = self.egv_cache.get(key)
+            if data == None:
+                data = self.make_job_data(operation_type)
+                if not self.stop:
+                    self.egv_cache.put(key, data.dumps())
             else:
-                FlipXoffset = 0
-
-            if self.is_rotary:
-                Rapid_Feed = float(self.rapid_feed)*feed_factor
-            else:
-                Rapid_Feed = 0.0
-
-            Raster_Eng_data = []
-            Vector_Eng_data = []
-            Trace_Eng_data = []
-            Vector_Cut_data = []
-            G_code_Cut_data = []
-
-            if (operation_type.find("Vector_Cut") > -1) and (self.design.VcutData.ecoords != []) and not self.stop:
-                Feed_Rate = float(self.Vcut_feed)*feed_factor
-                self.reporter.status("Vector Cut: Determining Cut Order....")
-                #self.master.update()
-                if not self.design.VcutData.sorted and self.inside_first:
-                    self.design.VcutData.set_ecoords(optimize_paths(
-                        self.design.VcutData.ecoords), data_sorted=True)
-
-                self.reporter.status("Generating EGV data...")
-                #self.master.update()
-
-                Vcut_coords = self.design.VcutData.ecoords
-                Vcut_coords = mirror_rotate_vector_coords(Vcut_coords, self.design.bounds, self.design_transform)
-
-                Vcut_coords, startx, starty = scale_vector_coords(
-                    Vcut_coords, startx, starty, self.laser_scale, self.is_rotary)
-                Vector_Cut_egv_inst = egv(
-                    target=lambda s: Vector_Cut_data.append(s))
-                Vector_Cut_egv_inst.make_egv_data(
-                    Vcut_coords,
-                    startX=startx,
-                    startY=starty,
-                    units="mm", # mm is internal unit # self.units.length_unit(),
-                    Feed=Feed_Rate,
-                    board_name=self.board_name,
-                    Raster_step=0,
-                    reporter=self.reporter,
-                    stop_calc=self.stop,
-                    FlipXoffset=FlipXoffset,
-                    Rapid_Feed_Rate=Rapid_Feed,
-                    use_laser=True
-                )
-
-            if (operation_type.find("Vector_Eng") > -1) and (self.design.VengData.ecoords != []) and not self.stop:
-                Feed_Rate = float(self.Veng_feed)*feed_factor
-                self.reporter.status(
-                    "Vector Engrave: Determining Cut Order....")
-                ##self.master.update()
-                if not self.design.VengData.sorted and self.inside_first:
-                    self.design.VengData.set_ecoords(optimize_paths(
-                        self.design.VengData.ecoords, inside_check=False), data_sorted=True)
-                self.reporter.status("Generating EGV data...")
-                #self.master.update()
-
-                Veng_coords = self.design.VengData.ecoords
-                Veng_coords = mirror_rotate_vector_coords(Veng_coords, self.design.bounds, self.design_transform)
-
-                Veng_coords, startx, starty = self.scale_vector_coords(
-                    Veng_coords, startx, starty, self.laser_scale, self.is_rotary)
-                Vector_Eng_egv_inst = egv(
-                    target=lambda s: Vector_Eng_data.append(s))
-                Vector_Eng_egv_inst.make_egv_data(
-                    Veng_coords,
-                    startX=startx,
-                    startY=starty,
-                    units="mm",
-                    Feed=Feed_Rate,
-                    board_name=self.board_name,
-                    Raster_step=0,
-                    reporter=self.reporter,
-                    stop_calc=self.stop,
-                    FlipXoffset=FlipXoffset,
-                    Rapid_Feed_Rate=Rapid_Feed,
-                    use_laser=True
-                )
-
-            if (operation_type.find("Trace_Eng") > -1) and (self.trace_coords != []) and not self.stop:
-                Feed_Rate = float(self.trace_speed)*feed_factor
-                laser_on = self.trace_w_laser
-                self.reporter.status("Generating EGV data...")
-                Trace_Eng_egv_inst = egv(
-                    target=lambda s: Trace_Eng_data.append(s))
-                Trace_Eng_egv_inst.make_egv_data(
-                    self.trace_coords,
-                    startX=startx,
-                    startY=starty,
-                    units="mm",
-                    Feed=Feed_Rate,
-                    board_name=self.board_name,
-                    Raster_step=0,
-                    reporter=self.reporter,
-                    stop_calc=self.stop,
-                    FlipXoffset=FlipXoffset,
-                    Rapid_Feed_Rate=Rapid_Feed,
-                    use_laser=laser_on
-                )
-
-            if (operation_type.find("Raster_Eng") > -1) and (self.design.RengData.ecoords != []) and not self.stop:
-                Feed_Rate = self.Reng_feed*feed_factor
-                Raster_step = inch2thou(self.rast_step)
-                if not self.engrave_up:
-                    Raster_step = -Raster_step
-
-                raster_startx = 0
-
-                Yscale = self.laser_pos.yscale
-                if self.is_rotary:
-                    Yscale = Yscale*self.laser_scale.r
-                raster_starty = Yscale*starty
-
-                self.reporter.status("Generating EGV data...")
-                Raster_Eng_egv_inst = egv(
-                    target=lambda s: Raster_Eng_data.append(s))
-                Raster_Eng_egv_inst.make_egv_data(
-                    self.design.RengData.ecoords,
-                    startX=raster_startx,
-                    startY=raster_starty,
-                    units="mm",
-                    Feed=Feed_Rate,
-                    board_name=self.board_name,
-                    Raster_step=Raster_step,
-                    reporter=self.reporter,
-                    stop_calc=self.stop,
-                    FlipXoffset=FlipXoffset,
-                    Rapid_Feed_Rate=Rapid_Feed,
-                    use_laser=True
-                )
-                # self.design.RengData.reset_path()
-
-            if (operation_type.find("Gcode_Cut") > -1) and (self.design.GcodeData.ecoords != []) and not self.stop:
-                self.reporter.status("Generating EGV data...")
-                Gcode_coords = self.design.GcodeData.ecoords
-                Gcode_coords = mirror_rotate_vector_coords(Gcode_coords, self.design.bounds, self.design_transform)
-
-                Gcode_coords, startx, starty = scale_vector_coords(
-                    Gcode_coords, startx, starty, self.laser_scale, self.is_rotary)
-                G_code_Cut_egv_inst = egv(
-                    target=lambda s: G_code_Cut_data.append(s))
-                G_code_Cut_egv_inst.make_egv_data(
-                    Gcode_coords,
-                    startX=startx,
-                    startY=starty,
-                    Feed=None,
-                    board_name=self.board_name,
-                    Raster_step=0,
-                    reporter=self.reporter,
-                    stop_calc=self.stop,
-                    FlipXoffset=FlipXoffset,
-                    Rapid_Feed_Rate=Rapid_Feed,
-                    use_laser=True
-                )
-
-            ### Join Resulting Data together ###
-            data = []
-            data.append(ord("I"))
-            if Trace_Eng_data != []:
-                trace_passes = 1
-                for k in range(trace_passes):
-                    if len(data) > 4:
-                        data[-4] = ord("@")
-                    data.extend(Trace_Eng_data)
-            if Raster_Eng_data != []:
-                num_passes = int(float(self.Reng_passes))
-                for k in range(num_passes):
-                    if len(data) > 4:
-                        data[-4] = ord("@")
-                    data.extend(Raster_Eng_data)
-            if Vector_Eng_data != []:
-                num_passes = int(float(self.Veng_passes))
-                for k in range(num_passes):
-                    if len(data) > 4:
-                        data[-4] = ord("@")
-                    data.extend(Vector_Eng_data)
-            if Vector_Cut_data != []:
-                num_passes = int(float(self.Vcut_passes))
-                for k in range(num_passes):
-                    if len(data) > 4:
-                        data[-4] = ord("@")
-                    data.extend(Vector_Cut_data)
-            if G_code_Cut_data != []:
-                num_passes = int(float(self.Gcde_passes))
-                for k in range(num_passes):
-                    if len(data) > 4:
-                        data[-4] = ord("@")
-                    data.extend(G_code_Cut_data)
-            if len(data) < 4:
-                raise Exception("No laser data was generated.")
+                data = EGVJob.loads(data)
+                self.reporter.status("Using cached EGV data...")
 
             if self.stop:
                 return
@@ -1382,14 +1192,220 @@ class Laser_Service():
                 formatted_lines = traceback.format_exc().splitlines()
             self.reporter.error((msg1+msg2).split("\n")[0])
 
+    def job_key(self, operation_type):
+        # everything make_job_data reads, so equal keys mean equal data
+        key = [EGV_CACHE_VERSION, operation_type, self.board_name, self.units.velocity_scale(),
+               self.Get_Design_Bounds().bounds, self.design.bounds.bounds,
+               self.rotate, self.design_transform.rotate, self.design_transform.mirror,
+               self.laser_scale.aslist(), self.is_rotary, self.HomeUR,
+               self.is_rotary and self.rapid_feed, self.optimize_egv]
+        if operation_type.find("Vector_Cut") > -1:
+            key += [self.design.VcutData.content_hash(), self.Vcut_feed, self.Vcut_passes,
+                    self.design.VcutData.sorted or self.inside_first]
+        if operation_type.find("Vector_Eng") > -1:
+            key += [self.design.VengData.content_hash(), self.Veng_feed, self.Veng_passes,
+                    self.design.VengData.sorted or self.inside_first]
+        if operation_type.find("Trace_Eng") > -1:
+            key += [self.trace_coords, self.trace_speed, self.trace_w_laser]
+        if operation_type.find("Raster_Eng") > -1:
+            key += [self.design.RengData.content_hash(), self.Reng_feed, self.Reng_passes,
+                    self.rast_step, self.engrave_up]
+        if operation_type.find("Gcode_Cut") > -1:
+            key += [self.design.GcodeData.content_hash(), self.Gcde_passes]
+        return job_key(*key)
+
+    def make_job_data(self, operation_type):
+        feed_factor = self.units.velocity_scale()
+        xmin, xmax, ymin, ymax = self.Get_Design_Bounds().bounds
+
+        startx = xmin
+        starty = ymax
+
+        if self.HomeUR:
+            FlipXoffset = abs(xmax-xmin)
+            if self.rotate:
+                startx = -xmin
+        else:
+            FlipXoffset = 0
+
+        if self.is_rotary:
+            Rapid_Feed = float(self.rapid_feed)*feed_factor
+        else:
+            Rapid_Feed = 0.0
+
+        # encoder input of each operation, see encode_operations
+        operations = {}
+
+        if (operation_type.find("Vector_Cut") > -1) and (self.design.VcutData.ecoords != []) and not self.stop:
+            Feed_Rate = float(self.Vcut_feed)*feed_factor
+            self.reporter.status("Vector Cut: Determining Cut Order....")
+            #self.master.update()
+            if not self.design.VcutData.sorted and self.inside_first:
+                self.design.VcutData.set_ecoords(optimize_paths(
+                    self.design.VcutData.ecoords), data_sorted=True,
+                    content_hash=self.design.VcutData.content_hash())
+
+            self.reporter.status("Generating EGV data...")
+            #self.master.update()
+
+            Vcut_coords = self.design.VcutData.ecoords
+            Vcut_coords = mirror_rotate_vector_coords(Vcut_coords, self.design.bounds, self.design_transform)
+
+            Vcut_coords, startx, starty = scale_vector_coords(
+                Vcut_coords, startx, starty, self.laser_scale, self.is_rotary)
+            operations["Vector_Cut"] = (Vcut_coords, dict(
+                startX=startx,
+                startY=starty,
+                units="mm", # mm is internal unit # self.units.length_unit(),
+                Feed=Feed_Rate,
+                board_name=self.board_name,
+                Raster_step=0,
+                FlipXoffset=FlipXoffset,
+                Rapid_Feed_Rate=Rapid_Feed,
+                use_laser=True
+            ))
+
+        if (operation_type.find("Vector_Eng") > -1) and (self.design.VengData.ecoords != []) and not self.stop:
+            Feed_Rate = float(self.Veng_feed)*feed_factor
+            self.reporter.status(
+                "Vector Engrave: Determining Cut Order....")
+            ##self.master.update()
+            if not self.design.VengData.sorted and self.inside_first:
+                self.design.VengData.set_ecoords(optimize_paths(
+                    self.design.VengData.ecoords, inside_check=False), data_sorted=True,
+                    content_hash=self.design.VengData.content_hash())
+            self.reporter.status("Generating EGV data...")
+            #self.master.update()
+
+            Veng_coords = self.design.VengData.ecoords
+            Veng_coords = mirror_rotate_vector_coords(Veng_coords, self.design.bounds, self.design_transform)
+
+            Veng_coords, startx, starty = scale_vector_coords(
+                Veng_coords, startx, starty, self.laser_scale, self.is_rotary)
+            operations["Vector_Eng"] = (Veng_coords, dict(
+                startX=startx,
+                startY=starty,
+                units="mm",
+                Feed=Feed_Rate,
+                board_name=self.board_name,
+                Raster_step=0,
+                FlipXoffset=FlipXoffset,
+                Rapid_Feed_Rate=Rapid_Feed,
+                use_laser=True
+            ))
+
+        if (operation_type.find("Trace_Eng") > -1) and (self.trace_coords != []) and not self.stop:
+            Feed_Rate = float(self.trace_speed)*feed_factor
+            laser_on = self.trace_w_laser
+            self.reporter.status("Generating EGV data...")
+            operations["Trace_Eng"] = (self.trace_coords, dict(
+                startX=startx,
+                startY=starty,
+                units="mm",
+                Feed=Feed_Rate,
+                board_name=self.board_name,
+                Raster_step=0,
+                FlipXoffset=FlipXoffset,
+                Rapid_Feed_Rate=Rapid_Feed,
+                use_laser=laser_on
+            ))
+
+        if (operation_type.find("Raster_Eng") > -1) and (self.design.RengData.ecoords != []) and not self.stop:
+            Feed_Rate = self.Reng_feed*feed_factor
+            Raster_step = inch2thou(self.rast_step)
+            if not self.engrave_up:
+                Raster_step = -Raster_step
+
+            raster_startx = 0
+
+            Yscale = self.laser_scale.y
+            if self.is_rotary:
+                Yscale = Yscale*self.laser_scale.r
+            raster_starty = Yscale*starty
+
+            self.reporter.status("Generating EGV data...")
+            operations["Raster_Eng"] = (self.design.RengData.ecoords, dict(
+                startX=raster_startx,
+                startY=raster_starty,
+                units="mm",
+                Feed=Feed_Rate,
+                board_name=self.board_name,
+                Raster_step=Raster_step,
+                FlipXoffset=FlipXoffset,
+                Rapid_Feed_Rate=Rapid_Feed,
+                use_laser=True
+            ))
+            # self.design.RengData.reset_path()
+
+        if (operation_type.find("Gcode_Cut") > -1) and (self.design.GcodeData.ecoords != []) and not self.stop:
+            self.reporter.status("Generating EGV data...")
+            Gcode_coords = self.design.GcodeData.ecoords
+            Gcode_coords = mirror_rotate_vector_coords(Gcode_coords, self.design.bounds, self.design_transform)
+
+            Gcode_coords, startx, starty = scale_vector_coords(
+                Gcode_coords, startx, starty, self.laser_scale, self.is_rotary)
+            operations["Gcode_Cut"] = (Gcode_coords, dict(
+                startX=startx,
+                startY=starty,
+                Feed=None,
+                board_name=self.board_name,
+                Raster_step=0,
+                FlipXoffset=FlipXoffset,
+                Rapid_Feed_Rate=Rapid_Feed,
+                use_laser=True
+            ))
+
+        encoded = self.encode_operations(operations)
+
+        ### Join Resulting Data together ###
+        job = EGVJob()
+        bytes_saved = 0
+        for name, passes in (("Trace_Eng", 1),
+                             ("Raster_Eng", int(float(self.Reng_passes))),
+                             ("Vector_Eng", int(float(self.Veng_passes))),
+                             ("Vector_Cut", int(float(self.Vcut_passes))),
+                             ("Gcode_Cut", int(float(self.Gcde_passes)))):
+            if name in encoded:
+                data, saved = encoded[name]
+                job.add(data, passes)
+                bytes_saved += saved*passes
+        if self.optimize_egv:
+            self.reporter.data("egv_bytes_saved", bytes_saved)
+        if len(job) < 4:
+            raise Exception("No laser data was generated.")
+        return job
+
+    def encode_operations(self, operations):
+        """Encode the operations, in worker processes if there are several large ones.
+
+        Returns the EGV data and bytes saved by optimize_egv by operation.
+        """
+        jobs = [(ecoords, settings, self.optimize_egv)
+                for ecoords, settings in operations.values()]
+        if use_pool(jobs, self.egv_processes):
+            if self.egv_pool == None or self.egv_pool.processes != self.egv_processes:
+                if self.egv_pool != None:
+                    self.egv_pool.shutdown()
+                self.egv_pool = EGVPool(self.egv_processes)
+            results = self.egv_pool.map(jobs, self.reporter, self.stop)
+        else:
+            results = [encode(*job, reporter=self.reporter, stop_calc=self.stop)
+                       for job in jobs]
+        return dict(zip(operations, results))
+
+
     def send_egv_data(self, data, num_passes=1, output_filename=None):
         pre_process_CRC = self.pre_pr_crc
         if self.k40 != None:
             self.k40.set_timeout(int(float(self.t_timeout)))
             self.k40.set_n_timeouts(int(float(self.n_timeouts)))
+            self.k40.set_adaptive_polling(self.adaptive_polling)
             time_start = time()
-            self.k40.send_data(data, self.reporter, self.stop,
-                               num_passes, pre_process_CRC, True)
+            try:
+                self.k40.send_data(data, self.reporter, self.stop,
+                                   num_passes, pre_process_CRC, True)
+            finally:
+                self.reporter.data("send_stats", dict(self.k40.stats))
             self.run_time = time()-time_start
             if DEBUG:
                 print(("Elapsed Time: %.6f" % (time()-time_start)))
@@ -1406,21 +1422,20 @@ class Laser_Service():
         if len(data) == 0:
             raise Exception("No data available to write to file.")
         try:
-            fout = open(fname, 'w')
+            fout = open(fname, 'wb')
         except:
             raise Exception(
                 "Unable to open file ( %s ) for writing." % (fname))
-        fout.write("Document type : LHYMICRO-GL file\n")
-        fout.write("Creator-Software: K40 Whisperer\n")
-
-        fout.write("\n")
-        fout.write("%0%0%0%0%")
-        for char_val in data:
-            char = chr(char_val)
-            fout.write("%s" % (char))
-
-        # fout.write("\n")
-        fout.close
+        with fout:
+            fout.write(b"Document type : LHYMICRO-GL file\n")
+            fout.write(b"Creator-Software: K40 Whisperer\n")
+
+            fout.write(b"\n")
+            fout.write(b"%0%0%0%0%")
+            if isinstance(data, EGVJob):
+                fout.writelines(data.chunks())
+            else:
+                fout.write(data)
         self.menu_View_Refresh()
         self.reporter.status("Data saved to: %s" % (fname))
 
@@ -1483,6 +1498,10 @@ class Laser_Service():
             self.k40.pause_un_pause()
 
 
+    def Clear_EGV_Cache(self):
+        self.egv_cache.clear()
+        self.reporter.status("EGV cache cleared")
+
     def Release_USB(self):
         if self.k40 != None:
             try:
@@ -1505,7 +1524,10 @@ class Laser_Service():
         self.k40 = K40_CLASS()
 
         try:
-            self.k40.initialize_device(None, False)
+            if self.simulate_laser:
+                self.k40.attach_device(FakeNano(packet_time=0.002))
+            else:
+                self.k40.initialize_device(None, False)
             self.k40.say_hello()
             if self.init_home:
                 self.Home()
@@ -1599,34 +1621,15 @@ class Laser_Service():
         if self.design.RengData.image != None:
             if self.include_Reng:
                 try:
-                    self.Reng_image = self.design.RengData.image.convert("L")
+                    self.Reng_image = transform_raster(self.design.RengData.image)
                     input_dpi = 1000*self.design_scale
-                    wim, him = self.design.RengData.image.size
                     new_SCALE = self.SCALE #(1.0/self.PlotScale)/input_dpi #FIXME
                     if new_SCALE != self.SCALE:
                         self.SCALE = new_SCALE
-                        nw = int(self.SCALE*wim)
-                        nh = int(self.SCALE*him)
-
-                        plot_im = self.design.RengData.image.convert("L")
-
-                        if self.negate:
-                            plot_im = ImageOps.invert(plot_im)
-
-                        if self.halftone == False:
-                            plot_im = plot_im.point(
-                                lambda x: 0 if x < 128 else 255, '1')
-                            plot_im = plot_im.convert("L")
-
-                        if self.mirror:
-                            plot_im = ImageOps.mirror(plot_im)
-
-                        if self.rotate:
-                            plot_im = plot_im.rotate(90, expand=True)
-                            nh = int(self.SCALE*wim)
-                            nw = int(self.SCALE*him)
-
-                        self.Reng_image = plot_im.resize((nw, nh), PIL.Image.ANTIALIAS)
+                        self.Reng_image = transform_raster(
+                            self.design.RengData.image, self.negate, self.mirror, self.rotate,
+                            self.SCALE, self.SCALE, threshold=self.halftone == False,
+                            resample=PIL.Image.LANCZOS)
                     #self.reporter.data("Reng_image", self.Reng_image.tobytes()) #FIXME
                 except:
                     self.SCALE = 1
@@ -23,6 +23,16 @@ import re
 import math
 
 
+DELIM = re.compile(r'[ \t\r\n,]+')
+COMMAND = re.compile(r'[MLHVCSQTAZmlhvcsqtaz]')
+PARAMETER = re.compile(
+    r'(([-+]?[0-9]+(\.[0-9]*)?|[-+]?\.[0-9]+)([eE][-+]?[0-9]+)?)')
+# path data split at the commands, and the parameters between them
+SPLIT = re.compile(r'([MLHVCSQTAZmlhvcsqtaz])')
+NUMBER = re.compile(r'[-+]?(?:[0-9]+(?:\.[0-9]*)?|\.[0-9]+)(?:[eE][-+]?[0-9]+)?')
+DELIMITERS = ' \t\r\n,'
+
+
 def lexPath(d):
     """
     returns and iterator that breaks path data 
@@ -30,22 +40,18 @@ def lexPath(d):
     """
     offset = 0
     length = len(d)
-    delim = re.compile(r'[ \t\r\n,]+')
-    command = re.compile(r'[MLHVCSQTAZmlhvcsqtaz]')
-    parameter = re.compile(
-        r'(([-+]?[0-9]+(\.[0-9]*)?|[-+]?\.[0-9]+)([eE][-+]?[0-9]+)?)')
     while 1:
-        m = delim.match(d, offset)
+        m = DELIM.match(d, offset)
         if m:
             offset = m.end()
         if offset >= length:
             break
-        m = command.match(d, offset)
+        m = COMMAND.match(d, offset)
         if m:
             yield [d[offset:m.end()], True]
             offset = m.end()
             continue
-        m = parameter.match(d, offset)
+        m = PARAMETER.match(d, offset)
         if m:
             yield [d[offset:m.end()], False]
             offset = m.end()
@@ -76,6 +82,34 @@ pathdefs = {
     'Z': ['L', 0, [], []]
 }
 
+# for every command: its absolute command, the command numbers after it
+# belong to, the number of parameters, which of them are flags, and which
+# are offset by pen x and y when the command is relative
+COMMANDS = {}
+for _command, (_next, _count, _casts, _types) in pathdefs.items():
+    _flags = [i for i in range(_count) if _casts[i] == int]
+    _xs = [i for i in range(_count) if _types[i] == 'x']
+    _ys = [i for i in range(_count) if _types[i] == 'y']
+    COMMANDS[_command] = (_command, _next, _count, _flags, [], [])
+    COMMANDS[_command.lower()] = (_command, _next.lower(), _count, _flags, _xs, _ys)
+
+
+def tokenize(d):
+    """Commands of path data with their parameters as floats.
+
+    Returns a list of [command, params] pairs, the parameters given before
+    the first command with None for the command.
+    """
+    parts = SPLIT.split(d)
+    commands = [None] + parts[1::2]
+    numbers = list(map(NUMBER.findall, parts[0::2]))
+    # anything but commands, parameters and delimiters is invalid
+    used = (len(commands)-1 + sum(map(len, map(''.join, numbers))) +
+            sum(map(d.count, DELIMITERS)))
+    if used != len(d):
+        raise ValueError('Invalid path data!')
+    return [[command, list(map(float, params))] for command, params in zip(commands, numbers)]
+
 
 def parsePath(d):
     """
@@ -84,89 +118,73 @@ def parsePath(d):
     Converts coordinates to absolute.
     """
     retval = []
-    lexer = lexPath(d)
+    tokens = tokenize(d)
 
     pen = (0.0, 0.0)
     subPathStart = pen
     lastControl = pen
     lastCommand = ''
 
-    while 1:
-        try:
-            token, isCommand = next(lexer)
-        except StopIteration:
-            break
-        params = []
-        needParam = True
-        if isCommand:
-            if not lastCommand and token.upper() != 'M':
-                raise Exception('Invalid path, must begin with moveto.')
+    if tokens[0][1]:
+        raise ValueError('Invalid path, no initial command.')
+    last = len(tokens)-1
+    for k in range(1, len(tokens)):
+        command, numbers = tokens[k]
+        if not lastCommand and command.upper() != 'M':
+            raise ValueError('Invalid path, must begin with moveto.')
+        nnumbers = len(numbers)
+        i = 0
+        while 1:
+            outputCommand, implicit, numParams, flags, xs, ys = COMMANDS[command]
+            params = numbers[i:i+numParams]
+            i += numParams
+            if i > nnumbers:
+                if k < last:
+                    raise ValueError('Invalid number of parameters')
+                raise ValueError('Unexpected end of path')
+            for j in flags:
+                params[j] = int(params[j])
+            for j in xs:
+                params[j] += pen[0]
+            for j in ys:
+                params[j] += pen[1]
+            # segment is now absolute
+
+            # Flesh out shortcut notation
+            if outputCommand in ('H', 'V'):
+                if outputCommand == 'H':
+                    params.append(pen[1])
+                if outputCommand == 'V':
+                    params.insert(0, pen[0])
+                outputCommand = 'L'
+            if outputCommand in ('S', 'T'):
+                params.insert(0, pen[1]+(pen[1]-lastControl[1]))
+                params.insert(0, pen[0]+(pen[0]-lastControl[0]))
+                if outputCommand == 'S':
+                    outputCommand = 'C'
+                if outputCommand == 'T':
+                    outputCommand = 'Q'
+
+            # current values become "last" values
+            if outputCommand == 'M':
+                subPathStart = tuple(params[0:2])
+                pen = subPathStart
+            if outputCommand == 'Z':
+                pen = subPathStart
             else:
-                command = token
-        else:
-            # command was omited
-            # use last command's implicit next command
-            needParam = False
-            if lastCommand:
-                if lastCommand.isupper():
-                    command = pathdefs[lastCommand][0]
-                else:
-                    command = pathdefs[lastCommand.upper()][0].lower()
+                pen = tuple(params[-2:])
+
+            if outputCommand in ('Q', 'C'):
+                lastControl = tuple(params[-4:-2])
             else:
-                raise Exception('Invalid path, no initial command.')
-        numParams = pathdefs[command.upper()][1]
-        while numParams > 0:
-            if needParam:
-                try:
-                    token, isCommand = next(lexer)
-                    if isCommand:
-                        raise Exception('Invalid number of parameters')
-                except StopIteration:
-                    raise Exception('Unexpected end of path')
-            cast = pathdefs[command.upper()][2][-numParams]
-            param = cast(token)
-            if command.islower():
-                if pathdefs[command.upper()][3][-numParams] == 'x':
-                    param += pen[0]
-                elif pathdefs[command.upper()][3][-numParams] == 'y':
-                    param += pen[1]
-            params.append(param)
-            needParam = True
-            numParams -= 1
-        # segment is now absolute so
-        outputCommand = command.upper()
-
-        # Flesh out shortcut notation
-        if outputCommand in ('H', 'V'):
-            if outputCommand == 'H':
-                params.append(pen[1])
-            if outputCommand == 'V':
-                params.insert(0, pen[0])
-            outputCommand = 'L'
-        if outputCommand in ('S', 'T'):
-            params.insert(0, pen[1]+(pen[1]-lastControl[1]))
-            params.insert(0, pen[0]+(pen[0]-lastControl[0]))
-            if outputCommand == 'S':
-                outputCommand = 'C'
-            if outputCommand == 'T':
-                outputCommand = 'Q'
-
-        # current values become "last" values
-        if outputCommand == 'M':
-            subPathStart = tuple(params[0:2])
-            pen = subPathStart
-        if outputCommand == 'Z':
-            pen = subPathStart
-        else:
-            pen = tuple(params[-2:])
-
-        if outputCommand in ('Q', 'C'):
-            lastControl = tuple(params[-4:-2])
-        else:
-            lastControl = pen
-        lastCommand = command
-
-        retval.append([outputCommand, params])
+                lastControl = pen
+            lastCommand = command
+
+            retval.append([outputCommand, params])
+            if i >= nnumbers:
+                break
+            # parameters without a command: use last command's implicit next command
+            command = implicit
     return retval
 
 
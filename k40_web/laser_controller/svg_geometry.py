@@ -0,0 +1,180 @@
+'''
+Flattened outlines of the SVG basic shapes and of paths.
+
+SVG_READER used to write every rect, circle, ellipse, polygon, polyline
+and line out as path data, parse it back into cubic Beziers and subdivide
+those. The shapes are turned into point arrays here instead: straight
+edges are kept as they are and arcs are sampled at an angle step that
+keeps every chord within the flatness of the arc.
+
+The cubic Beziers of paths are flattened by flatten_csp, all curves of a
+path at once: the number of steps of every curve follows from the second
+differences of its control points, so there is no recursive subdivision.
+path_nodes keeps the nodes of recently parsed path data, as the same
+glyphs tend to come back many times in text converted to paths.
+
+Points are arrays of shape (n, 2). The transform mat is the 2x3 matrix of
+simpletransform, and the flatness is measured after it is applied.
+'''
+import re
+from functools import lru_cache
+from math import ceil, pi, sqrt
+
+import numpy as np
+
+import k40_web.laser_controller.cubicsuperpath as cubicsuperpath
+
+# the most steps a single curve is cut into
+MAX_CURVE_STEPS = 10000
+# parsed path data kept by path_nodes
+PATH_CACHE_SIZE = 512
+
+NUMBER = re.compile(r'[-+]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?')
+
+
+def transform_points(points, mat):
+    A = np.asarray(mat, dtype=np.float64)
+    return points @ A[:, :2].T + A[:, 2]
+
+
+def transform_scale(mat):
+    """The most a length is stretched by the transform mat."""
+    return float(np.linalg.norm(np.asarray(mat, dtype=np.float64)[:, :2], 2))
+
+
+def arc_points(cx, cy, rx, ry, start, end, flatness, scale=1.0):
+    """Points along an elliptical arc from angle start to end, ends included.
+
+    A chord of a curve with curvature radius at most R, spanning the angle
+    step dt, lies within R*dt**2/8 of it.
+    """
+    R = max(abs(rx), abs(ry))*scale
+    span = abs(end-start)
+    n = 1
+    if R > 0.0 and flatness > 0.0:
+        n = max(1, int(ceil(span/sqrt(8.0*flatness/R))))
+    t = np.linspace(start, end, n+1)
+    return np.column_stack((cx + rx*np.cos(t), cy + ry*np.sin(t)))
+
+
+def ellipse_points(cx, cy, rx, ry, flatness, scale=1.0):
+    # a closed loop from (cx+rx, cy), at least a segment per quarter as the four arcs had
+    points = [arc_points(cx, cy, rx, ry, k*pi/2, (k+1)*pi/2, flatness, scale) for k in range(4)]
+    return np.concatenate([points[0]] + [p[1:] for p in points[1:]])
+
+
+def rect_points(x, y, width, height, rx, ry, flatness, scale=1.0):
+    """Closed outline of a rect, its corners rounded by rx and ry."""
+    if max(rx, ry) > 0.0:
+        corners = [(x+width-rx, y+ry), (x+width-rx, y+height-ry), (x+rx, y+height-ry), (x+rx, y+ry)]
+        arcs = [arc_points(cx, cy, rx, ry, (k-1)*pi/2, k*pi/2, flatness, scale)
+                for k, (cx, cy) in enumerate(corners)]
+        points = np.concatenate(arcs)
+    else:
+        points = np.array([[x, y], [x+width, y], [x+width, y+height], [x, y+height]], dtype=np.float64)
+    return np.concatenate((points, points[:1]))
+
+
+def parse_points(points):
+    """x, y pairs of the points attribute of a polygon or polyline.
+
+    An odd number left over at the end is dropped.
+    """
+    values = np.array(NUMBER.findall(points), dtype=np.float64)
+    return values[:len(values)//2*2].reshape(-1, 2)
+
+
+def segment_distance(P, A, B):
+    # distance of the points P to the segments from A to B
+    AB = B - A
+    length2 = np.einsum('ij,ij->i', AB, AB)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        u = np.clip(np.einsum('ij,ij->i', P - A, AB)/length2, 0.0, 1.0)
+    u[length2 == 0] = 0.0
+    return np.linalg.norm(P - (A + u[:, None]*AB), axis=-1)
+
+
+def curve_steps(P0, P1, P2, P3, flatness):
+    """Steps in t that keep every chord of the cubic curves within flatness.
+
+    A curve with both control points within flatness of its chord lies
+    within flatness of it as well, being inside their convex hull, and is
+    taken in one step. That takes lines, whose control points are their
+    ends, in one step too. Otherwise: the second derivative of a cubic
+    Bezier is at most 6*M, M the larger second difference of its control
+    points, and a chord over a step h in t lies within h**2/8 of the
+    largest second derivative of the curve (Wang's formula).
+    """
+    M = np.maximum(np.linalg.norm(P0 - 2*P1 + P2, axis=-1),
+                   np.linalg.norm(P1 - 2*P2 + P3, axis=-1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = np.ceil(np.sqrt(0.75*M/flatness))
+    # points that are not numbers give a single step
+    n[np.isnan(n)] = 1
+    flat = np.maximum(segment_distance(P1, P0, P3), segment_distance(P2, P0, P3)) <= flatness
+    n[flat] = 1
+    return np.clip(n, 1, MAX_CURVE_STEPS).astype(np.int64)
+
+
+def csp_nodes(csp):
+    """The [control, point, control] nodes of a cubicsuperpath as an (n, 3, 2)
+    array, and the number of nodes in each subpath."""
+    sizes = np.array([len(sub) for sub in csp], dtype=np.int64)
+    nodes = np.array([node for sub in csp for node in sub], dtype=np.float64).reshape(-1, 3, 2)
+    return nodes, sizes
+
+
+@lru_cache(maxsize=PATH_CACHE_SIZE)
+def path_nodes(d):
+    """csp_nodes of path data, read only as they are shared by the callers."""
+    nodes, sizes = csp_nodes(cubicsuperpath.parsePath(d))
+    nodes.flags.writeable = False
+    sizes.flags.writeable = False
+    return nodes, sizes
+
+
+def flatten_csp(csp, flatness, mat=None):
+    """Polylines within flatness of the subpaths of a cubicsuperpath."""
+    return flatten_nodes(*csp_nodes(csp), flatness, mat)
+
+
+def flatten_nodes(nodes, sizes, flatness, mat=None):
+    """Polylines within flatness of the subpaths of csp_nodes.
+
+    The control points are transformed by mat first, if given, and all
+    curves are evaluated together.
+    """
+    if len(sizes) == 0:
+        return []
+    if mat is not None:
+        nodes = transform_points(nodes, mat)
+    first = np.cumsum(sizes) - sizes
+
+    # a curve ends at every node but the first of a subpath
+    ends = np.ones(len(nodes), dtype=bool)
+    ends[first] = False
+    ends = np.flatnonzero(ends)
+    P0 = nodes[ends-1, 1]
+    P1 = nodes[ends-1, 2]
+    P2 = nodes[ends, 0]
+    P3 = nodes[ends, 1]
+    n = curve_steps(P0, P1, P2, P3, flatness)
+
+    # t = 1/n ... n/n along every curve
+    curve = np.repeat(np.arange(len(n)), n)
+    t = (np.arange(len(curve)) - np.repeat(np.cumsum(n) - n, n) + 1) / n[curve]
+    t = t[:, None]
+    s = 1.0 - t
+    points = (s*s*s*P0[curve] + 3.0*s*s*t*P1[curve] +
+              3.0*s*t*t*P2[curve] + t*t*t*P3[curve])
+
+    # each subpath starts with its first node, then the points of its curves
+    per_sub = 1 + np.bincount(np.repeat(np.arange(len(sizes)), sizes-1),
+                              weights=n, minlength=len(sizes)).astype(np.int64)
+    starts = np.cumsum(per_sub) - per_sub
+    out = np.empty((per_sub.sum(), 2))
+    on_curve = np.ones(len(out), dtype=bool)
+    on_curve[starts] = False
+    out[starts] = nodes[first, 1]
+    out[on_curve] = points
+    return np.split(out, starts[1:])
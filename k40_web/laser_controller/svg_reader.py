@@ -26,12 +26,15 @@ import os
 import shutil
 
 import re
+import numpy as np
+from lxml import etree
 # local library
 import k40_web.laser_controller.inkex as inkex
 import k40_web.laser_controller.simplestyle as simplestyle
 import k40_web.laser_controller.simpletransform as simpletransform
-import k40_web.laser_controller.cubicsuperpath as cubicsuperpath
-import k40_web.laser_controller.cspsubdiv as cspsubdiv
+from k40_web.laser_controller.svg_geometry import (ellipse_points, flatten_nodes, parse_points,
+                                                   path_nodes, rect_points, transform_points,
+                                                   transform_scale)
 
 from PIL import Image
 Image.MAX_IMAGE_PIXELS = None
@@ -134,6 +137,61 @@ class CSS_values_class():
         return value
 
 
+def color_action(r, g, b):
+    """What the laser does with a stroke of this color."""
+    delta = 50
+    # Check if the color is Red (or close to it)
+    if (r >= 255-delta) and (g <= delta) and (b <= delta):
+        return "cut"
+    # Check if the color is Blue (or close to it)
+    elif (r <= delta) and (g <= delta) and (b >= 255-delta):
+        return "engrave"
+    return "raster"
+
+
+def group_stroke(group):
+    # the stroke process_group passes on to the shapes in a group
+    if group is None:
+        return None
+    stroke_group = group.get('stroke')
+    style = group.get('style')
+    if style:
+        for decl in style.split(';'):
+            parts = decl.split(':', 2)
+            if len(parts) == 2 and parts[0].strip().lower() == 'stroke':
+                stroke_group = parts[1].strip()
+    return stroke_group
+
+
+def group_hidden(group):
+    # process_group skips groups and layers with display none
+    style = group.get('style')
+    if style:
+        for decl in style.split(';'):
+            parts = decl.split(':', 2)
+            if len(parts) == 2 and parts[0].strip().lower() == 'display' and parts[1] == "none":
+                return True
+        if group.get(inkex.addNS('groupmode', 'inkscape')) == 'layer':
+            return simplestyle.parseStyle(style).get('display') == 'none'
+    return False
+
+
+def is_drawn(node):
+    # process_group only goes into visible groups and switches, from the root
+    for parent in node.iterancestors():
+        if group_hidden(parent):
+            return False
+        if parent.getparent() is None:
+            return True
+        if parent.tag != inkex.addNS('g', 'svg') and parent.tag != inkex.addNS('switch', 'svg'):
+            return False
+    return False
+
+
+SHAPE_TAGS = set(inkex.addNS(tag, 'svg') for tag in
+                 ('path', 'rect', 'circle', 'ellipse', 'polygon', 'polyline', 'line'))
+
+
 class SVG_READER(inkex.Effect):
     def __init__(self):
         inkex.Effect.__init__(self)
@@ -180,16 +238,34 @@ class SVG_READER(inkex.Effect):
         self.layernames = []
         self.txt2paths = False
         self.CSS_values = CSS_values_class()
+        self.id_index = None
+        self.clone_lines = {}
 
     def parse_svg(self, filename):
+        # the document is only read, no copy of the original is needed
         try:
-            self.parse(filename)
+            self.parse(filename, keep_original=False)
         except Exception as e:
             exception_msg = "%s" % (e)
             if exception_msg.find("encoding"):
-                self.parse(filename, encoding="ISO-8859-1")
+                self.parse(filename, encoding="ISO-8859-1", keep_original=False)
             else:
                 raise Exception(e)
+        self.id_index = None
+        self.clone_lines = {}
+        # the parsed paths of the last file are not needed again
+        path_nodes.cache_clear()
+
+    def getElementById(self, id):
+        # one pass over the document for all ids instead of an XPath query per <use>
+        if self.id_index is None:
+            self.id_index = {}
+            for node in self.document.iter(tag=etree.Element):
+                node_id = node.get('id')
+                if node_id is not None:
+                    # the first one in document order, as the XPath query found
+                    self.id_index.setdefault(node_id, node)
+        return self.id_index.get(id)
 
     def set_inkscape_path(self, PATH):
         if PATH != None:
@@ -200,28 +276,49 @@ class SVG_READER(inkex.Effect):
                 break
 
     def colmod(self, r, g, b, path_id):
-        changed = False
-        k40_action = 'raster'
-        delta = 50
-        # Check if the color is Red (or close to it)
-        if (r >= 255-delta) and (g <= delta) and (b <= delta):
-            k40_action = "cut"
-            self.Cut_Type[path_id] = k40_action
-            (r, g, b) = (255, 255, 255)
-            changed = True
-        # Check if the color is Blue (or close to it)
-        elif (r <= delta) and (g <= delta) and (b >= 255-delta):
-            k40_action = "engrave"
-            self.Cut_Type[path_id] = k40_action
+        k40_action = color_action(r, g, b)
+        self.Cut_Type[path_id] = k40_action
+        changed = k40_action != "raster"
+        if changed:
             (r, g, b) = (255, 255, 255)
-            changed = True
-        else:
-            k40_action = "raster"
-            self.Cut_Type[path_id] = k40_action
-            changed = False
         color_out = '#%02x%02x%02x' % (r, g, b)
         return (color_out, changed, k40_action)
 
+    def has_coded_text(self):
+        """True if make_paths would find color coded text (i.e. Blue: engrave/ Red: cut).
+
+        Looks at the strokes of the text the way process_shape does, without
+        changing the document, so text can be converted to paths before the
+        document is processed.
+        """
+        CSS_values = self.CSS_values
+        self.CSS_values = CSS_values_class()
+        try:
+            for node in self.document.iter(inkex.addNS('style', 'svg')):
+                parent = node.getparent()
+                if node.get('type') == "text/css" or (parent is not None and parent.tag == inkex.addNS('defs', 'svg')):
+                    self.parse_css(node.text)
+            for node in self.document.iter(inkex.addNS('text', 'svg'), inkex.addNS('flowRoot', 'svg')):
+                if not is_drawn(node):
+                    continue
+                strokes = [node.get('stroke') or group_stroke(node.getparent())]
+                styles = []
+                class_val = node.get('class')
+                if class_val:
+                    tag_type = node.tag[node.tag.find('}')+1:]
+                    styles.extend(self.CSS_values.get_css_value(tag_type, cv) for cv in class_val.split(' '))
+                styles.append(node.get('style'))
+                for style in styles:
+                    if style:
+                        strokes.append(simplestyle.parseStyle(style).get('stroke'))
+                for col in strokes:
+                    if col and simplestyle.isColor(col.strip()):
+                        if color_action(*simplestyle.parseColor(col.strip())) != "raster":
+                            return True
+            return False
+        finally:
+            self.CSS_values = CSS_values
+
     def process_shape(self, node, mat, group_stroke=None):
         #################################
         ### Determine the shape type  ###
@@ -367,11 +464,25 @@ class SVG_READER(inkex.Effect):
         if changed:
             if node.get('display') == 'none':
                 return
+            if node.tag not in SHAPE_TAGS:
+                #print("something was ignored")
+                # print(node.tag)
+                return
+            trans = node.get('transform')
+            if trans:
+                mat = simpletransform.composeTransform(
+                    mat, simpletransform.parseTransform(trans))
+            # the flatness is kept after the transform
+            f = self.flatness
+            scale = transform_scale(mat)
+
             if node.tag == inkex.addNS('path', 'svg'):
                 d = node.get('d')
                 if not d:
                     return
-                p = cubicsuperpath.parsePath(d)
+                self.add_polylines(flatten_nodes(*path_nodes(d), f, mat), path_id)
+                return
+
             elif node.tag == inkex.addNS('rect', 'svg'):
                 x = 0.0
                 y = 0.0
@@ -397,21 +508,7 @@ class SVG_READER(inkex.Effect):
                     Rymax = abs(height)/2.0
                     rx = min(rx, Rxmax)
                     ry = min(ry, Rymax)
-                    L1 = "M %f,%f %f,%f " % (x+rx, y, x+width-rx, y)
-                    C1 = "A %f,%f 0 0 1 %f,%f" % (rx, ry, x+width, y+ry)
-                    L2 = "M %f,%f %f,%f " % (
-                        x+width, y+ry, x+width, y+height-ry)
-                    C2 = "A %f,%f 0 0 1 %f,%f" % (rx, ry, x+width-rx, y+height)
-                    L3 = "M %f,%f %f,%f " % (
-                        x+width-rx, y+height, x+rx, y+height)
-                    C3 = "A %f,%f 0 0 1 %f,%f" % (rx, ry, x, y+height-ry)
-                    L4 = "M %f,%f %f,%f " % (x, y+height-ry, x, y+ry)
-                    C4 = "A %f,%f 0 0 1 %f,%f" % (rx, ry, x+rx, y)
-                    d = L1 + C1 + L2 + C2 + L3 + C3 + L4 + C4
-                else:
-                    d = "M %f,%f %f,%f %f,%f %f,%f Z" % (
-                        x, y, x+width, y,  x+width, y+height, x, y+height)
-                p = cubicsuperpath.parsePath(d)
+                points = rect_points(x, y, width, height, rx, ry, f, scale)
 
             elif node.tag == inkex.addNS('circle', 'svg'):
                 cx = 0.0
@@ -421,9 +518,7 @@ class SVG_READER(inkex.Effect):
                 if node.get('cy'):
                     cy = float(node.get('cy'))
                 r = float(node.get('r'))
-                d = "M %f,%f A   %f,%f 0 0 1 %f,%f   %f,%f 0 0 1 %f,%f   %f,%f 0 0 1 %f,%f   %f,%f 0 0 1 %f,%f Z" % (
-                    cx+r, cy, r, r, cx, cy+r,  r, r, cx-r, cy,  r, r, cx, cy-r, r, r, cx+r, cy)
-                p = cubicsuperpath.parsePath(d)
+                points = ellipse_points(cx, cy, r, r, f, scale)
 
             elif node.tag == inkex.addNS('ellipse', 'svg'):
                 cx = 0.0
@@ -440,80 +535,39 @@ class SVG_READER(inkex.Effect):
                     rx = float(node.get('rx'))
                 if node.get('ry'):
                     ry = float(node.get('ry'))
-
-                d = "M %f,%f A   %f,%f 0 0 1 %f,%f   %f,%f 0 0 1 %f,%f   %f,%f 0 0 1 %f,%f   %f,%f 0 0 1 %f,%f Z" % (
-                    cx+rx, cy, rx, ry, cx, cy+ry,  rx, ry, cx-rx, cy,  rx, ry, cx, cy-ry, rx, ry, cx+rx, cy)
-                p = cubicsuperpath.parsePath(d)
+                points = ellipse_points(cx, cy, rx, ry, f, scale)
 
             elif (node.tag == inkex.addNS('polygon', 'svg')) or (node.tag == inkex.addNS('polyline', 'svg')):
                 points = node.get('points')
                 if not points:
                     return
-
-                points = points.replace(',', ' ')
-                while points.find('  ') > -1:
-                    points = points.replace('  ', ' ')
-
-                points = points.strip().split(" ")
-                d = "M "
-                for i in range(0, len(points), 2):
-                    x = float(points[i])
-                    y = float(points[i+1])
-                    d = d + "%f,%f " % (x, y)
+                points = parse_points(points)
 
                 # Close the loop if it is a ploygon
-                if node.tag == inkex.addNS('polygon', 'svg'):
-                    d = d + "Z"
-                p = cubicsuperpath.parsePath(d)
+                if node.tag == inkex.addNS('polygon', 'svg') and len(points) > 0:
+                    points = np.concatenate((points, points[:1]))
 
             elif node.tag == inkex.addNS('line', 'svg'):
                 x1 = float(node.get('x1'))
                 y1 = float(node.get('y1'))
                 x2 = float(node.get('x2'))
                 y2 = float(node.get('y2'))
-                d = "M "
-                d = "M %f,%f %f,%f" % (x1, y1, x2, y2)
-                p = cubicsuperpath.parsePath(d)
-            else:
-                #print("something was ignored")
-                # print(node.tag)
-                return
-
-            trans = node.get('transform')
-            if trans:
-                mat = simpletransform.composeTransform(
-                    mat, simpletransform.parseTransform(trans))
-            simpletransform.applyTransformToPath(mat, p)
+                points = np.array([[x1, y1], [x2, y2]])
 
-            ##########################################
-            ## Break Curves down into small lines  ###
-            ##########################################
-            f = self.flatness
-            is_flat = 0
-            while is_flat < 1:
-                try:
-                    cspsubdiv.cspsubdiv(p, f)
-                    is_flat = 1
-                except IndexError:
-                    break
-                except:
-                    f += 0.1
-                    if f > 2:
-                        break
-                        # something has gone very wrong.
-            ##########################################
-            rgb = (0, 0, 0)
-            for sub in p:
-                for i in range(len(sub)-1):
-                    x1 = sub[i][1][0]
-                    y1 = sub[i][1][1]
-                    x2 = sub[i+1][1][0]
-                    y2 = sub[i+1][1][1]
-                    self.lines.append([x1, y1, x2, y2, rgb, path_id])
+            self.add_polylines([transform_points(points, mat)], path_id)
         #####################################################
         ### End of saving the vector path data            ###
         #####################################################
 
+    def add_polylines(self, polylines, path_id):
+        # a line for every segment of the flattened polylines
+        rgb = (0, 0, 0)
+        for points in polylines:
+            if len(points) < 2:
+                continue
+            segments = np.hstack((points[:-1], points[1:])).tolist()
+            self.lines.extend([segment + [rgb, path_id] for segment in segments])
+
     def process_clone(self, node):
         trans = node.get('transform')
         x = node.get('x')
@@ -537,17 +591,62 @@ class SVG_READER(inkex.Effect):
         # print(refid,node.get('id'),node.get('layer'))
         refnode = self.getElementById(refid[1:])
         if refnode is not None:
-            if refnode.tag == inkex.addNS('g', 'svg') or refnode.tag == inkex.addNS('switch', 'svg'):
-                self.process_group(refnode)
-            elif refnode.tag == inkex.addNS('use', 'svg'):
-                # print(refnode,'1')
-                self.process_clone(refnode)
-            else:
-                self.process_shape(refnode, self.groupmat[-1])
+            self.add_clone_lines(refnode, self.groupmat[-1])
         # pop transform
         if trans or x or y:
             self.groupmat.pop()
 
+    def process_reference(self, refnode):
+        if refnode.tag == inkex.addNS('g', 'svg') or refnode.tag == inkex.addNS('switch', 'svg'):
+            self.process_group(refnode)
+        elif refnode.tag == inkex.addNS('use', 'svg'):
+            # print(refnode,'1')
+            self.process_clone(refnode)
+        else:
+            self.process_shape(refnode, self.groupmat[-1])
+
+    def add_clone_lines(self, refnode, mat):
+        """Add the lines of a referenced node as drawn with the transform mat.
+
+        The node is flattened once, in its own coordinates, and every clone
+        of it transforms those lines. A clone that scales the node up by s
+        needs the node flattened to flatness/s, so it is flattened again if
+        a finer flatness is needed than the one it was kept with.
+        """
+        A = np.array(mat)
+        scale = np.linalg.norm(A[:, :2], 2)
+        if not scale > 0.0:
+            self.groupmat.append(mat)
+            try:
+                self.process_reference(refnode)
+            finally:
+                self.groupmat.pop()
+            return
+
+        flatness = self.flatness/scale
+        cached = self.clone_lines.get(refnode)
+        if cached is None or cached[0] > flatness:
+            groupmat = self.groupmat
+            group_flatness = self.flatness
+            first = len(self.lines)
+            self.groupmat = [[[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]]
+            self.flatness = flatness
+            try:
+                self.process_reference(refnode)
+            finally:
+                self.groupmat = groupmat
+                self.flatness = group_flatness
+            lines = self.lines[first:]
+            del self.lines[first:]
+            coords = np.array([line[:4] for line in lines], dtype=np.float64).reshape(-1, 4)
+            cached = (flatness, coords, [line[4:] for line in lines])
+            self.clone_lines[refnode] = cached
+
+        flatness, coords, rest = cached
+        points = coords.reshape(-1, 2) @ A[:, :2].T + A[:, 2]
+        for xy, (rgb, path_id) in zip(points.reshape(-1, 4).tolist(), rest):
+            self.lines.append(xy + [rgb, path_id])
+
     def process_group(self, group):
         ##############################################
         # Get color set at group level
@@ -778,11 +877,12 @@ class SVG_READER(inkex.Effect):
         self.document.getroot().set('viewBox', '%f %f %f %f' %
                                     (viewbox[0], viewbox[1], viewbox[2], viewbox[3]))
 
-    def make_paths(self, txt2paths=False):
-        self.txt2paths = txt2paths
-        msg = ""
-        if (self.txt2paths):
-            self.convert_text2paths()
+    def read_size(self):
+        """Size of the document in mm, and the scale and offset of its viewBox.
+
+        Raises SVG_PXPI_EXCEPTION if the units or the viewBox are missing,
+        set_size gives them to the document.
+        """
         #################
         ## GET VIEWBOX ##
         #################
@@ -837,6 +937,15 @@ class SVG_READER(inkex.Effect):
             line3 = "on the 'Page' tab adjust 'Scale x:' in the 'Scale' section"
             raise Exception("%s\n%s\n%s" % (line1, line2, line3))
 
+        return w_mm, h_mm, scale_w, scale_h, Dx, Dy
+
+    def make_paths(self, txt2paths=False):
+        self.txt2paths = txt2paths
+        msg = ""
+        if (self.txt2paths):
+            self.convert_text2paths()
+        w_mm, h_mm, scale_w, scale_h, Dx, Dy = self.read_size()
+
         for node in self.document.getroot().xpath('//svg:g', namespaces=inkex.NSS):
             if node.get(inkex.addNS('groupmode', 'inkscape')) == 'layer':
                 layer = node.get(inkex.addNS('label', 'inkscape'))
@@ -30,13 +30,15 @@ class Scale():
 
 
 class DesignTransform():
-    def __init__(self, scale=1.0, rotate=False, mirror=False, negate=False, halftone=False, ht_size=500):
+    def __init__(self, scale=1.0, rotate=False, mirror=False, negate=False, halftone=False, ht_size=500,
+                 ht_method="floyd-steinberg"):
         self.scale = scale
         self.rotate = rotate
         self.mirror = mirror
         self.negate = negate
         self.halftone = halftone
         self.ht_size = ht_size
+        self.ht_method = ht_method
 
 
 class BezierSettings():
@@ -87,9 +89,7 @@ class DesignBounds():
         return self.xmin, self.xmax, self.ymin, self.ymax
 
     def rotate(self):
-        self.xmin, self.ymin = self.ymin, self.xmin
-        self.xmax, self.ymax = self.ymax, self.xmax
-        return self
+        return DesignBounds(self.ymin, self.ymax, self.xmin, self.xmax)
     
     def contains(self, other, margin=0):
         return (self.xmin < other.xmin+margin and
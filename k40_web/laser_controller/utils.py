@@ -1,7 +1,10 @@
 """This module collects all functions pulled out from k40_whisperer.py"""
 
+import os
 from time import time
 from math import sqrt
+import numpy as np
+from k40_web.laser_controller.ecoords import EcoordArray
 DEBUG = False
 
 def format_time(time_in_seconds):
@@ -22,113 +25,141 @@ def format_time(time_in_seconds):
         return "?"
 
 
-def rotate_raster(image_in):
-    wim, him = image_in.size
-    im_rotated = Image.new("L", (him, wim), "white")
-
-    image_in_np = image_in.load()
-    im_rotated_np = im_rotated.load()
-
-    for i in range(1, him):
-        for j in range(1, wim):
-            im_rotated_np[i, wim-j] = image_in_np[j, i]
-    return im_rotated
-
-
 def inch2thou(value_inch):
     return int(round(value_inch*1000, 1))
 
 
-def generate_bezier(bezier_settings, n=100):
-    m1 = bezier_settings.m1
-    m2 = bezier_settings.m2
-    w = bezier_settings.weight
-    if (m1 == m2):
-        x1 = 0
-        y1 = 0
-    else:
-        x1 = 255*(1-m2)/(m1-m2)
-        y1 = m1*x1
-    x = []
-    y = []
-    # Calculate Bezier Curve
-    for step in range(0, n+1):
-        t = float(step)/float(n)
-        Ct = 1 / (pow(1-t, 2)+2*(1-t)*t*w+pow(t, 2))
-        x.append(Ct*(2*(1-t)*t*w*x1+pow(t, 2)*255))
-        y.append(Ct*(2*(1-t)*t*w*y1+pow(t, 2)*255))
-    return x, y
+class EndpointGrid:
+    """Grid hash over the start and end points of loops for nearest
+    neighbour queries while loops are taken out one by one.
+
+    Removed loops are only flagged; the grid is rebuilt over the loops
+    that are left once most of them are gone, so the cells stay about as
+    full as when it was built.
+    """
+
+    def __init__(self, xbeg, ybeg, xend, yend):
+        self.xbeg = xbeg
+        self.ybeg = ybeg
+        self.xend = xend
+        self.yend = yend
+        self.alive = bytearray([1])*len(xbeg)
+        self.n_alive = len(xbeg)
+        self.build()
+
+    def build(self):
+        alive = [j for j in range(len(self.alive)) if self.alive[j]]
+        self.n_built = len(alive)
+        if not alive:
+            return
+        xs = [self.xbeg[j] for j in alive] + [self.xend[j] for j in alive]
+        ys = [self.ybeg[j] for j in alive] + [self.yend[j] for j in alive]
+        self.x0 = min(xs)
+        self.y0 = min(ys)
+        size = max(max(xs)-self.x0, max(ys)-self.y0)
+        # about one loop end per cell
+        self.cell = size/sqrt(len(xs)) if size > 0 else 1.0
+        self.nx = int((max(xs)-self.x0)/self.cell)+1
+        self.ny = int((max(ys)-self.y0)/self.cell)+1
+        self.cells = {}
+        for j in alive:
+            self.cells.setdefault(self.cell_index(self.xbeg[j], self.ybeg[j]), []).append((j, 0))
+            self.cells.setdefault(self.cell_index(self.xend[j], self.yend[j]), []).append((j, 1))
+
+    def cell_index(self, x, y):
+        return (int((x-self.x0)//self.cell), int((y-self.y0)//self.cell))
+
+    def remove(self, j):
+        self.alive[j] = 0
+        self.n_alive -= 1
+        if self.n_alive and self.n_alive < self.n_built//4:
+            self.build()
+
+    def ring(self, cx, cy, r):
+        for iy in range(max(cy-r, 0), min(cy+r, self.ny-1)+1):
+            if iy == cy-r or iy == cy+r:
+                for ix in range(max(cx-r, 0), min(cx+r, self.nx-1)+1):
+                    yield (ix, iy)
+            else:
+                if 0 <= cx-r < self.nx:
+                    yield (cx-r, iy)
+                if 0 <= cx+r < self.nx:
+                    yield (cx+r, iy)
+
+    def nearest(self, x, y):
+        """Return (j, use_end) of the loop end point closest to x, y.
+
+        Ties go to start points before end points and then to the lowest
+        loop number, the same choice the linear search in Sort_Paths made.
+        """
+        cx, cy = self.cell_index(x, y)
+        cell = self.cell
+        best = None
+        r = max(0, -cx, cx-self.nx+1, -cy, cy-self.ny+1)
+        while True:
+            for index in self.ring(cx, cy, r):
+                for j, use_end in self.cells.get(index, ()):
+                    if not self.alive[j]:
+                        continue
+                    if use_end:
+                        dx = x - self.xend[j]
+                        dy = y - self.yend[j]
+                    else:
+                        dx = x - self.xbeg[j]
+                        dy = y - self.ybeg[j]
+                    candidate = (dx*dx + dy*dy, use_end, j)
+                    if best is None or candidate < best:
+                        best = candidate
+            if cx-r <= 0 and cy-r <= 0 and cx+r >= self.nx-1 and cy+r >= self.ny-1:
+                break
+            if best is not None:
+                # every point closer than reach lies in the rings searched so far
+                reach = min(x-self.x0-(cx-r)*cell, self.x0+(cx+r+1)*cell-x,
+                            y-self.y0-(cy-r)*cell, self.y0+(cy+r+1)*cell-y)
+                if reach > 0 and best[0] < reach*reach:
+                    break
+            r += 1
+        return best[2], best[1]
 
 
 def Sort_Paths(ecoords, i_loop=2):
     ##########################
     ###   find loop ends   ###
     ##########################
-    Lbeg = []
-    Lend = []
-    if len(ecoords) > 0:
-        Lbeg.append(0)
-        loop_old = ecoords[0][i_loop]
-        for i in range(1, len(ecoords)):
-            loop = ecoords[i][i_loop]
-            if loop != loop_old:
-                Lbeg.append(i)
-                Lend.append(i-1)
-            loop_old = loop
-        Lend.append(i)
+    if isinstance(ecoords, EcoordArray):
+        x, y, loop = ecoords.x, ecoords.y, ecoords.loop
+    else:
+        if len(ecoords) == 0:
+            return []
+        values = np.asarray([[e[0], e[1], e[i_loop]] for e in ecoords], dtype=np.float64)
+        x, y, loop = values[:, 0], values[:, 1], values[:, 2]
+    if len(x) == 0:
+        return []
+    change = np.flatnonzero(loop[1:] != loop[:-1]) + 1
+    Lbeg = np.concatenate(([0], change)).tolist()
+    Lend = np.concatenate((change-1, [len(x)-1])).tolist()
 
     #######################################################
     # Find new order based on distance to next beg or end #
     #######################################################
-    order_out = []
-    use_beg = 0
-    if len(ecoords) > 0:
-        order_out.append([Lbeg[0], Lend[0]])
-    inext = 0
-    total = len(Lbeg)
-    for i in range(total-1):
-        if use_beg == 1:
-            ii = Lbeg.pop(inext)
-            Lend.pop(inext)
+    # greedy: always continue with the nearest remaining loop start or
+    # end, running the loop backwards when its end is nearer
+    x = x.tolist()
+    y = y.tolist()
+    grid = EndpointGrid([x[i] for i in Lbeg], [y[i] for i in Lbeg],
+                        [x[i] for i in Lend], [y[i] for i in Lend])
+    grid.remove(0)
+    order_out = [[Lbeg[0], Lend[0]]]
+    ii = Lend[0]
+    for i in range(len(Lbeg)-1):
+        j, use_end = grid.nearest(x[ii], y[ii])
+        grid.remove(j)
+        if use_end:
+            order_out.append([Lend[j], Lbeg[j]])
+            ii = Lbeg[j]
         else:
-            ii = Lend.pop(inext)
-            Lbeg.pop(inext)
-
-        Xcur = ecoords[ii][0]
-        Ycur = ecoords[ii][1]
-
-        dx = Xcur - ecoords[Lbeg[0]][0]
-        dy = Ycur - ecoords[Lbeg[0]][1]
-        min_dist = dx*dx + dy*dy
-
-        dxe = Xcur - ecoords[Lend[0]][0]
-        dye = Ycur - ecoords[Lend[0]][1]
-        min_diste = dxe*dxe + dye*dye
-
-        inext = 0
-        inexte = 0
-        for j in range(1, len(Lbeg)):
-            dx = Xcur - ecoords[Lbeg[j]][0]
-            dy = Ycur - ecoords[Lbeg[j]][1]
-            dist = dx*dx + dy*dy
-            if dist < min_dist:
-                min_dist = dist
-                inext = j
-            ###
-            dxe = Xcur - ecoords[Lend[j]][0]
-            dye = Ycur - ecoords[Lend[j]][1]
-            diste = dxe*dxe + dye*dye
-            if diste < min_diste:
-                min_diste = diste
-                inexte = j
-            ###
-        if min_diste < min_dist:
-            inext = inexte
-            order_out.append([Lend[inexte], Lbeg[inexte]])
-            use_beg = 1
-        else:
-            order_out.append([Lbeg[inext], Lend[inext]])
-            use_beg = 0
+            order_out.append([Lbeg[j], Lend[j]])
+            ii = Lend[j]
     ###########################################################
     return order_out
 
@@ -158,67 +189,65 @@ def point_inside_polygon(x, y, poly):
     return inside
 
 def ecoords2lines(ecoords, scale, shift):
-    lines = []
-    loop_old = -1
-    xold = 0
-    yold = 0
-    for line in ecoords:
-        XY = line
-        x1 = XY[0]*scale.x+shift.x
-        y1 = XY[1]*scale.y+shift.y
-        loop = XY[2]
-        # check and see if we need to move to a new discontinuous start point
-        if (loop == loop_old):
-            lines.append([xold, yold, x1, y1])
-        loop_old = loop
-        xold = x1
-        yold = y1
-    return lines
-
-
-
-from k40_web.laser_controller.interpolate import interpolate
-
-'''This Example opens an Image and transform the image into halftone.  -Isai B. Cicourel'''
-# Create a Half-tone version of the image
-
-def convert_halftoning(image, bezier_settings):
-    image = image.convert('L')
-    x_lim, y_lim = image.size
-    pixel = image.load()
-
-    M1 = bezier_settings.bezier_M1
-    M2 = bezier_settings.bezier_M2
-    w = bezier_settings.bezier_weight
-
-    if w > 0:
-        x, y = generate_bezier(M1, M2, w)
-
-        interp = interpolate(x, y)  # Set up interpolate class
-        val_map = []
-        # Map Bezier Curve to values between 0 and 255
-        for val in range(0, 256):
-            # Get the interpolated value at each value
-            val_out = int(round(interp[val]))
-            val_map.append(val_out)
-        # Adjust image
-        timestamp = 0
-        for y in range(1, y_lim):
-            # stamp = int(3*time())  # update every 1/3 of a second
-            # if (stamp != timestamp):
-            #     timestamp = stamp  # interlock
-                # self.reporter.status( # if this would be faster, feedback would be unnecessary
-                #     "Adjusting Image Darkness: %.1f %%" % ((100.0*y)/y_lim))
-                #self.master.update()
-            for x in range(1, x_lim):
-                pixel[x, y] = val_map[pixel[x, y]]
-
-    #self.master.update()
-    image = image.convert('1')
+    ecoords = EcoordArray.from_coords(ecoords)
+    x = ecoords.x*scale.x+shift.x
+    y = ecoords.y*scale.y+shift.y
+    # a line joins two consecutive points of the same loop
+    same_loop = ecoords.loop[1:] == ecoords.loop[:-1]
+    lines = np.column_stack((x[:-1], y[:-1], x[1:], y[1:]))[same_loop]
+    return lines.tolist()
+
+
+
+from k40_web.laser_controller.convex_hull import convex_hull_ecoords
+from k40_web.laser_controller.halftone import convert_halftoning
+from k40_web.laser_controller.packed_raster import PackedRaster
+from PIL import Image
+
+
+def raster_lut(negate=False, threshold=False):
+    """Grey level map for Image.point: inverted, then thresholded at 128."""
+    lut = list(range(256))
+    if negate:
+        lut.reverse()
+    if threshold:
+        lut = [0 if x < 128 else 255 for x in lut]
+    return lut
+
+
+# Image.transpose method by (mirror, rotate), a mirrored image is rotated
+RASTER_TRANSPOSE = {
+    (True, False): Image.FLIP_LEFT_RIGHT,
+    (False, True): Image.ROTATE_90,
+    (True, True): Image.TRANSPOSE,
+}
+
+
+def transform_raster(image, negate=False, mirror=False, rotate=False,
+                     scale_x=1.0, scale_y=1.0, threshold=False, resample=None):
+    """Grey level image of a raster design as it is engraved.
+
+    Used for the engraving and for its preview. Mirroring and rotating by
+    90 degrees are done by one transpose and inverting and thresholding by
+    one Image.point, so every step makes at most one new image. The image
+    is scaled before it is transposed, scale_x and scale_y are along the
+    x and y of the result.
+    """
+    if image.mode != "L":
+        image = image.convert("L")
+    if negate or threshold:
+        image = image.point(raster_lut(negate, threshold))
+    wim, him = image.size
+    if rotate:
+        size = (int(wim*scale_y), int(him*scale_x))
+    else:
+        size = (int(wim*scale_x), int(him*scale_y))
+    if size != image.size:
+        image = image.resize(size, resample)
+    if (mirror, rotate) in RASTER_TRANSPOSE:
+        image = image.transpose(RASTER_TRANSPOSE[(mirror, rotate)])
     return image
 
-from k40_web.laser_controller.convex_hull import hull2D
-from PIL import Image, ImageOps
 
 def make_raster_coords(RengData, laser_scale, design_transform, isRotary, bezier_settings, reporter, rast_step):
 
@@ -227,29 +256,14 @@ def make_raster_coords(RengData, laser_scale, design_transform, isRotary, bezier
     try:
         hcoords = []
         if (RengData.image != None and RengData.ecoords == []):
-            ecoords = []
-            cutoff = 128
-            image_temp = RengData.image.convert("L")
-
-            if design_transform.negate:
-                image_temp = ImageOps.invert(image_temp)
-
-            if design_transform.mirror:
-                image_temp = ImageOps.mirror(image_temp)
-
-            if design_transform.rotate:
-                image_temp = rotate_raster(image_temp)
-
             if isRotary:
                 scale_y = laser_scale.y*laser_scale.r
             else:
                 scale_y = laser_scale.y
 
-            if laser_scale.x != 1.0 or scale_y != 1.0:
-                wim, him = image_temp.size
-                nw = int(wim*laser_scale.x)
-                nh = int(him*scale_y)
-                image_temp = image_temp.resize((nw, nh))
+            image_temp = transform_raster(RengData.image, design_transform.negate,
+                                          design_transform.mirror, design_transform.rotate,
+                                          laser_scale.x, scale_y)
 
             if design_transform.halftone:
                 ht_size_mils = round(1000.0 / float(design_transform.ht_size), 1)
@@ -262,91 +276,22 @@ def make_raster_coords(RengData, laser_scale, design_transform, isRotary, bezier
                 nh = int(him / npixels)
                 image_temp = image_temp.resize((nw, nh))
 
-                image_temp = convert_halftoning(image_temp, bezier_settings)
+                image_temp = convert_halftoning(image_temp, bezier_settings, design_transform.ht_method)
                 reporter.status("Creating Halftone Image.")
                 image_temp = image_temp.resize((wim, him))
-            else:
-                image_temp = image_temp.point(
-                    lambda x: 0 if x < 128 else 255, '1')
-                #image_temp = image_temp.convert('1',dither=Image.NONE)
+            # otherwise PackedRaster thresholds the grey levels at 128 strip by strip
 
             if DEBUG:
                 image_name = os.path.expanduser("~")+"/IMAGE.png"
                 image_temp.save(image_name, "PNG")
 
-            Reng_np = image_temp.load()
-            wim, him = image_temp.size
+            reporter.status("Creating Scan Lines: 0.0%")
+            raster, LENGTH, n_scanlines, hcoords = PackedRaster.from_image(
+                image_temp, inch2thou(rast_step))
             del image_temp
-            #######################################
-            x = 0
-            y = 0
-            loop = 1
-            LENGTH = 0
-            n_scanlines = 0
-
-            my_hull = hull2D()
-            bignumber = 9999999
-            Raster_step = get_raster_step_1000in(rast_step)
-            timestamp = 0
-            for i in range(0, him, Raster_step):
-                stamp = int(10*time())  # update every second
-                if (stamp != timestamp):
-                    timestamp = stamp  # interlock
-                    reporter.status(f"Creating Scan Lines: {(100.0*i)/him:.1f}%")
-                # if self.stop[0] == True:
-                #     raise Exception("Action stopped by User.")
-                line = []
-                cnt = 1
-                LEFT = bignumber
-                RIGHT = -bignumber
-                for j in range(1, wim):
-                    if (Reng_np[j, i] == Reng_np[j-1, i]):
-                        cnt = cnt+1
-                    else:
-                        if Reng_np[j-1, i]:
-                            laser = "U"
-                        else:
-                            laser = "D"
-                            LEFT = min(j-cnt, LEFT)
-                            RIGHT = max(j, RIGHT)
-
-                        line.append((cnt, laser))
-                        cnt = 1
-                if Reng_np[j-1, i] > cutoff:
-                    laser = "U"
-                else:
-                    laser = "D"
-                    LEFT = min(j-cnt, LEFT)
-                    RIGHT = max(j, RIGHT)
-
-                line.append((cnt, laser))
-                if LEFT != bignumber and RIGHT != -bignumber:
-                    LENGTH = LENGTH + (RIGHT - LEFT)/1000.0
-                    n_scanlines = n_scanlines + 1
-
-                y = (him-i)/1000.0
-                x = 0
-                if LEFT != bignumber:
-                    hcoords.append([LEFT/1000.0, y])
-                if RIGHT != -bignumber:
-                    hcoords.append([RIGHT/1000.0, y])
-                if hcoords != []:
-                    hcoords = my_hull.convexHullecoords(hcoords)
-
-                rng = list(range(0, len(line), 1))
-
-                for i in rng:
-                    seg = line[i]
-                    delta = seg[0]/1000.0
-                    if seg[1] == "D":
-                        loop = loop+1
-                        ecoords.append([x, y, loop])
-                        ecoords.append([x+delta, y, loop])
-                    x = x + delta
-            
             reporter.status("Creating Scan Lines: 100%")
 
-            RengData.set_ecoords(ecoords, data_sorted=True)
+            RengData.set_raster(raster)
             RengData.len = LENGTH
             RengData.n_scanlines = n_scanlines
         # Set Flag indicating raster paths have been calculated
@@ -422,14 +367,10 @@ def scale_vector_coords(coords, startx, starty, laser_scale, isRotary):
     if isRotary:
         Yscale = Yscale*laser_scale.r
 
-    coords_scale = []
     if Xscale != 1.0 or Yscale != 1.0:
-        for i in range(len(coords)):
-            coords_scale.append(coords[i][:])
-            x = coords_scale[i][0]
-            y = coords_scale[i][1]
-            coords_scale[i][0] = x*Xscale
-            coords_scale[i][1] = y*Yscale
+        coords_scale = EcoordArray.from_coords(coords).copy()
+        coords_scale.x[:] *= Xscale
+        coords_scale.y[:] *= Yscale
         scaled_startx = startx*Xscale
         scaled_starty = starty*Yscale
     else:
@@ -441,32 +382,33 @@ def scale_vector_coords(coords, startx, starty, laser_scale, isRotary):
 
 def make_trace_path(design_bounds, laser_scale, RengData,
     Vcut_coords, Veng_coords, Gcode_coords, trace_gap, isRotary):
-    my_hull = hull2D()
     xmin, xmax, ymin, ymax = design_bounds.bounds
     startx = xmin
     starty = ymax
 
-
-    RengHullCoords = []
     Xscale = 1/laser_scale.x
     Yscale = 1/laser_scale.y
     if isRotary:
         Rscale = 1/laser_scale.r
         Yscale = Yscale*Rscale
 
-    for point in RengData.hull_coords:
-        RengHullCoords.append(
-            [point[0]*Xscale+xmin, point[1]*Yscale, point[2]])
-
-    all_coords = []
-    all_coords.extend(Vcut_coords)
-    all_coords.extend(Veng_coords)
-    all_coords.extend(Gcode_coords)
-    all_coords.extend(RengHullCoords)
+    # x and y of every point, the hull is made in one go
+    x = []
+    y = []
+    for coords in (Vcut_coords, Veng_coords, Gcode_coords):
+        coords = EcoordArray.from_coords(coords)
+        x.append(coords.x)
+        y.append(coords.y)
+    if RengData.hull_coords:
+        RengHullCoords = np.asarray(RengData.hull_coords, dtype=np.float64)
+        x.append(RengHullCoords[:, 0]*Xscale+xmin)
+        y.append(RengHullCoords[:, 1]*Yscale)
+    x = np.concatenate(x)
+    y = np.concatenate(y)
 
     trace_coords = []
-    if all_coords != []:
-        trace_coords = my_hull.convexHullecoords(all_coords)
+    if len(x) > 0:
+        trace_coords = convex_hull_ecoords(x, y)
         trace_coords = offset_ecoords(trace_coords, trace_gap)
 
     trace_coords, startx, starty = scale_vector_coords(
@@ -474,6 +416,8 @@ def make_trace_path(design_bounds, laser_scale, RengData,
     return trace_coords
 
 def optimize_paths(ecoords, inside_check=True):
+    if isinstance(ecoords, EcoordArray):
+        ecoords = ecoords.tolist()
     order_out = Sort_Paths(ecoords)
     lastx = -999
     lasty = -999
@@ -512,77 +456,96 @@ def optimize_paths(ecoords, inside_check=True):
         #####################################################
         # For each loop determine if other loops are inside #
         #####################################################
-        Nloops = len(cuts)
-        LoopTree = []
-        for iloop in range(Nloops):
-            LoopTree.append([])
-
-            ipoly = cuts[iloop]
-            ## Check points in other loops (could just check one) ##
-            if ipoly != []:
-                for jloop in range(Nloops):
-                    if jloop != iloop:
-                        inside = 0
-                        inside = inside + \
-                            point_inside_polygon(
-                                cuts[jloop][0][0], cuts[jloop][0][1], ipoly)
-                        if inside > 0:
-                            LoopTree[iloop].append(jloop)
-        #####################################################
-        for i in range(Nloops):
-            lns = []
-            lns.append(i)
-            remove_self_references(LoopTree, lns, LoopTree[i])
-
-        order = []
-        loops = list(range(Nloops))
-        for i in range(Nloops):
-            if LoopTree[i] != []:
-                addlist(LoopTree, order, loops, LoopTree[i])
-                LoopTree[i] = []
-            if loops[i] != []:
-                order.append(loops[i])
-                loops[i] = []
-    # END inside_check
-        ecoords_out = []
-        for i in order:
-            line = cuts[i]
-            for coord in line:
-                ecoords_out.append([coord[0], coord[1], i])
-    # END inside_check
+        LoopTree = loop_containment(cuts)
+        order = inside_first_order(LoopTree)
     else:
-        ecoords_out = []
-        for i in range(len(cuts)):
-            line = cuts[i]
-            for coord in line:
-                ecoords_out.append([coord[0], coord[1], i])
+        order = range(len(cuts))
+
+    ecoords_out = []
+    for i in order:
+        line = cuts[i]
+        for coord in line:
+            ecoords_out.append([coord[0], coord[1], i])
 
     return ecoords_out
 
-def remove_self_references(LoopTree, loop_numbers, loops):
-    for i in range(0, len(loops)):
-        for j in range(0, len(loop_numbers)):
-            if loops[i] == loop_numbers[j]:
-                loops.pop(i)
-                return
-        if LoopTree[loops[i]] != []:
-            loop_numbers.append(loops[i])
-            remove_self_references(
-                loop_numbers, LoopTree[loops[i]])
-
-def addlist(LoopTree, order, loops, list):
-    for i in list:
-        # this try/except is a bad hack fix to a recursion error. It should be fixed properly later.
-        try:
-            if LoopTree[i] != []:
-                # too many recursions here causes cmp error
-                addlist(LoopTree, order, loops, LoopTree[i])
-                LoopTree[i] = []
-        except:
-            pass
-        if loops[i] != []:
-            order.append(loops[i])
-            loops[i] = []
+def points_inside_polygon(x, y, poly):
+    """point_inside_polygon for arrays of points, True where inside."""
+    p1 = np.asarray(poly, dtype=np.float64)[:, :2]
+    p2 = np.roll(p1, -1, axis=0)
+    p1x, p1y = p1[:, 0], p1[:, 1]
+    p2x, p2y = p2[:, 0], p2[:, 1]
+    inside = np.zeros(len(x), dtype=bool)
+    # limit the points x edges arrays to about a million entries
+    step = max(1, 1000000//len(p1))
+    for k in range(0, len(x), step):
+        px = x[k:k+step, None]
+        py = y[k:k+step, None]
+        spans = (py > np.minimum(p1y, p2y)) & (py <= np.maximum(p1y, p2y)) & \
+                (px <= np.maximum(p1x, p2x))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            xinters = (py-p1y)*(p2x-p1x)/(p2y-p1y)+p1x
+        crossing = spans & ((p1x == p2x) | (px <= xinters))
+        inside[k:k+step] = np.count_nonzero(crossing, axis=1) % 2 == 1
+    return inside
+
+def loop_containment(cuts):
+    """For every loop list the loops whose first point lies inside it.
+
+    Candidates are narrowed down with the loop's bounding box on the first
+    points sorted by x before the exact test.
+    """
+    first = np.array([cut[0][:2] for cut in cuts], dtype=np.float64).reshape(-1, 2)
+    by_x = np.argsort(first[:, 0], kind="stable")
+    xs = first[by_x, 0]
+    LoopTree = []
+    for iloop, ipoly in enumerate(cuts):
+        poly = np.asarray(ipoly, dtype=np.float64)
+        xmin, ymin = poly.min(axis=0)
+        xmax, ymax = poly.max(axis=0)
+        lo = np.searchsorted(xs, xmin, side="left")
+        hi = np.searchsorted(xs, xmax, side="right")
+        candidates = by_x[lo:hi]
+        y = first[candidates, 1]
+        candidates = np.sort(candidates[(y > ymin) & (y <= ymax) & (candidates != iloop)])
+        inside = points_inside_polygon(first[candidates, 0], first[candidates, 1], poly)
+        LoopTree.append(candidates[inside].tolist())
+    return LoopTree
+
+def inside_first_order(LoopTree):
+    """Order loops so every loop comes after the loops inside it.
+
+    Depth first over LoopTree, starting from the loops in their current
+    order. A loop is only expanded once, so loops that lie inside each
+    other (e.g. duplicates) cannot send the search around in circles.
+    """
+    Nloops = len(LoopTree)
+    expanded = bytearray(Nloops)
+    placed = bytearray(Nloops)
+    order = []
+    for root in range(Nloops):
+        stack = [(root, None)]
+        while stack:
+            i, children = stack[-1]
+            if children is None:
+                if expanded[i]:
+                    stack.pop()
+                    if not placed[i]:
+                        placed[i] = 1
+                        order.append(i)
+                    continue
+                expanded[i] = 1
+                children = iter(LoopTree[i])
+                stack[-1] = (i, children)
+            child = next(children, None)
+            if child is not None:
+                stack.append((child, None))
+            else:
+                stack.pop()
+                if not placed[i]:
+                    placed[i] = 1
+                    order.append(i)
+    return order
 
 def mirror_rotate_vector_coords(coords, design_bounds, design_transform):
     if not design_transform.rotate and not design_transform.mirror:
@@ -590,17 +553,14 @@ def mirror_rotate_vector_coords(coords, design_bounds, design_transform):
 
     xmin = design_bounds.xmin
     xmax = design_bounds.xmax
-    coords_rotate_mirror = []
-
-    for i in range(len(coords)):
-        coords_rotate_mirror.append(coords[i][:])
-        if design_transform.mirror:
-            coords_rotate_mirror[i][0] = xmin + xmax-coords_rotate_mirror[i][0]
-
-        if design_transform.rotate:
-            x = coords_rotate_mirror[i][0]
-            y = coords_rotate_mirror[i][1]
-            coords_rotate_mirror[i][0] = -y
-            coords_rotate_mirror[i][1] = x
+    coords_rotate_mirror = EcoordArray.from_coords(coords).copy()
+    x = coords_rotate_mirror.x
+    y = coords_rotate_mirror.y
+
+    if design_transform.mirror:
+        x[:] = xmin + xmax-x
+
+    if design_transform.rotate:
+        x[:], y[:] = -y, x.copy()
 
     return coords_rotate_mirror
@@ -26,6 +26,7 @@ state = {
     "Vcut_passes": 1,
     //raster
     "ht_size": 100,
+    "ht_method": "floyd-steinberg",
     "rast_step": 100,
     "bezier_m1": 2.5,
     "bezier_m2": 0.5,
@@ -404,6 +405,7 @@ function init_UI(){
     // raster tab
     bindInput("rast_step", true);
     bindInput("ht_size", true);
+    bindInput("ht_method");
 
     bindCheckbox("engrave_up");
     bindInput("bezier_m1", true);